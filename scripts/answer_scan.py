@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+答案泄露扫描
+
+从 graders 的参数中收集答案值（keyword、expected、expected_content、正则中的
+字面量、JSON/YAML 期望值等），用 Aho–Corasick 自动机一次线性扫描 Query 和
+全部 environment 文件，报告哪个文件在哪一行包含了哪个答案。
+
+泄露分为三类:
+    query        答案直接出现在 Query 中
+    preexisting  字面答案（keyword 等）已存在于 check 检查的目标文件中，
+                 不做任何修改 check 就会通过（不变量检查除外）
+    clue         答案出现在其他环境文件中，或正则字面量 / 结构化期望值出现在
+                 目标文件中（可能是有意的线索，仅供人工确认）
+
+扫描时间与 (文本总长 + 命中数) 成正比，与答案数量无关，D7 用例或整个题库都适用。
+
+用法:
+    from answer_scan import scan_case
+    leaks = scan_case(case_data)
+
+    # 扫描整个题库
+    python3 answer_scan.py <case_file>... [--kind preexisting,query] [--json]
+"""
+import sys
+import os
+import json
+import argparse
+import re
+from bisect import bisect_left
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, List, Iterable, Iterator, Tuple
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from blob_store import env_content
+from safe_regex import analyze
+
+
+# 答案太短时命中大量无关文本（数字、单词片段），不参与扫描
+MIN_TOKEN_LEN = 3
+
+# 携带答案值的参数
+ANSWER_PARAMS = ('keyword', 'expected', 'expected_content', 'expected_substring', 'new_import')
+
+# 按子串判定的参数：目标文件中已含该值即意味着 check 直接通过
+# （new_import 不在其中：import_updated 还要求 old_import 不存在，新导入已在文件中只是线索）
+LITERAL_PARAMS = {'keyword', 'expected_content', 'expected_substring'}
+
+# pattern / regex 参数是正则的 check，只取其中的字面量
+REGEX_CHECKS = {'file_content_matches', 'file_content_match', 'file_content_regex'}
+
+# 这些 check 的参数是搜索词 / 工具参数 / 应被删除的内容，不是答案
+SKIP_PREFIXES = ('glob_', 'grep_', 'tool_')
+
+
+# ============================================================
+# Aho–Corasick 自动机
+# ============================================================
+
+class AhoCorasick:
+    """多模式串匹配自动机：构建 O(模式总长)，匹配 O(文本长 + 命中数)"""
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(index)
+
+        # BFS 计算失败指针，输出集合沿失败链合并
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """产出 (起始位置, 模式下标)"""
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in out[state]:
+                yield pos - len(patterns[index]) + 1, index
+
+
+# ============================================================
+# 答案收集
+# ============================================================
+
+def regex_literals(pattern: str) -> List[str]:
+    """提取正则任何匹配都必须包含的字面量片段（分支、可选重复内的不算；模式非法时为空）"""
+    try:
+        literals = analyze(pattern).literals
+    except re.error:
+        return []
+    return [lit for lit in literals if len(lit.strip()) >= MIN_TOKEN_LEN]
+
+
+def _scalar_values(value: Any) -> Iterator[str]:
+    """展开 expected 中的标量（JSON/YAML 期望值可能是对象或列表）"""
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _scalar_values(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _scalar_values(v)
+    elif isinstance(value, bool):
+        yield str(value).lower()
+    elif value is not None:
+        yield str(value)
+
+
+def _normalize_path(path: str) -> str:
+    for placeholder in ('{{SANDBOX}}/', '${SANDBOX}/'):
+        if path.startswith(placeholder):
+            path = path[len(placeholder):]
+    return os.path.normpath(path) if path else ''
+
+
+def collect_answer_tokens(graders: List[Dict]) -> List[Dict[str, Any]]:
+    """
+    从 graders 收集答案值
+
+    Returns:
+        [{token, check, param, target, case_insensitive}]，target 为 check 检查的文件（可能为空）
+    """
+    tokens = []
+    for grader in graders:
+        for check in grader.get('checks', []):
+            check_type = check.get('check', '')
+            if '_not_' in check_type or check_type.startswith(SKIP_PREFIXES):
+                continue
+            params = check.get('params', {}) or {}
+            target = _normalize_path(str(params.get('path', params.get('file_path', '')) or ''))
+            case_insensitive = bool(params.get('case_insensitive', False))
+
+            values = []
+            for param in ANSWER_PARAMS:
+                if param in params:
+                    values.extend((param, v) for v in _scalar_values(params[param]))
+            if check_type in REGEX_CHECKS:
+                for param in ('pattern', 'regex'):
+                    if isinstance(params.get(param), str):
+                        values.extend((param, lit) for lit in regex_literals(params[param]))
+
+            for param, value in values:
+                if len(value.strip()) < MIN_TOKEN_LEN:
+                    continue
+                tokens.append({
+                    'token': value,
+                    'check': check_type,
+                    'param': param,
+                    'target': target,
+                    'case_insensitive': case_insensitive
+                })
+    return tokens
+
+
+# ============================================================
+# 扫描
+# ============================================================
+
+def scan_texts(tokens: List[Dict[str, Any]], texts: Iterable[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """
+    用一个自动机扫描多段文本
+
+    文本和答案统一转小写匹配，大小写敏感的答案命中后再比对原文。
+
+    Args:
+        tokens: collect_answer_tokens() 的结果
+        texts: (来源名, 文本) 序列，来源名为 'query' 或环境文件路径；只遍历一次
+
+    Returns:
+        每个 (答案, 来源) 的首次命中：{token, check, source, line, column, count, kind}
+    """
+    if not tokens:
+        return []
+
+    patterns = sorted({t['token'].lower() for t in tokens})
+    pattern_index = {p: i for i, p in enumerate(patterns)}
+    by_pattern: Dict[int, List[Dict[str, Any]]] = {}
+    for token in tokens:
+        by_pattern.setdefault(pattern_index[token['token'].lower()], []).append(token)
+
+    automaton = AhoCorasick(patterns)
+    leaks: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+
+    for source, text in texts:
+        folded = text.lower()
+        # 同长度才能直接用小写文本的位置回到原文（少数字符小写后长度会变）
+        exact_text = text if len(folded) == len(text) else None
+        newlines = None
+        for start, index in automaton.iter_matches(folded):
+            for token in by_pattern[index]:
+                value = token['token']
+                if not token['case_insensitive']:
+                    if exact_text is None:
+                        if value not in text:
+                            continue
+                    elif exact_text[start:start + len(value)] != value:
+                        continue
+
+                key = (value, token['check'], source)
+                leak = leaks.get(key)
+                if leak is not None:
+                    leak['count'] += 1
+                    continue
+
+                if newlines is None:
+                    newlines = [i for i, c in enumerate(text) if c == '\n']
+                line = bisect_left(newlines, start) + 1
+                if source == 'query':
+                    kind = 'query'
+                elif token['param'] in LITERAL_PARAMS and token['target'] == source:
+                    kind = 'preexisting'
+                else:
+                    kind = 'clue'
+                leaks[key] = {
+                    'token': value,
+                    'check': token['check'],
+                    'param': token['param'],
+                    'source': source,
+                    'line': line,
+                    'column': start - (newlines[line - 2] if line > 1 else -1),
+                    'count': 1,
+                    'kind': kind
+                }
+
+    return list(leaks.values())
+
+
+def scan_case(case_data: dict) -> List[Dict[str, Any]]:
+    """扫描一个 case 的 Query 和全部 environment 文件（逐个读取，延迟加载的内容不会同时驻留）"""
+    def texts():
+        yield 'query', case_data.get('task', {}).get('desc', '')
+        for env_file in case_data.get('environment', []):
+            path = env_file.get('path', '')
+            if path:
+                yield os.path.normpath(path), env_content(env_file)
+
+    return scan_texts(collect_answer_tokens(case_data.get('graders', [])), texts())
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='答案泄露扫描')
+    parser.add_argument('case_files', nargs='+', help='测试用例 JSON 文件')
+    parser.add_argument('--kind', default='query,preexisting',
+                        help='报告的泄露类型，逗号分隔（query,preexisting,clue；默认: query,preexisting）')
+    parser.add_argument('--json', action='store_true', help='以 JSON Lines 输出')
+
+    args = parser.parse_args()
+    kinds = set(args.kind.split(','))
+
+    flagged = 0
+    for case_file in args.case_files:
+        with open(case_file, 'r', encoding='utf-8') as f:
+            case_data = json.load(f)
+        case_id = case_data.get('task', {}).get('id', Path(case_file).stem)
+        leaks = [leak for leak in scan_case(case_data) if leak['kind'] in kinds]
+        if not leaks:
+            continue
+        flagged += 1
+
+        if args.json:
+            for leak in leaks:
+                print(json.dumps({'case_id': case_id, **leak}, ensure_ascii=False))
+            continue
+        print(f"{case_id} ({case_file})")
+        for leak in leaks:
+            print(f"  [{leak['kind']}] {leak['source']}:{leak['line']}:{leak['column']} "
+                  f"'{leak['token'][:40]}' ({leak['check']}.{leak['param']}, x{leak['count']})")
+
+    if not args.json:
+        print(f"\n{flagged}/{len(args.case_files)} cases with leaks")
+    sys.exit(1 if flagged else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""
+批量 rollout 评分
+
+RL 每一步要给成千上万条 rollout 打分，verify_graders 一次只评一对（沙箱, 轨迹）。
+其中一部分 check 只看轨迹、不碰沙箱：
+
+    tool_used / tool_called / glob_executed / glob_used /
+    tool_used_webfetch / tool_used_web_search，以及 tool_calls grader 的每条要求
+
+本模块把整批轨迹展平成列（每步 1 字节的工具名字典编码 + 每条 rollout 的行区间），
+轨迹 check 按 (check, params) 去重后对整批一次求值：工具名条件对每个不同的工具名只算一次，
+得到的掩码用 bytes.find 在各 rollout 的区间内定位候选步，参数条件（pattern / url / 关键词 /
+tool_calls 参数规范）只在候选步上算。
+其余 check 与沙箱相关，按 rollout 分组交给线程池，逐项调用 grading.run_check。
+
+每条 rollout 的 GraderResult 与单独调用 verify_graders 一致（通过与否、message、
+tool_calls_details）；轨迹 check 的 duration_ms 是整批求值耗时的均摊。
+新增或修改轨迹 check 时，PROBES 中的对应实现要同步修改。
+
+奖励:
+    binary     通过 1.0，否则 0.0（同 GraderResult.passed）
+    fraction   (通过的 check + 满足的 tool_calls 要求) / 总数
+
+使用方式:
+    from batch_grading import Rollout, grade_rollouts
+    batch = grade_rollouts([Rollout(case_data, trajectory, sandbox_dir), ...], workers=8)
+    batch.rewards       # array('d')，与输入顺序一致
+    batch.results[i]    # 第 i 条的 GraderResult
+
+命令行（rollout 来源同 trajectory_archive.py，另支持 .ctraj；元数据中的 sandbox_dir 指定沙箱，
+没有沙箱的 rollout 上沙箱相关 check 记为未通过）:
+    python3 batch_grading.py <case_file> <rollouts>... [--reward binary|fraction] [--workers 8] [-o rewards.json]
+"""
+import sys
+import json
+import time
+import hashlib
+import inspect
+import argparse
+from array import array
+from collections import defaultdict
+from itertools import accumulate
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 添加 scripts 目录到路径
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from check_registry import FINGERPRINT_LEN
+from custom_checks import CHECK_REGISTRY
+from doc_query import document_cache
+from grading import CheckResult, GraderResult, match_step_params, run_check
+
+REWARD_MODES = ('binary', 'fraction')
+
+
+# ============================================================
+# 轨迹 check 的批量实现
+# ============================================================
+
+class _Probe:
+    """
+    一个轨迹 check 在整批上的求值方式
+
+    与 custom_checks 中逐条实现的语义一致：按步顺序找第一个满足条件的步；
+    条件抛异常时该 rollout 判为 "Check error"（与逐条执行时在该步出错相同）。
+
+    Args:
+        tool_filter: 工具名条件，每个不同的工具名只调用一次
+        predicate: 步级条件（传入原 step dict），None 表示工具名满足即可
+        on_empty: 轨迹为空时的 (passed, message)
+        passed: 命中时的 message（传入命中步的工具名）
+        failed: 未命中时的 message
+        missing_tool: 步中没有 'tool' 键时逐条实现看到的工具名（step.get('tool') 为 None，
+                      step.get('tool', '') 为 ''）
+    """
+
+    def __init__(self, tool_filter: Callable[[Any], bool], predicate: Optional[Callable[[dict], bool]],
+                 on_empty: Tuple[bool, str], passed: Callable[[Any], str], failed: str,
+                 missing_tool: Any = None):
+        self.tool_filter = tool_filter
+        self.predicate = predicate
+        self.on_empty = on_empty
+        self.passed = passed
+        self.failed = failed
+        self.missing_tool = missing_tool
+
+
+def _probe_tool_used(params: dict) -> _Probe:
+    tool_name = params.get('tool', params.get('tool_name', ''))
+    return _Probe(lambda tool: tool == tool_name, None,
+                  (True, "tool_used check skipped (no trajectory)"),
+                  lambda tool: f"tool '{tool_name}' was used", f"tool '{tool_name}' was not used")
+
+
+def _probe_glob_executed(params: dict) -> _Probe:
+    pattern_contains = params.get('pattern_contains', '')
+
+    def predicate(step: dict) -> bool:
+        tool_input = step.get('input', {})
+        return isinstance(tool_input, dict) and pattern_contains in tool_input.get('pattern', '')
+
+    return _Probe(lambda tool: tool == 'Glob', predicate,
+                  (True, "glob execution check skipped (no trajectory)"),
+                  lambda tool: f"Glob executed with pattern containing '{pattern_contains}'",
+                  f"Glob with pattern '{pattern_contains}' not found in trajectory")
+
+
+def _probe_glob_used(params: dict) -> _Probe:
+    return _Probe(lambda tool: tool == 'Glob', None,
+                  (True, "glob_used check skipped (no trajectory)"),
+                  lambda tool: "Glob tool was used", "Glob tool was not used")
+
+
+def _probe_tool_used_webfetch(params: dict) -> _Probe:
+    url_pattern = params.get('url_pattern', '')
+    predicate = None
+    if url_pattern:
+        def predicate(step: dict) -> bool:
+            return url_pattern in step.get('input', {}).get('url', '')
+
+    return _Probe(lambda tool: tool == 'WebFetch', predicate,
+                  (False, "no trajectory provided"),
+                  lambda tool: (f"WebFetch used with URL containing '{url_pattern}'" if url_pattern
+                                else "WebFetch was used"),
+                  f"WebFetch not used with URL pattern '{url_pattern}'" if url_pattern
+                  else "WebFetch tool not used", missing_tool='')
+
+
+def _probe_tool_used_web_search(params: dict) -> _Probe:
+    keyword_pattern = params.get('keyword_pattern', '')
+    predicate = None
+    if keyword_pattern:
+        def predicate(step: dict) -> bool:
+            input_data = step.get('input', {})
+            search_text = ' '.join(input_data.get('query_list', [])) + ' ' + input_data.get('query', '')
+            return keyword_pattern.lower() in search_text.lower()
+
+    def tool_filter(tool) -> bool:
+        # MCP 工具格式：mcp__baidu-server__web_search；显式的 "tool": null 与逐条实现一样报错
+        return 'web_search' in tool or tool == 'WebSearch'
+
+    return _Probe(tool_filter, predicate,
+                  (False, "no trajectory provided"),
+                  lambda tool: (f"web_search used with keyword '{keyword_pattern}'" if keyword_pattern
+                                else f"{tool} was used"),
+                  f"web_search not used with keyword '{keyword_pattern}'" if keyword_pattern
+                  else "web_search tool not used", missing_tool='')
+
+
+# 只依赖轨迹的 check（均为 custom_checks 内置，插件不能覆盖）
+PROBES: Dict[str, Callable[[dict], _Probe]] = {
+    'tool_used': _probe_tool_used,
+    'tool_called': _probe_tool_used,
+    'glob_executed': _probe_glob_executed,
+    'glob_used': _probe_glob_used,
+    'tool_used_webfetch': _probe_tool_used_webfetch,
+    'tool_used_web_search': _probe_tool_used_web_search,
+}
+
+
+def probe_fingerprint(check_type: str) -> str:
+    """轨迹 check 批量实现的指纹：custom_checks 中的实现 + PROBES 中的对应实现和求值代码"""
+    h = hashlib.sha256(CHECK_REGISTRY.fingerprint(check_type).encode('utf-8'))
+    for obj in (PROBES[check_type], _Probe, TrajectoryColumns.evaluate):
+        h.update(inspect.getsource(obj).encode('utf-8'))
+    return h.hexdigest()[:FINGERPRINT_LEN]
+
+
+def is_trajectory_only(check: dict) -> bool:
+    """state_check 项是否只依赖轨迹（可批量求值）；其余 check 需要沙箱"""
+    return check.get('check', '') in PROBES
+
+
+def _requirement_probe(requirement: dict) -> _Probe:
+    """tool_calls grader 的一条要求"""
+    tool_name = requirement.get('tool', '')
+    params_spec = requirement.get('params', {})
+    predicate = None
+    if params_spec:
+        def predicate(step: dict) -> bool:
+            step_input = step.get('input', {})
+            return isinstance(step_input, dict) and match_step_params(step_input, params_spec)
+
+    return _Probe(lambda tool: tool == tool_name, predicate, (False, ''), lambda tool: '', '')
+
+
+# ============================================================
+# 列式求值
+# ============================================================
+
+# 步中没有 'tool' 键（与显式的 null 区分）
+_NO_TOOL = object()
+
+
+class TrajectoryColumns:
+    """
+    一批轨迹展平后的列
+
+    tool_codes[row] 是第 row 步的工具名在 tools 中的下标（工具种类不超过 256 时是 bytes，
+    每步 1 字节），第 i 条 rollout 占 offsets[i]:offsets[i + 1] 行；step dict 不复制。
+    """
+
+    def __init__(self, trajectories: List[List[Dict]]):
+        self.trajectories = trajectories
+        self.offsets = array('Q', accumulate(map(len, trajectories), initial=0))
+        tool_values = [step.get('tool', _NO_TOOL) for trajectory in trajectories for step in trajectory]
+        self.tools: List[Any] = list(dict.fromkeys(tool_values))
+        codes = {tool: code for code, tool in enumerate(self.tools)}
+        if len(self.tools) <= 256:
+            self.tool_codes = bytes(map(codes.__getitem__, tool_values))
+        else:
+            self.tool_codes = array('I', map(codes.__getitem__, tool_values))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def total_steps(self) -> int:
+        return self.offsets[-1]
+
+    def tool_mask(self, flags: List[int]) -> bytes:
+        """每行一字节：该行工具名的 flags 值"""
+        if isinstance(self.tool_codes, bytes):
+            return self.tool_codes.translate(bytes(flags + [0] * (256 - len(flags))))
+        return bytes(map(flags.__getitem__, self.tool_codes))
+
+    def evaluate(self, probe: _Probe, members: List[int]) -> List[Optional[Tuple[bool, str, Optional[dict]]]]:
+        """
+        对 members 中的 rollout 求值
+
+        Returns:
+            按 rollout 下标排列的 (passed, message, 命中的 step)；不在 members 中的为 None
+        """
+        # 工具名条件按字典求值，展开成每行一字节的掩码；出错的工具名上每一行都是错误行
+        flags = [0] * len(self.tools)
+        tool_errors: Dict[int, Exception] = {}
+        tools = [probe.missing_tool if tool is _NO_TOOL else tool for tool in self.tools]
+        for code, tool in enumerate(tools):
+            try:
+                flags[code] = 1 if probe.tool_filter(tool) else 0
+            except Exception as e:
+                tool_errors[code] = e
+                flags[code] = 1
+        find = self.tool_mask(flags).find if any(flags) else None
+
+        offsets, tool_codes, predicate = self.offsets, self.tool_codes, probe.predicate
+        empty = probe.on_empty + (None,)
+        failed = (False, probe.failed, None)
+        passed_by_code: Dict[int, str] = {}
+        outcome: List[Optional[Tuple[bool, str, Optional[dict]]]] = [None] * len(self)
+        for index in members:
+            start, end = offsets[index], offsets[index + 1]
+            if start == end:
+                outcome[index] = empty
+                continue
+            result = failed
+            row = find(1, start, end) if find is not None else -1
+            while row != -1:
+                code = tool_codes[row]
+                if tool_errors and code in tool_errors:
+                    result = (False, f"Check error: {tool_errors[code]}", None)
+                    break
+                step = self.trajectories[index][row - start]
+                if predicate is not None:
+                    try:
+                        matched = predicate(step)
+                    except Exception as e:
+                        result = (False, f"Check error: {e}", None)
+                        break
+                    if not matched:
+                        row = find(1, row + 1, end)
+                        continue
+                message = passed_by_code.get(code)
+                if message is None:
+                    message = passed_by_code[code] = probe.passed(tools[code])
+                result = (True, message, step)
+                break
+            outcome[index] = result
+        return outcome
+
+
+# ============================================================
+# 批量评分
+# ============================================================
+
+class Rollout:
+    """一条待评分的 rollout：case、轨迹和（可选）最终沙箱目录"""
+
+    def __init__(self, case_data: dict, trajectory: List[Dict], sandbox_dir: Optional[Path] = None):
+        self.case_data = case_data
+        self.trajectory = trajectory
+        self.sandbox_dir = Path(sandbox_dir) if sandbox_dir is not None else None
+
+
+class BatchGradeResult:
+    """整批评分结果，各字段与输入的 rollout 一一对应"""
+
+    def __init__(self, results: List[GraderResult], rewards: array, stats: Dict[str, Any]):
+        self.results = results
+        self.rewards = rewards
+        self.passed = [result.passed for result in results]
+        self.stats = stats
+
+
+class _CasePlan:
+    """
+    一个 case 的 grader 拆分结果（同一 case 的 rollout 共用）
+
+    graders: [('state_check', [(check 名, description, 轨迹 check 的键或 None)]),
+              ('tool_calls', [(tool, description, params_spec, 键)])]
+    keys: 用到的轨迹 check 键（去重）
+    sandbox_groups: 每个 state_check grader 中与沙箱相关的 check
+    """
+
+    def __init__(self, case_data: dict, probes: Dict[str, _Probe]):
+        self.graders: List[Tuple[str, List[tuple]]] = []
+        self.sandbox_groups: List[List[dict]] = []
+        keys: Dict[str, None] = {}
+        for grader in case_data.get('graders', []):
+            grader_type = grader.get('type', '')
+            if grader_type == 'state_check':
+                entries, bound = [], []
+                for check in grader.get('checks', []):
+                    check_type = check.get('check', '')
+                    key = None
+                    if is_trajectory_only(check):
+                        key = self._key(check_type, check.get('params', {}))
+                        if key not in probes:
+                            probes[key] = PROBES[check_type](check.get('params', {}))
+                        keys[key] = None
+                    else:
+                        bound.append(check)
+                    entries.append((check_type, check.get('description', ''), key))
+                self.graders.append((grader_type, entries))
+                self.sandbox_groups.append(bound)
+            elif grader_type == 'tool_calls':
+                entries = []
+                for requirement in grader.get('required', []):
+                    tool, params_spec = requirement.get('tool', ''), requirement.get('params', {})
+                    key = self._key('tool_calls', [tool, params_spec])
+                    if key not in probes:
+                        probes[key] = _requirement_probe(requirement)
+                    keys[key] = None
+                    entries.append((tool, requirement.get('description', ''), params_spec or None, key))
+                self.graders.append((grader_type, entries))
+        self.keys = list(keys)
+        if not any(self.sandbox_groups):
+            self.sandbox_groups = []
+
+    @staticmethod
+    def _key(kind: str, payload: Any) -> str:
+        return kind + '\0' + json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _grade_sandbox(rollout: Rollout, groups: List[List[dict]]) -> List[CheckResult]:
+    """在一个沙箱上依次执行各 state_check grader 中与沙箱相关的 check"""
+    results: List[CheckResult] = []
+    if rollout.sandbox_dir is None:
+        for checks in groups:
+            results.extend(CheckResult(check.get('check', ''), False, "no sandbox for this rollout",
+                                       check.get('description', '')) for check in checks)
+        return results
+    with document_cache():
+        for checks in groups:
+            CHECK_REGISTRY.prefetch(checks, rollout.sandbox_dir)
+            results.extend(run_check(check, rollout.sandbox_dir, rollout.trajectory) for check in checks)
+    return results
+
+
+def _reward(result: GraderResult, mode: str) -> float:
+    if mode == 'binary':
+        return 1.0 if result.passed else 0.0
+    total = result.total_checks + len(result.tool_calls_details)
+    if total == 0:
+        return 1.0 if result.passed else 0.0
+    verified = sum(1 for detail in result.tool_calls_details if detail['verified'])
+    return (result.passed_checks + verified) / total
+
+
+def grade_rollouts(rollouts: List[Rollout], workers: int = 4, reward: str = 'binary') -> BatchGradeResult:
+    """
+    批量评分
+
+    Args:
+        rollouts: 待评分的 rollout（可以来自不同 case；同一 case 对象只拆分一次）
+        workers: 沙箱相关 check 的线程数（1 时在当前线程执行）
+        reward: 奖励计算方式，binary 或 fraction
+
+    Returns:
+        BatchGradeResult
+    """
+    if reward not in REWARD_MODES:
+        raise ValueError(f"unknown reward mode: {reward}")
+    start_time = time.perf_counter()
+
+    # 分类：轨迹 check 按 (check, params) 去重，记下用到它的 rollout
+    probes: Dict[str, _Probe] = {}
+    plans: Dict[int, _CasePlan] = {}
+    rollout_plans: List[_CasePlan] = []
+    members: Dict[str, List[int]] = defaultdict(list)
+    for index, rollout in enumerate(rollouts):
+        plan = plans.get(id(rollout.case_data))
+        if plan is None:
+            plan = plans[id(rollout.case_data)] = _CasePlan(rollout.case_data, probes)
+        rollout_plans.append(plan)
+        for key in plan.keys:
+            members[key].append(index)
+    sandbox_indices = [index for index, plan in enumerate(rollout_plans) if plan.sandbox_groups]
+
+    # 沙箱相关 check 先交给线程池，与轨迹 check 的列式求值并行
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 and sandbox_indices else None
+    try:
+        if pool is not None:
+            futures = {index: pool.submit(_grade_sandbox, rollouts[index], rollout_plans[index].sandbox_groups)
+                       for index in sandbox_indices}
+
+        columns_start = time.perf_counter()
+        columns = TrajectoryColumns([rollout.trajectory for rollout in rollouts])
+        outcomes: Dict[str, List[Optional[Tuple[bool, str, Optional[dict]]]]] = {}
+        per_rollout_ms: Dict[str, float] = {}
+        for key, probe in probes.items():
+            probe_start = time.perf_counter()
+            outcomes[key] = columns.evaluate(probe, members[key])
+            per_rollout_ms[key] = (time.perf_counter() - probe_start) * 1000 / len(members[key])
+        trajectory_sec = time.perf_counter() - columns_start
+
+        if pool is not None:
+            sandbox_results = {index: future.result() for index, future in futures.items()}
+        else:
+            sandbox_results = {index: _grade_sandbox(rollouts[index], rollout_plans[index].sandbox_groups)
+                               for index in sandbox_indices}
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # 按 case 中的顺序拼回每条 rollout 的 GraderResult
+    fingerprints = {name: probe_fingerprint(name) for name in PROBES}
+    results: List[GraderResult] = []
+    for index, plan in enumerate(rollout_plans):
+        result = GraderResult()
+        bound_results = iter(sandbox_results.get(index, []))
+        for grader_type, entries in plan.graders:
+            if grader_type == 'state_check':
+                for check_type, description, key in entries:
+                    if key is None:
+                        check_result = next(bound_results)
+                    else:
+                        passed, message, _ = outcomes[key][index]
+                        check_result = CheckResult(check_type, passed, message, description,
+                                                   per_rollout_ms[key], fingerprints[check_type])
+                    result.total_checks += 1
+                    if check_result.passed:
+                        result.passed_checks += 1
+                    else:
+                        result.failed_checks += 1
+                    result.results.append(check_result)
+            else:
+                all_verified = True
+                for tool, description, params_spec, key in entries:
+                    verified, _, matched_step = outcomes[key][index]
+                    if not verified:
+                        all_verified = False
+                    result.tool_calls_details.append({
+                        'tool': tool,
+                        'description': description,
+                        'verified': verified,
+                        'params_spec': params_spec,
+                        'matched_step': matched_step.get('step') if matched_step is not None else None
+                    })
+                result.tool_calls_verified = all_verified
+        result.passed = (result.failed_checks == 0) and result.tool_calls_verified
+        results.append(result)
+
+    rewards = array('d', (_reward(result, reward) for result in results))
+    stats = {
+        'rollouts': len(rollouts),
+        'steps': columns.total_steps,
+        'cases': len(plans),
+        'trajectory_probes': len(probes),
+        'sandbox_rollouts': len(sandbox_indices),
+        'trajectory_sec': round(trajectory_sec, 3),
+        'total_sec': round(time.perf_counter() - start_time, 3),
+    }
+    return BatchGradeResult(results, rewards, stats)
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def _load_rollouts(case_data: dict, sources: List[str]) -> Tuple[List[Rollout], List[Dict[str, Any]]]:
+    """从结果文件 / 目录 / JSONL / 结果库 / .ctraj 读取 rollout（元数据中的 run_vars 用于渲染 case）"""
+    from run_vars import RunVars
+    from trajectory_archive import TrajectoryArchive, iter_source
+
+    records = []
+    for source in sources:
+        path = Path(source)
+        if path.suffix == '.ctraj':
+            with TrajectoryArchive(path) as archive:
+                records.extend((trajectory, meta) for meta, trajectory in archive)
+        else:
+            records.extend(iter_source(path))
+
+    rollouts, metas = [], []
+    for trajectory, meta in records:
+        run_case = RunVars(meta['run_vars']).render(case_data) if meta.get('run_vars') else case_data
+        rollouts.append(Rollout(run_case, trajectory, meta.get('sandbox_dir')))
+        metas.append(meta)
+    return rollouts, metas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量 rollout 评分（轨迹 check 列式求值，沙箱 check 线程池执行）')
+    parser.add_argument('case_file', help='测试用例 JSON 文件路径')
+    parser.add_argument('rollouts', nargs='+',
+                        help='phase*_result.json、目录、.jsonl、results_store 的 .db 或 .ctraj')
+    parser.add_argument('--reward', choices=REWARD_MODES, default='binary', help='奖励计算方式（默认: binary）')
+    parser.add_argument('--workers', type=int, default=4, help='沙箱相关 check 的线程数（默认: 4）')
+    parser.add_argument('-o', '--output', help='写出 {"rewards", "passed", "meta", "stats"} JSON')
+    parser.add_argument('-v', '--verbose', action='store_true', help='打印每条 rollout 未通过的 check')
+
+    args = parser.parse_args()
+
+    with open(args.case_file, 'r', encoding='utf-8') as f:
+        case_data = json.load(f)
+    rollouts, metas = _load_rollouts(case_data, args.rollouts)
+    batch = grade_rollouts(rollouts, workers=args.workers, reward=args.reward)
+
+    stats = batch.stats
+    print(f"Graded {stats['rollouts']} rollouts ({stats['steps']} steps) in {stats['total_sec']:.2f}s: "
+          f"{sum(batch.passed)} passed, mean reward {sum(batch.rewards) / max(1, len(batch.rewards)):.3f}")
+    print(f"  {stats['trajectory_probes']} distinct trajectory checks in {stats['trajectory_sec']:.3f}s, "
+          f"{stats['sandbox_rollouts']} rollouts with sandbox checks")
+    if args.verbose:
+        for index, result in enumerate(batch.results):
+            failed = [r.check_type for r in result.results if not r.passed]
+            failed += [f"tool_calls:{d['tool']}" for d in result.tool_calls_details if not d['verified']]
+            if failed:
+                print(f"  {index:>6}  {batch.rewards[index]:.3f}  {', '.join(failed)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'rewards': list(batch.rewards), 'passed': batch.passed, 'meta': metas, 'stats': stats},
+                      f, indent=2, ensure_ascii=False)
+        print(f"Rewards saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+environment 文件内容的内容寻址存储
+
+题库里大量 case 内联了相同的样板文件（package.json、Dockerfile、公共库、
+.bak 干扰文件）。environment 条目可以用 blob 引用代替内联 content：
+
+    {"path": "package.json", "content": "..."}              # 内联
+    {"path": "package.json", "blob": "sha256:<hex>"}        # 引用
+
+blob 按 sha256 存放在本地目录（默认 ~/.cache/agent-testcase/blobs，可用
+环境变量 CASE_BLOB_STORE 或 --store 指定），内容不压缩，相同内容只存一份。
+构建模板目录时直接硬链接到 blob 文件；会被改写的沙箱和需要改权限位的
+可执行文件仍然复制。
+
+用法:
+    # 把内联内容移入存储（原地改写 case.json）
+    python3 blob_store.py pack <case_file>... [--min-size 256] [--store <dir>]
+    # 恢复为内联内容
+    python3 blob_store.py unpack <case_file>... [--store <dir>]
+    # 存储统计
+    python3 blob_store.py stats [--store <dir>]
+
+代码中:
+    from blob_store import env_content
+    text = env_content(file_info)     # 内联 / 引用两种形式都适用
+"""
+import os
+import json
+import argparse
+import hashlib
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from run_vars import PLACEHOLDER
+
+BLOB_PREFIX = 'sha256:'
+DEFAULT_STORE = Path.home() / '.cache' / 'agent-testcase' / 'blobs'
+
+
+class BlobStore:
+    """按 sha256 寻址的文件目录"""
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or os.environ.get('CASE_BLOB_STORE') or DEFAULT_STORE)
+
+    def path(self, digest: str) -> Path:
+        digest = digest[len(BLOB_PREFIX):] if digest.startswith(BLOB_PREFIX) else digest
+        return self.root / digest[:2] / digest
+
+    def put(self, data: bytes) -> str:
+        """写入内容，返回 "sha256:<hex>" 引用"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=str(path.parent))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        return BLOB_PREFIX + digest
+
+    def get(self, ref: str) -> bytes:
+        try:
+            return self.path(ref).read_bytes()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"blob not found in {self.root}: {ref}") from None
+
+    def materialize(self, ref: str, target: Path, link: bool = False) -> None:
+        """
+        把 blob 放到 target
+
+        Args:
+            ref: blob 引用
+            target: 目标文件路径
+            link: 硬链接到 blob 文件（仅用于不会被原地改写的目录，如模板）；
+                  跨文件系统时退回复制
+        """
+        source = self.path(ref)
+        if not source.exists():
+            raise FileNotFoundError(f"blob not found in {self.root}: {ref}")
+        if target.exists() or target.is_symlink():
+            target.unlink()
+        if link:
+            try:
+                os.link(source, target)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(source, target)
+
+
+_default_store: Optional[BlobStore] = None
+
+
+def default_store() -> BlobStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = BlobStore()
+    return _default_store
+
+
+def env_content(file_info: Dict[str, Any], store: Optional[BlobStore] = None) -> str:
+    """environment 条目的文本内容（blob 引用从存储读取，case_reader 的延迟内容按需读取）"""
+    if 'blob' in file_info:
+        return (store or default_store()).get(file_info['blob']).decode('utf-8')
+    content = file_info.get('content', '')
+    return content if isinstance(content, str) else content.read()
+
+
+def env_size(file_info: Dict[str, Any], store: Optional[BlobStore] = None) -> int:
+    """environment 条目内容的近似字节数（不读取内容）"""
+    if 'blob' in file_info:
+        return (store or default_store()).path(file_info['blob']).stat().st_size
+    content = file_info.get('content', '')
+    return len(content) if isinstance(content, str) else content.raw_size
+
+
+def env_digest(file_info: Dict[str, Any], store: Optional[BlobStore] = None) -> str:
+    """environment 条目内容的 sha256（blob 引用无需读取内容）"""
+    if 'blob' in file_info:
+        ref = file_info['blob']
+        return ref[len(BLOB_PREFIX):] if ref.startswith(BLOB_PREFIX) else ref
+    return hashlib.sha256(env_content(file_info, store).encode('utf-8')).hexdigest()
+
+
+# ============================================================
+# pack / unpack
+# ============================================================
+
+def pack_case(case_data: dict, store: BlobStore, min_size: int = 0) -> int:
+    """把内联 content 移入存储，返回转换的条目数（含按运行占位符的内容保持内联，运行时要替换）"""
+    packed = 0
+    for file_info in case_data.get('environment', []):
+        if 'content' not in file_info or PLACEHOLDER.search(file_info['content']):
+            continue
+        data = file_info['content'].encode('utf-8')
+        if len(data) < min_size:
+            continue
+        file_info['blob'] = store.put(data)
+        del file_info['content']
+        packed += 1
+    return packed
+
+
+def unpack_case(case_data: dict, store: BlobStore) -> int:
+    """把 blob 引用恢复为内联 content，返回转换的条目数"""
+    unpacked = 0
+    for file_info in case_data.get('environment', []):
+        if 'blob' not in file_info:
+            continue
+        file_info['content'] = store.get(file_info.pop('blob')).decode('utf-8')
+        unpacked += 1
+    return unpacked
+
+
+def _rewrite(case_file: str, case_data: dict) -> None:
+    path = Path(case_file)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(case_data, f, indent=2, ensure_ascii=False)
+    shutil.copymode(path, tmp)
+    os.replace(tmp, path)
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='environment 内容寻址存储')
+    parser.add_argument('--store', help='存储目录（默认: $CASE_BLOB_STORE 或 ~/.cache/agent-testcase/blobs）')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_pack = sub.add_parser('pack', help='把内联 content 移入存储')
+    p_pack.add_argument('case_files', nargs='+')
+    p_pack.add_argument('--min-size', type=int, default=256, help='小于该字节数的内容保持内联（默认: 256）')
+
+    p_unpack = sub.add_parser('unpack', help='把 blob 引用恢复为内联 content')
+    p_unpack.add_argument('case_files', nargs='+')
+
+    sub.add_parser('stats', help='存储统计')
+
+    args = parser.parse_args()
+    store = BlobStore(Path(args.store) if args.store else None)
+
+    if args.command in ('pack', 'unpack'):
+        total = 0
+        before = after = 0
+        for case_file in args.case_files:
+            before += os.path.getsize(case_file)
+            with open(case_file, 'r', encoding='utf-8') as f:
+                case_data = json.load(f)
+            if args.command == 'pack':
+                changed = pack_case(case_data, store, args.min_size)
+            else:
+                changed = unpack_case(case_data, store)
+            if changed:
+                _rewrite(case_file, case_data)
+            after += os.path.getsize(case_file)
+            total += changed
+        print(f"{args.command}: {total} entries in {len(args.case_files)} cases, "
+              f"{before / 1024:.1f} KB -> {after / 1024:.1f} KB (store: {store.root})")
+
+    elif args.command == 'stats':
+        blobs = [p for p in store.root.glob('[0-9a-f][0-9a-f]/*') if p.is_file()]
+        size = sum(p.stat().st_size for p in blobs)
+        linked = sum(p.stat().st_nlink - 1 for p in blobs)
+        print(f"Store: {store.root}")
+        print(f"  Blobs: {len(blobs)}  Size: {size / 1024:.1f} KB  Hardlinks in use: {linked}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+多模型难度校准
+
+phase6 只用 Haiku 跑一次，判断一道题是否真在 D5 还要看更强的模型能不能做出来。
+本脚本对每个 case 只准备一次沙箱模板，再为"模型 × 重复次数"复制出独立沙箱，
+所有 case 的运行放在同一个线程池里并发执行，最后得到每个 case 的通过率矩阵，
+并与 task.difficulty 标注对照。
+
+模板准备:
+    init_commands 不启动后台进程时，模板包含 environment 和执行完 init_commands 的状态（预热模板），
+    每个沙箱直接复制；会启动进程时模板只含 environment，每个沙箱单独执行 init_commands。
+
+判定（模型按 --models 顺序由弱到强，通过率 >= --solve-threshold 视为能解出）:
+    consistent          与标注一致：D5 及以下最弱模型能解出；D6 及以上最弱模型解不出、更强的模型能解出
+    harder_than_label   标注 D5 及以下，但只有更强的模型能解出
+    easier_than_label   标注 D6 及以上，但最弱模型就能解出
+    unsolved            所有模型都解不出（题目过难或 grader 有问题）
+    error               运行本身出错（沙箱准备、CLI 启动等抛出异常），无法判断：没有模型能解出且有
+                        出错的运行，或比解出者更弱的模型没有一次完成的运行
+
+用法:
+    python3 calibrate.py <case_file_or_dir>... [--models haiku,sonnet,opus] [--runs 3]
+                         [--parallel 4] [--solve-threshold 0.5] [--claude-bin <cmd>] [--store <db>]
+
+输出:
+    calibration_result.json（每个 case 的通过率矩阵和判定，以及按难度汇总的通过率）
+"""
+import sys
+import os
+import json
+import shutil
+import argparse
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+# 添加 scripts 目录到路径
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from grading import verify_graders
+from sandbox import (apply_run_vars, build_template, clone_template, init_spawns_processes, run_init_commands,
+                     setup_sandbox)
+from isolation import sandbox_namespace
+from run_vars import RunVars, placeholders
+import phase6_haiku
+
+
+DEFAULT_MODELS = ('haiku', 'sonnet', 'opus')
+DEFAULT_SOLVE_THRESHOLD = 0.5
+# D6 起最弱模型（Haiku）失败属于预期（见 difficulty/D6.md）
+WEAKEST_MAX_DIFFICULTY = 5
+
+
+# ============================================================
+# 共享模板
+# ============================================================
+
+class CaseBench:
+    """一个 case 的共享模板：第一次取用时构建，最后一次运行结束后删除"""
+
+    def __init__(self, case_data: dict, case_file: Path, runs_dir: Path, jobs: int):
+        self.case_data = case_data
+        self.case_file = str(case_file)
+        self.case_id = case_data.get('task', {}).get('id', 'unknown')
+        # task.id 可能重复或缺失，运行目录和结果都按 id + 文件路径哈希区分
+        path_hash = hashlib.sha1(str(Path(case_file).resolve()).encode('utf-8')).hexdigest()[:8]
+        self.key = f"{self.case_id}_{path_hash}"
+        self.runs_dir = runs_dir / self.key
+        self.template_dir = self.runs_dir / '.template'
+        # 按运行占位符出现在 environment / init_commands 中时，初始化结果因运行而异，不能共享
+        self.warm = not init_spawns_processes(case_data) and not placeholders(
+            [case_data.get('environment', []), case_data.get('init_commands', [])])
+        self._remaining = jobs
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def checkout(self, sandbox_dir: Path, run_vars: RunVars) -> None:
+        with self._lock:
+            if not self._ready:
+                if self.warm:
+                    # 模板会被 init_commands 原地改写，不能硬链接 blob 存储，直接完整构建
+                    setup_sandbox(self.case_data, self.template_dir)
+                else:
+                    build_template(self.case_data, self.template_dir)
+                self._ready = True
+        clone_template(self.template_dir, sandbox_dir)
+        if not self.warm:
+            apply_run_vars(self.case_data, run_vars, sandbox_dir)
+            run_init_commands(run_vars.render(self.case_data), sandbox_dir)
+
+    def release(self, keep: bool) -> None:
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining == 0 and not keep:
+                shutil.rmtree(self.runs_dir, ignore_errors=True)
+
+
+def run_one(bench: CaseBench, model: str, index: int, args) -> Dict[str, Any]:
+    """在独立沙箱中用 model 跑一次，返回 phase6 结果字典（附 run_index）"""
+    sandbox_dir = bench.runs_dir / f"{model}_{index:02d}"
+    try:
+        with RunVars.allocate(bench.case_data) as run_vars, \
+                sandbox_namespace(sandbox_dir, enabled=args.isolate, egress=True):
+            run_case = run_vars.render(bench.case_data)
+            bench.checkout(sandbox_dir, run_vars)
+            query = run_case.get('task', {}).get('desc', '')
+            haiku_result = phase6_haiku.run_haiku_cli(query, sandbox_dir, args.timeout, args.claude_bin, model)
+            result = verify_graders(run_case, sandbox_dir, haiku_result.get('trajectory', []))
+        if run_vars.values:
+            haiku_result['run_vars'] = run_vars.values
+        output_data = phase6_haiku.build_output(bench.case_id, haiku_result, result, model)
+        output_data['run_index'] = index
+        return output_data
+    finally:
+        if not args.keep_runs:
+            shutil.rmtree(sandbox_dir, ignore_errors=True)
+        bench.release(args.keep_runs)
+
+
+# ============================================================
+# 矩阵与判定
+# ============================================================
+
+def _difficulty(case_data: dict) -> Optional[int]:
+    """D5 / Plan-D5 / 5 → 5"""
+    value = case_data.get('task', {}).get('difficulty')
+    if isinstance(value, str):
+        value = value.strip().upper()
+        if value.startswith('PLAN-'):
+            value = value[len('PLAN-'):]
+        value = value.lstrip('D')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def pass_matrix(records: List[Dict[str, Any]], models: Sequence[str],
+                errors: Sequence[Dict[str, Any]] = ()) -> Dict[str, Dict[str, Any]]:
+    """
+    一个 case 的运行记录 → {model: {runs, passes, pass_rate, errors}}
+
+    runs 只计完成的运行，pass_rate 以完成的运行为分母；抛出异常的运行计入 errors。
+    """
+    matrix = {}
+    for model in models:
+        outcomes = [r['haiku_evaluation']['passed'] for r in records if r['model'] == model]
+        passes = sum(outcomes)
+        matrix[model] = {
+            'runs': len(outcomes),
+            'passes': passes,
+            'pass_rate': passes / len(outcomes) if outcomes else 0.0,
+            'errors': sum(1 for e in errors if e['model'] == model)
+        }
+    return matrix
+
+
+def judge(difficulty: Optional[int], matrix: Dict[str, Dict[str, Any]], models: Sequence[str],
+          threshold: float) -> Dict[str, Any]:
+    """根据通过率矩阵判断难度标注是否可信"""
+    solved_by = next((m for m in models if matrix[m]['runs'] and matrix[m]['pass_rate'] >= threshold), None)
+    weakest = models[0]
+    # 出错的运行可能本来能通过：没有模型解出时无法断定 unsolved；
+    # 比解出者更弱的模型没有完成的运行时，也无法断定它解不出
+    weaker = models[:models.index(solved_by)] if solved_by else models
+    if any(matrix[m]['errors'] for m in models) and solved_by is None \
+            or any(not matrix[m]['runs'] for m in weaker):
+        verdict = 'error'
+    elif solved_by is None:
+        verdict = 'unsolved'
+    elif difficulty is None:
+        verdict = 'unlabeled'
+    elif difficulty <= WEAKEST_MAX_DIFFICULTY:
+        verdict = 'consistent' if solved_by == weakest else 'harder_than_label'
+    else:
+        verdict = 'easier_than_label' if solved_by == weakest else 'consistent'
+    return {'solved_by': solved_by, 'verdict': verdict}
+
+
+def summarize_by_difficulty(cases: List[Dict[str, Any]], models: Sequence[str]) -> Dict[str, Dict[str, float]]:
+    """按难度标注汇总各模型的平均通过率（不计没有完成运行的 case，全部没有时为 None）"""
+    summary: Dict[str, Dict[str, Optional[float]]] = {}
+    for difficulty in sorted({c['difficulty'] for c in cases if c['difficulty'] is not None}):
+        group = [c for c in cases if c['difficulty'] == difficulty]
+        summary[f"D{difficulty}"] = {}
+        for model in models:
+            rates = [c['matrix'][model]['pass_rate'] for c in group if c['matrix'][model]['runs']]
+            summary[f"D{difficulty}"][model] = sum(rates) / len(rates) if rates else None
+    return summary
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def _collect_case_files(inputs: List[str]) -> List[Path]:
+    files = {}
+    for item in inputs:
+        path = Path(item)
+        for case_file in (sorted(path.rglob('case.json')) if path.is_dir() else [path]):
+            files.setdefault(case_file.resolve(), case_file)
+    return list(files.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多模型难度校准（通过率矩阵 vs 难度标注）')
+    parser.add_argument('inputs', nargs='+', help='case.json 文件或目录')
+    parser.add_argument('--models', default=','.join(DEFAULT_MODELS),
+                        help='模型列表，由弱到强，逗号分隔（默认: haiku,sonnet,opus）')
+    parser.add_argument('--runs', type=int, default=3, help='每个模型的重复次数（默认: 3）')
+    parser.add_argument('--parallel', type=int, default=4, help='并发运行数（所有 case 共用，默认: 4）')
+    parser.add_argument('--solve-threshold', type=float, default=DEFAULT_SOLVE_THRESHOLD,
+                        help='通过率达到该值视为模型能解出（默认: 0.5）')
+    parser.add_argument('--runs-dir', default='calibration_runs', help='运行目录（默认: ./calibration_runs）')
+    parser.add_argument('--keep-runs', action='store_true', help='保留模板和每次运行的沙箱')
+    parser.add_argument('--timeout', type=int, default=600, help='单次运行超时秒数（默认: 600）')
+    parser.add_argument('--claude-bin', default=os.environ.get('CLAUDE_BIN', 'claude'),
+                        help='Claude CLI 命令（默认: $CLAUDE_BIN 或 claude）')
+    parser.add_argument('--isolate', action='store_true', help='每次运行在独立的命名空间中执行（见 isolation.py）')
+    parser.add_argument('--store', help='把每次运行写入 SQLite 结果库（见 results_store.py）')
+    parser.add_argument('--output', default='calibration_result.json', help='输出文件（默认: ./calibration_result.json）')
+
+    args = parser.parse_args()
+    models = [m for m in args.models.split(',') if m]
+    if not models or args.runs < 1:
+        print("Error: need at least one model and --runs >= 1")
+        sys.exit(2)
+
+    cases: List[Tuple[Path, dict]] = []
+    for case_file in _collect_case_files(args.inputs):
+        try:
+            with open(case_file, 'r', encoding='utf-8') as f:
+                cases.append((case_file, json.load(f)))
+        except (OSError, ValueError) as e:
+            print(f"Warning: {case_file}: {e}")
+    if not cases:
+        print("Error: no case files found")
+        sys.exit(1)
+
+    runs_dir = Path(args.runs_dir).resolve()
+    jobs_per_case = len(models) * args.runs
+    benches = [CaseBench(case_data, case_file, runs_dir, jobs_per_case) for case_file, case_data in cases]
+
+    print(f"\n{'='*60}")
+    print(f"多模型难度校准")
+    print(f"{'='*60}")
+    print(f"Cases: {len(cases)}  models: {', '.join(models)}  runs/model: {args.runs}")
+    print(f"Total runs: {len(cases) * jobs_per_case}  parallel {args.parallel}")
+    print()
+
+    records: Dict[str, List[Dict[str, Any]]] = {bench.key: [] for bench in benches}
+    errors: Dict[str, List[Dict[str, Any]]] = {bench.key: [] for bench in benches}
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as pool:
+        # 按 case 顺序提交：同一 case 的运行相邻，模板存活时间短
+        futures = {
+            pool.submit(run_one, bench, model, index, args): (bench, model, index)
+            for bench in benches for index in range(args.runs) for model in models
+        }
+        for future in as_completed(futures):
+            bench, model, index = futures[future]
+            case_id = bench.case_id
+            try:
+                output_data = future.result()
+            except Exception as e:
+                print(f"  ! {case_id} {model} #{index + 1}: {e}")
+                errors[bench.key].append({'model': model, 'run_index': index, 'error': str(e)})
+                continue
+            records[bench.key].append(output_data)
+            evaluation = output_data['haiku_evaluation']
+            status = "✓" if evaluation['passed'] else "✗"
+            print(f"  {status} {case_id} {model} #{index + 1}: "
+                  f"{evaluation['passed_checks']}/{evaluation['total_checks']} checks, "
+                  f"{evaluation['haiku_steps']} steps, {evaluation['duration_sec']:.1f}s")
+    if not args.keep_runs:
+        shutil.rmtree(runs_dir, ignore_errors=True)
+
+    results = []
+    for bench in benches:
+        difficulty = _difficulty(bench.case_data)
+        matrix = pass_matrix(records[bench.key], models, errors[bench.key])
+        results.append({
+            'case_id': bench.case_id,
+            'case_file': bench.case_file,
+            'difficulty': difficulty,
+            'warm_template': bench.warm,
+            'matrix': matrix,
+            'errors': errors[bench.key],
+            **judge(difficulty, matrix, models, args.solve_threshold)
+        })
+
+    print(f"\n{'='*60}")
+    print(f"  {'case':<24} {'label':<6}" + ''.join(f"{m:>9}" for m in models) + "  verdict")
+    for r in results:
+        label = f"D{r['difficulty']}" if r['difficulty'] is not None else '-'
+        # 有出错的运行时在通过率后标注 !n
+        rates = ''.join(f"{r['matrix'][m]['pass_rate']:>9.2f}" if not r['matrix'][m]['errors']
+                        else f"{r['matrix'][m]['pass_rate']:>6.2f}!{r['matrix'][m]['errors']:<2}"
+                        for m in models)
+        print(f"  {r['case_id'][:24]:<24} {label:<6}{rates}  {r['verdict']}")
+    summary = summarize_by_difficulty(results, models)
+    if summary:
+        print()
+        for label, rates in summary.items():
+            print(f"  {'mean ' + label:<31}"
+                  + ''.join(f"{rates[m]:>9.2f}" if rates[m] is not None else f"{'-':>9}" for m in models))
+    print(f"{'='*60}")
+
+    if args.store:
+        from results_store import ResultsStore
+        with ResultsStore(Path(args.store)) as store:
+            for bench in benches:
+                for output_data in records[bench.key]:
+                    store.record(output_data, bench.case_data)
+        print(f"\n{sum(len(v) for v in records.values())} runs recorded in: {args.store}")
+
+    output_data = {
+        'timestamp': datetime.now().isoformat(),
+        'models': models,
+        'runs_per_model': args.runs,
+        'solve_threshold': args.solve_threshold,
+        'cases': results,
+        'by_difficulty': summary
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output_data, f, indent=2, ensure_ascii=False)
+    print(f"\nResult saved to: {args.output}")
+
+    off_label = [r['case_id'] for r in results if r['verdict'] not in ('consistent', 'unlabeled')]
+    sys.exit(1 if off_label else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+case.json 流式读取
+
+json.load 会把每个 environment 文件的内容都解码成 Python 字符串，而质量评估、
+列表、过滤这类只看 task / graders / 文件路径的工具根本用不到这些内容。
+本模块直接在 mmap 上扫描 case.json：
+- 逐个产出顶层 section，未请求的 section 只跳过、不解码
+- environment 条目中的 content 不解码，返回 DeferredContent 句柄，
+  调用 read() 时才从文件中读取对应片段
+
+使用方式:
+    from case_reader import load_case, iter_sections
+    case_data = load_case(path)                          # environment.content 为 DeferredContent
+    case_data = load_case(path, sections=('task',))      # 只解码 task
+    for key, value in iter_sections(path): ...
+
+    from blob_store import env_content
+    text = env_content(file_info)                        # 统一读取内联 / blob / 延迟内容
+
+注意：延迟加载的 case 不能直接 json.dump 或传给 environment_hash()，
+需要构建沙箱的脚本（phase4 / phase6 / pipeline）仍使用 json.load。
+
+命令行（列出 / 过滤题库元数据）:
+    python3 case_reader.py <case_file_or_dir>... [--fields id,difficulty,tool_name]
+                           [--where difficulty=4] [--json]
+"""
+import sys
+import os
+import re
+import json
+import mmap
+import argparse
+from pathlib import Path
+from typing import Dict, Any, List, Iterator, Optional, Sequence, Tuple
+
+
+_WS = re.compile(rb'[ \t\r\n]*')
+_SCALAR = re.compile(rb'[^,}\]\s]+')
+_STRUCTURAL = re.compile(rb'["\[\]{}]')
+_BACKSLASH = 0x5c
+# 转义引号很多时逐个 find 会退化，改用占有量词正则（不保留回溯状态）扫完剩余部分
+_STRING_TAIL = re.compile(rb'[^"\\]*+(?:\\.[^"\\]*+)*+"', re.DOTALL)
+_MAX_ESCAPED_QUOTES = 16
+
+
+class CaseParseError(ValueError):
+    pass
+
+
+class DeferredContent:
+    """environment 文件内容的延迟句柄：记录在 case.json 中的字节区间"""
+
+    __slots__ = ('path', 'start', 'end')
+
+    def __init__(self, path: str, start: int, end: int):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    @property
+    def raw_size(self) -> int:
+        """JSON 编码后的字节数（含引号和转义），可用作大小的近似值"""
+        return self.end - self.start
+
+    def read(self) -> str:
+        with open(self.path, 'rb') as f:
+            f.seek(self.start)
+            return json.loads(f.read(self.end - self.start))
+
+    def __repr__(self) -> str:
+        return f"DeferredContent({self.path!r}, {self.start}, {self.end})"
+
+
+# ============================================================
+# 扫描器
+# ============================================================
+
+class _Scanner:
+    def __init__(self, buf, path: str):
+        self.buf = buf
+        self.path = path
+        self.pos = 0
+
+    def ws(self) -> None:
+        self.pos = _WS.match(self.buf, self.pos).end()
+
+    def peek(self) -> bytes:
+        self.ws()
+        return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, token: bytes) -> None:
+        if self.peek() != token:
+            raise CaseParseError(f"{self.path}: expected {token!r} at byte {self.pos}")
+        self.pos += 1
+
+    def _string_end(self, start: int) -> int:
+        """
+        字符串结束位置（不含）：memchr 查找下一个引号，前面有奇数个反斜杠则是转义
+
+        只在引号处回到 Python，长文件内容的扫描速度接近内存带宽。
+        """
+        buf = self.buf
+        i = start + 1
+        for _ in range(_MAX_ESCAPED_QUOTES):
+            j = buf.find(b'"', i)
+            if j < 0:
+                raise CaseParseError(f"{self.path}: unterminated string at byte {start}")
+            k = j - 1
+            while buf[k] == _BACKSLASH:
+                k -= 1
+            if (j - 1 - k) % 2 == 0:
+                return j + 1
+            i = j + 1
+        m = _STRING_TAIL.match(buf, i)
+        if not m:
+            raise CaseParseError(f"{self.path}: unterminated string at byte {start}")
+        return m.end()
+
+    def string_span(self) -> Tuple[int, int]:
+        if self.peek() != b'"':
+            raise CaseParseError(f"{self.path}: expected string at byte {self.pos}")
+        start = self.pos
+        self.pos = self._string_end(start)
+        return start, self.pos
+
+    def string(self) -> str:
+        start, end = self.string_span()
+        return json.loads(self.buf[start:end])
+
+    def skip_value(self) -> Tuple[int, int]:
+        """跳过一个 JSON 值，返回其字节区间（不解码）"""
+        ch = self.peek()
+        start = self.pos
+        if ch == b'"':
+            return self.string_span()
+        if ch not in (b'{', b'['):
+            m = _SCALAR.match(self.buf, self.pos)
+            if not m:
+                raise CaseParseError(f"{self.path}: unexpected {ch!r} at byte {self.pos}")
+            self.pos = m.end()
+            return start, self.pos
+        depth = 0
+        pos = self.pos
+        while True:
+            m = _STRUCTURAL.search(self.buf, pos)
+            if not m:
+                raise CaseParseError(f"{self.path}: unterminated value at byte {start}")
+            token = m.group()
+            if token == b'"':
+                pos = self._string_end(m.start())
+                continue
+            pos = m.end()
+            if token in (b'{', b'['):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    self.pos = pos
+                    return start, pos
+
+    def value(self) -> Any:
+        start, end = self.skip_value()
+        return json.loads(self.buf[start:end])
+
+    def iter_object(self) -> Iterator[str]:
+        """逐个产出对象的键，调用方负责消费对应的值"""
+        self.expect(b'{')
+        if self.peek() == b'}':
+            self.pos += 1
+            return
+        while True:
+            key = self.string()
+            self.expect(b':')
+            yield key
+            ch = self.peek()
+            self.pos += 1
+            if ch == b'}':
+                return
+            if ch != b',':
+                raise CaseParseError(f"{self.path}: expected ',' or '}}' at byte {self.pos - 1}")
+
+    def iter_array(self) -> Iterator[None]:
+        self.expect(b'[')
+        if self.peek() == b']':
+            self.pos += 1
+            return
+        while True:
+            yield None
+            ch = self.peek()
+            self.pos += 1
+            if ch == b']':
+                return
+            if ch != b',':
+                raise CaseParseError(f"{self.path}: expected ',' or ']' at byte {self.pos - 1}")
+
+    def environment(self) -> List[Dict[str, Any]]:
+        entries = []
+        for _ in self.iter_array():
+            entry: Dict[str, Any] = {}
+            for key in self.iter_object():
+                if key == 'content' and self.peek() == b'"':
+                    entry[key] = DeferredContent(self.path, *self.string_span())
+                else:
+                    entry[key] = self.value()
+            entries.append(entry)
+        return entries
+
+
+# ============================================================
+# 接口
+# ============================================================
+
+def iter_sections(path, sections: Optional[Sequence[str]] = None,
+                  lazy_content: bool = True) -> Iterator[Tuple[str, Any]]:
+    """
+    按文件顺序产出顶层 (key, value)
+
+    Args:
+        path: case.json 路径
+        sections: 只产出这些 section（其余只跳过不解码）；None 表示全部
+        lazy_content: environment 的 content 返回 DeferredContent
+    """
+    path = str(path)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise CaseParseError(f"{path}: empty file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            scanner = _Scanner(buf, path)
+            for key in scanner.iter_object():
+                if sections is not None and key not in sections:
+                    scanner.skip_value()
+                elif key == 'environment' and lazy_content and scanner.peek() == b'[':
+                    yield key, scanner.environment()
+                else:
+                    yield key, scanner.value()
+
+
+def load_case(path, sections: Optional[Sequence[str]] = None, lazy_content: bool = True) -> Dict[str, Any]:
+    """读取 case.json 为字典（environment.content 默认延迟加载）"""
+    return dict(iter_sections(path, sections, lazy_content))
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def _field(case_data: dict, name: str) -> Any:
+    task = case_data.get('task', {})
+    if name == 'files':
+        return len(case_data.get('environment', []))
+    if name == 'steps':
+        return len(case_data.get('reference_solution', []))
+    return task.get(name, case_data.get(name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列出 / 过滤题库元数据（不解码环境文件内容）')
+    parser.add_argument('inputs', nargs='+', help='case.json 文件或目录')
+    parser.add_argument('--pattern', default='case.json', help='目录中查找的文件名模式（默认: case.json）')
+    parser.add_argument('--fields', default='id,difficulty,tool_name,task_type,files',
+                        help='输出字段（task 字段，或 files / steps；默认: id,difficulty,tool_name,task_type,files）')
+    parser.add_argument('--where', action='append', default=[], metavar='FIELD=VALUE', help='过滤条件，可重复')
+    parser.add_argument('--json', action='store_true', help='以 JSON Lines 输出')
+
+    args = parser.parse_args()
+    fields = args.fields.split(',')
+    conditions = [cond.split('=', 1) for cond in args.where]
+
+    needed = {'task'}
+    if 'files' in fields or any(c[0] == 'files' for c in conditions):
+        needed.add('environment')
+    if 'steps' in fields or any(c[0] == 'steps' for c in conditions):
+        needed.add('reference_solution')
+
+    matched = 0
+    for item in args.inputs:
+        path = Path(item)
+        files = sorted(path.rglob(args.pattern)) if path.is_dir() else [path]
+        for case_file in files:
+            try:
+                case_data = load_case(case_file, sections=needed)
+            except (OSError, ValueError) as e:
+                print(f"Warning: {case_file}: {e}", file=sys.stderr)
+                continue
+            if any(str(_field(case_data, name)) != value for name, value in conditions):
+                continue
+            matched += 1
+            row = {name: _field(case_data, name) for name in fields}
+            row['path'] = str(case_file)
+            if args.json:
+                print(json.dumps(row, ensure_ascii=False))
+            else:
+                print('  '.join(str(row[name]) for name in fields) + f"  {case_file}")
+
+    if not args.json:
+        print(f"\n{matched} cases")
+
+
+if __name__ == '__main__':
+    main()
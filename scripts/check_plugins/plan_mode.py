@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Plan 模式重构 check：file_moved / import_updated / module_not_imported / refactor_invariants
+
+导入关系查询使用沙箱导入图（import_graph.py，同一次评估内只构建一次）。
+"""
+import os
+import re
+import bisect
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from custom_checks import _resolve_path
+from import_graph import get_import_graph
+from safe_regex import DEFAULT_TIMEOUT as REGEX_TIMEOUT, analyze, find_first
+
+
+def check_file_moved(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
+    """检查文件是否从源位置移动到目标位置（check_importers 为 true 时同时要求没有文件再导入源模块）"""
+    source = params.get('source', '')
+    destination = params.get('destination', '')
+
+    source_path = _resolve_path(source, sandbox_dir)
+    dest_path = _resolve_path(destination, sandbox_dir)
+
+    source_exists = source_path.exists()
+    dest_exists = dest_path.exists()
+
+    if not source_exists and dest_exists:
+        if params.get('check_importers'):
+            stale = get_import_graph(sandbox_dir).importers(path=source)
+            if stale:
+                return False, f"file moved but still imported from old location by: {_format_files(stale)}"
+        return True, f"file moved from '{source}' to '{destination}'"
+    elif source_exists and dest_exists:
+        return False, f"file copied (source still exists): {source}"
+    elif source_exists and not dest_exists:
+        return False, f"file not moved (still at source): {source}"
+    else:
+        return False, f"neither source nor destination exists"
+
+
+def _module_query(value: str) -> dict:
+    """模块参数既可写模块键（src.utils.date / lodash），也可写文件路径"""
+    if '/' in value or value.endswith(('.py', '.ts', '.tsx', '.js', '.jsx', '.mjs', '.cjs')):
+        return {'path': value}
+    return {'module': value}
+
+
+def _format_files(files, limit: int = 10) -> str:
+    files = sorted(files)
+    text = ', '.join(files[:limit])
+    return text + (f" ... ({len(files)} total)" if len(files) > limit else '')
+
+
+def _check_import_graph_updated(sandbox_dir: Path, path: str, old_module: str,
+                                new_module: str) -> Tuple[bool, str]:
+    """import_updated 的模块图版本：path 为空时检查整个沙箱"""
+    graph = get_import_graph(sandbox_dir)
+    old_query = _module_query(old_module) if old_module else None
+    new_query = _module_query(new_module) if new_module else None
+
+    if path:
+        if not _resolve_path(path, sandbox_dir).exists():
+            return False, f"file not found: {path}"
+        has_old = bool(old_query) and graph.imports(path, **old_query)
+        has_new = not new_query or graph.imports(path, **new_query)
+        if has_old:
+            return False, f"{path} still imports '{old_module}'"
+        if not has_new:
+            return False, f"{path} does not import '{new_module}'"
+        return True, f"{path} imports '{new_module or '-'}' and not '{old_module or '-'}'"
+
+    stale = graph.importers(**old_query) if old_query else set()
+    if stale:
+        return False, f"'{old_module}' still imported by: {_format_files(stale)}"
+    updated = graph.importers(**new_query) if new_query else set()
+    if new_query and not updated:
+        return False, f"no file imports '{new_module}'"
+    return True, f"no importers of '{old_module or '-'}', {len(updated)} file(s) import '{new_module or '-'}'"
+
+
+def check_import_updated(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
+    """
+    检查文件中的导入语句是否已更新
+
+    old_import / new_import 按子串匹配导入语句；old_module / new_module 则查询沙箱
+    导入图（解析后的模块，不受注释、别名、引号风格影响），省略 path 时检查整个沙箱。
+    """
+    path = params.get('path', '')
+    old_import = params.get('old_import', '')
+    new_import = params.get('new_import', '')
+
+    if params.get('old_module') or params.get('new_module'):
+        return _check_import_graph_updated(sandbox_dir, path, params.get('old_module', ''),
+                                           params.get('new_module', ''))
+
+    full_path = _resolve_path(path, sandbox_dir)
+
+    if not full_path.exists():
+        return False, f"file not found: {path}"
+
+    try:
+        content = full_path.read_text(encoding='utf-8')
+
+        has_old = old_import in content
+        has_new = new_import in content
+
+        if not has_old and has_new:
+            return True, f"import updated from '{old_import}' to '{new_import}'"
+        elif has_old and has_new:
+            return False, f"both old and new imports exist"
+        elif has_old and not has_new:
+            return False, f"import not updated (old import still exists)"
+        else:
+            return False, f"neither old nor new import found"
+    except Exception as e:
+        return False, f"error: {e}"
+
+
+def check_module_not_imported(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
+    """检查沙箱中没有任何文件导入指定模块（module 为模块键或文件路径）"""
+    module = params.get('module', '') or params.get('path', '')
+    if not module:
+        return False, "missing 'module' param"
+
+    importers = get_import_graph(sandbox_dir).importers(**_module_query(module))
+    if importers:
+        return False, f"'{module}' imported by: {_format_files(importers)}"
+    return True, f"'{module}' is not imported anywhere"
+
+
+def _glob_to_regex(pattern: str) -> 're.Pattern':
+    """glob（支持 **）转正则，按 / 分隔的相对路径匹配"""
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            out.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            out.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 1:]:
+            end = pattern.index(']', i + 1)
+            out.append('[' + pattern[i + 1:end].replace('!', '^', 1) + ']')
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile(''.join(out) + r'\Z')
+
+
+def _glob_base(pattern: str) -> str:
+    """glob 中第一个通配符之前的目录部分"""
+    parts = []
+    for part in pattern.split('/'):
+        if any(c in part for c in '*?['):
+            break
+        parts.append(part)
+    else:
+        parts = parts[:-1]
+    return '/'.join(parts)
+
+
+def check_refactor_invariants(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
+    """
+    一次遍历整棵目录树，检查 glob 命中的每个文件都满足全部规则
+
+    规则（rules 中每项一条，when / when_regex 为可选前提）:
+        {"forbid": "old_module"}                      不得包含字面量
+        {"forbid_regex": "from\\s+old_module"}         不得匹配正则
+        {"require": "..."} / {"require_regex": "..."}  必须包含 / 匹配
+        {"when": "DateFormatter", "require": "from src.formatters.date import DateFormatter"}
+                                                       包含 when 的文件必须满足 require
+
+    字面量在读入的文件内容上逐个用 str.find 查找（C 实现，规则通常只有几条）；正则规则经 safe_regex
+    匹配（必需字面量预过滤、逐行匹配、timeout 秒的时间预算），forbid_regex 只报告第一处匹配。
+    """
+    globs = params.get('glob', params.get('path_pattern', '**/*'))
+    globs = [globs] if isinstance(globs, str) else list(globs)
+    excludes = params.get('exclude', [])
+    excludes = [excludes] if isinstance(excludes, str) else list(excludes)
+    rules = params.get('rules', [])
+    min_files = params.get('min_files', 1)
+
+    for pattern in globs + excludes:
+        if pattern.startswith('/') or '..' in pattern.split('/'):
+            return False, f"glob must be relative to the sandbox without '..': {pattern}"
+
+    include_res = [_glob_to_regex(g) for g in globs]
+    exclude_res = [_glob_to_regex(g) for g in excludes]
+
+    # 字面量去重；正则先分析一遍（非法时抛出 re.error），匹配走 safe_regex 的时间预算
+    literals: List[str] = []
+    for rule in rules:
+        for key in ('when', 'forbid', 'require'):
+            if key in rule and rule[key] not in literals:
+                literals.append(rule[key])
+        for key in ('when_regex', 'forbid_regex', 'require_regex'):
+            if key in rule:
+                analyze(rule[key], re.MULTILINE)
+    timeout = params.get('timeout', REGEX_TIMEOUT)
+
+    # 只遍历一次：从所有 glob 的公共基目录开始
+    bases = [_glob_base(g) for g in globs]
+    common = os.path.commonpath(bases) if all(bases) else ''
+    root = sandbox_dir / common
+
+    violations: List[str] = []
+    scanned = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            full_path = Path(dirpath) / name
+            rel_path = full_path.relative_to(sandbox_dir).as_posix()
+            if not any(r.match(rel_path) for r in include_res):
+                continue
+            if any(r.match(rel_path) for r in exclude_res):
+                continue
+
+            scanned += 1
+            try:
+                content = full_path.read_text(encoding='utf-8', errors='replace')
+            except OSError as e:
+                violations.append(f"{rel_path}: unreadable ({e})")
+                continue
+
+            # 字面量全部出现位置（不出现的不在 hits 中）
+            hits: Dict[str, List[int]] = {}
+            for literal in literals:
+                offset = content.find(literal)
+                while offset >= 0:
+                    hits.setdefault(literal, []).append(offset)
+                    offset = content.find(literal, offset + 1)
+
+            newlines: List[int] = []
+
+            def line_of(offset: int) -> int:
+                if not newlines:
+                    newlines.extend(m.start() for m in re.finditer('\n', content))
+                    newlines.append(len(content))
+                return bisect.bisect_left(newlines, offset) + 1
+
+            first_lines: Dict[str, Optional[int]] = {}
+
+            def first_line(pattern: str) -> int:
+                """正则第一处匹配的行号，没有匹配为 0；超出时间预算记为违规并视为 0"""
+                if pattern not in first_lines:
+                    line, detail = find_first(full_path, pattern, re.MULTILINE, timeout)
+                    if line is None:
+                        violations.append(f"{rel_path}: /{pattern}/ {detail}")
+                    first_lines[pattern] = line or 0
+                return first_lines[pattern]
+
+            def condition_holds(rule: dict) -> bool:
+                if 'when' in rule and rule['when'] not in hits:
+                    return False
+                if 'when_regex' in rule and not first_line(rule['when_regex']):
+                    return False
+                return True
+
+            for rule in rules:
+                if not condition_holds(rule):
+                    continue
+                if 'forbid' in rule:
+                    for offset in hits.get(rule['forbid'], []):
+                        violations.append(f"{rel_path}:{line_of(offset)}: contains '{rule['forbid']}'")
+                if 'forbid_regex' in rule and first_line(rule['forbid_regex']):
+                    violations.append(f"{rel_path}:{first_line(rule['forbid_regex'])}: "
+                                      f"matches /{rule['forbid_regex']}/")
+                missing = None
+                if 'require' in rule and rule['require'] not in hits:
+                    missing = f"'{rule['require']}'"
+                if 'require_regex' in rule and not first_line(rule['require_regex']):
+                    missing = f"/{rule['require_regex']}/"
+                if missing:
+                    if 'when' in rule:
+                        where = f"{rel_path}:{line_of(hits[rule['when']][0])}"
+                    else:
+                        where = rel_path
+                    violations.append(f"{where}: missing {missing}")
+
+    if scanned < min_files:
+        return False, f"only {scanned} files matched {globs} (min_files={min_files})"
+    if violations:
+        shown = '; '.join(violations[:20])
+        more = f"; ... and {len(violations) - 20} more" if len(violations) > 20 else ''
+        return False, f"{len(violations)} violations in {scanned} files: {shown}{more}"
+    return True, f"{scanned} files satisfy {len(rules)} rules"
+
+
+CHECKS = {
+    'file_moved': check_file_moved,
+    'import_updated': check_import_updated,
+    'module_not_imported': check_module_not_imported,
+    'refactor_invariants': check_refactor_invariants,
+}
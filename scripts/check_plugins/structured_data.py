@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+结构化数据 check：json_path_equals / yaml_key_equals
+
+路径语法见 doc_query.py。同一 grader 中同一文件上的多条路径 check 由 prefetch()
+合并为一次遍历；yaml 只在第一次解析 YAML 文件时才导入。
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from custom_checks import _resolve_path
+from doc_query import PathSyntaxError, active_cache, compile_path
+
+
+def _path_equals(full_path: Path, fmt: str, path_expr: str, expected, params: dict,
+                 label: str) -> Tuple[bool, str]:
+    """
+    json_path_equals / yaml_key_equals 的公共逻辑
+
+    单值路径（只含键 / 下标）与原来一致；含通配 / 切片 / 过滤 / 递归下降的路径
+    按 params['quantifier']（all / any，默认 all）判定全部或任一匹配值等于 expected。
+    """
+    compiled = compile_path(path_expr)
+    matches = active_cache().query(full_path, fmt, path_expr)
+
+    if compiled.singular:
+        if not matches:
+            return False, f"{label} '{path_expr}' not found"
+        value = matches[0]
+        if str(value) == str(expected):
+            return True, f"{label} '{path_expr}' equals '{expected}'"
+        return False, f"{label} '{path_expr}' is '{value}', expected '{expected}'"
+
+    if not matches:
+        return False, f"{label} '{path_expr}' matched nothing"
+    quantifier = params.get('quantifier', 'all')
+    equal = sum(1 for v in matches if str(v) == str(expected))
+    passed = equal > 0 if quantifier == 'any' else equal == len(matches)
+    summary = f"{label} '{path_expr}': {equal}/{len(matches)} matches equal '{expected}' ({quantifier})"
+    return passed, summary
+
+
+def check_json_path_equals(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
+    """检查 JSON 文件中特定路径的值（路径语法见 doc_query.py）"""
+    path = params.get('path', '')
+    json_path = params.get('json_path', '')
+    expected = params.get('expected', '')
+
+    full_path = _resolve_path(path, sandbox_dir)
+
+    if not full_path.exists():
+        return False, f"file not found: {path}"
+
+    try:
+        return _path_equals(full_path, 'json', json_path, expected, params, 'json_path')
+    except json.JSONDecodeError as e:
+        return False, f"invalid JSON: {e}"
+    except PathSyntaxError as e:
+        return False, f"invalid path: {e}"
+    except Exception as e:
+        return False, f"error: {e}"
+
+
+def check_yaml_key_equals(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
+    """检查 YAML 文件中特定键的值（路径语法见 doc_query.py）"""
+    path = params.get('path', '')
+    key_path = params.get('key_path', '')
+    expected = params.get('expected', '')
+
+    full_path = _resolve_path(path, sandbox_dir)
+
+    if not full_path.exists():
+        return False, f"file not found: {path}"
+
+    try:
+        return _path_equals(full_path, 'yaml', key_path, expected, params, 'yaml_key')
+    except ImportError:
+        # 如果没有 yaml 模块，使用简单的字符串匹配
+        content = full_path.read_text(encoding='utf-8')
+        if f"{key_path.split('.')[-1]}: {expected}" in content:
+            return True, f"yaml contains '{key_path}: {expected}' (simple match)"
+        return False, f"yaml does not contain expected value (yaml module not available)"
+    except PathSyntaxError as e:
+        return False, f"invalid key path: {e}"
+    except Exception as e:
+        return False, f"error: {e}"
+
+
+# 路径类 check：(格式, 路径参数名)
+PATH_QUERY_CHECKS = {
+    'json_path_equals': ('json', 'json_path'),
+    'yaml_key_equals': ('yaml', 'key_path'),
+}
+
+
+def prefetch(checks: List[dict], sandbox_dir: Path) -> None:
+    """
+    把同一文件上的全部路径 check 合并为一次遍历，结果存入当前 DocumentCache
+
+    解析失败、文件缺失等错误在这里忽略，由各 check 自己报告。
+    """
+    groups: Dict[Tuple[Path, str], List[str]] = {}
+    for check in checks:
+        spec = PATH_QUERY_CHECKS.get(check.get('check', ''))
+        if spec is None:
+            continue
+        fmt, path_param = spec
+        params = check.get('params', {})
+        full_path = _resolve_path(params.get('path', ''), sandbox_dir)
+        groups.setdefault((full_path, fmt), []).append(params.get(path_param, ''))
+
+    cache = active_cache()
+    for (full_path, fmt), exprs in groups.items():
+        if len(exprs) < 2:
+            continue
+        try:
+            cache.prefetch(full_path, fmt, exprs)
+        except Exception:
+            pass
+
+
+CHECKS = {
+    'json_path_equals': check_json_path_equals,
+    'yaml_key_equals': check_yaml_key_equals,
+}
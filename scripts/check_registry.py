@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+可插拔、按需加载的 check 注册表
+
+内置 check 定义在 custom_checks.py；其余 check 族放在插件目录下的独立模块中
+（默认 scripts/check_plugins/，环境变量 CASE_CHECK_PLUGINS 可追加目录，用 os.pathsep 分隔）。
+插件模块在顶层声明一个字面量字典：
+
+    CHECKS = {
+        'json_path_equals': check_json_path_equals,
+        'yaml_key_equals': check_yaml_key_equals,
+    }
+
+注册表只用 ast 读取这个字典建立"check 名 → 模块"的索引，第一次用到某个 check 时
+才 import 对应模块（yaml 只在 yaml_key_equals 执行时才会被导入）。模块还可以定义
+prefetch(checks, sandbox_dir)，在执行同一 grader 的 check 前调用（如合并同一文件的路径查询）。
+
+每个 check 有一个内容指纹：从 check 函数出发，递归收集它引用的函数、类和常量的源码
+（跨越本地模块的 from-import，如插件引用的 custom_checks._resolve_path）。只有该 check
+实际用到的代码变化时指纹才变，可作为结果缓存的失效键。
+
+使用方式:
+    from custom_checks import CHECK_REGISTRY
+    func = CHECK_REGISTRY['yaml_key_equals']          # 首次访问时 import 插件模块
+    CHECK_REGISTRY.fingerprint('yaml_key_equals')     # 不 import 也能计算
+    CHECK_REGISTRY.prefetch(checks, sandbox_dir)
+
+命令行:
+    python3 check_registry.py [--fingerprints]
+"""
+import os
+import ast
+import sys
+import hashlib
+import argparse
+import threading
+import importlib.util
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+SCRIPT_DIR = Path(__file__).parent
+DEFAULT_PLUGIN_DIR = SCRIPT_DIR / 'check_plugins'
+FINGERPRINT_LEN = 16
+
+
+def plugin_dirs() -> List[Path]:
+    dirs = [DEFAULT_PLUGIN_DIR]
+    extra = os.environ.get('CASE_CHECK_PLUGINS', '')
+    dirs.extend(Path(d) for d in extra.split(os.pathsep) if d)
+    return dirs
+
+
+# ============================================================
+# 源码分析（不 import）
+# ============================================================
+
+class _ModuleSource:
+    """一个模块的顶层定义：函数 / 常量的源码片段，以及 from-import 的来源模块"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.text = path.read_text(encoding='utf-8')
+        self.tree = ast.parse(self.text, filename=str(path))
+        self.definitions: Dict[str, ast.AST] = {}
+        self.imported_from: Dict[str, str] = {}
+        self.checks: Dict[str, str] = {}
+
+        for node in self.tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.definitions[node.name] = node
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        self.definitions[target.id] = node
+                        if target.id == 'CHECKS' and isinstance(node.value, ast.Dict):
+                            self.checks = self._check_table(node.value)
+            elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+                for alias in node.names:
+                    self.imported_from[alias.asname or alias.name] = node.module
+
+    def _check_table(self, table: ast.Dict) -> Dict[str, str]:
+        checks = {}
+        for key, value in zip(table.keys, table.values):
+            if isinstance(key, ast.Constant) and isinstance(key.value, str) and isinstance(value, ast.Name):
+                checks[key.value] = value.id
+            else:
+                print(f"Warning: {self.path}: CHECKS entries must be 'name': function", file=sys.stderr)
+        return checks
+
+    def segment(self, name: str) -> str:
+        return ast.get_source_segment(self.text, self.definitions[name]) or ''
+
+    def references(self, name: str) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """name 直接引用的同模块定义，以及 (来源模块, 名字) 形式的 from-import 引用"""
+        node = self.definitions[name]
+        local, imported = set(), set()
+        for sub in ast.walk(node):
+            if isinstance(sub, ast.Name):
+                if sub.id in self.definitions and sub.id != name:
+                    local.add(sub.id)
+                elif sub.id in self.imported_from:
+                    imported.add((self.imported_from[sub.id], sub.id))
+            elif isinstance(sub, ast.ImportFrom) and sub.module and sub.level == 0:
+                # 函数体内的局部 import（如 from answer_scan import AhoCorasick）
+                imported.update((sub.module, alias.name) for alias in sub.names)
+        return sorted(local), sorted(imported)
+
+
+def _local_module_path(module: str, search_dirs: List[Path]) -> Optional[Path]:
+    for directory in search_dirs:
+        candidate = directory / (module.replace('.', '/') + '.py')
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+# ============================================================
+# 注册表
+# ============================================================
+
+class CheckRegistry(Mapping):
+    """check 名 → 检查函数；插件模块按需 import"""
+
+    def __init__(self, builtin: Dict[str, Callable], builtin_path: str,
+                 dirs: Optional[List[Path]] = None):
+        self._builtin = builtin
+        self._builtin_path = Path(builtin_path).resolve()
+        self._dirs = dirs
+        self._index: Optional[Dict[str, Tuple[Path, str]]] = None
+        self._sources: Dict[Path, _ModuleSource] = {}
+        self._modules: Dict[Path, object] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------
+    # 索引
+    # ------------------------------------------------------------
+
+    def _source(self, path: Path) -> _ModuleSource:
+        if path not in self._sources:
+            self._sources[path] = _ModuleSource(path)
+        return self._sources[path]
+
+    def _build_index(self) -> Dict[str, Tuple[Path, str]]:
+        if self._index is not None:
+            return self._index
+        index: Dict[str, Tuple[Path, str]] = {}
+        for directory in (self._dirs if self._dirs is not None else plugin_dirs()):
+            if not directory.is_dir():
+                continue
+            for path in sorted(directory.glob('*.py')):
+                if path.name.startswith('_'):
+                    continue
+                try:
+                    source = self._source(path.resolve())
+                except (OSError, SyntaxError) as e:
+                    print(f"Warning: check plugin {path}: {e}", file=sys.stderr)
+                    continue
+                for name, func_name in source.checks.items():
+                    if name in self._builtin or name in index:
+                        print(f"Warning: check '{name}' in {path} shadowed by an earlier definition",
+                              file=sys.stderr)
+                        continue
+                    index[name] = (source.path, func_name)
+        self._index = index
+        return index
+
+    def module_path(self, name: str) -> Path:
+        """定义该 check 的模块文件"""
+        if name in self._builtin:
+            return self._builtin_path
+        return self._build_index()[name][0]
+
+    def _load(self, path: Path):
+        # verify_daemon 的工作线程可能同时首次访问同一插件
+        with self._lock:
+            if path not in self._modules:
+                module_name = f"_check_plugin_{path.stem}"
+                spec = importlib.util.spec_from_file_location(module_name, path)
+                module = importlib.util.module_from_spec(spec)
+                sys.modules[module_name] = module
+                spec.loader.exec_module(module)
+                self._modules[path] = module
+            return self._modules[path]
+
+    # ------------------------------------------------------------
+    # Mapping 接口
+    # ------------------------------------------------------------
+
+    def __getitem__(self, name: str) -> Callable:
+        if name in self._builtin:
+            return self._builtin[name]
+        path, func_name = self._build_index()[name]
+        return getattr(self._load(path), func_name)
+
+    def __contains__(self, name) -> bool:
+        return name in self._builtin or name in self._build_index()
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._builtin
+        yield from self._build_index()
+
+    def __len__(self) -> int:
+        return len(self._builtin) + len(self._build_index())
+
+    def loaded_plugins(self) -> List[str]:
+        return [path.stem for path in self._modules]
+
+    # ------------------------------------------------------------
+    # 扩展点
+    # ------------------------------------------------------------
+
+    def prefetch(self, checks: List[dict], sandbox_dir: Path) -> None:
+        """对本组 check 涉及的插件模块调用其 prefetch(checks, sandbox_dir)（如有）"""
+        paths = []
+        for check in checks:
+            name = check.get('check', '')
+            if name in self._builtin or name not in self:
+                continue
+            path = self.module_path(name)
+            if path not in paths:
+                paths.append(path)
+        for path in paths:
+            hook = getattr(self._load(path), 'prefetch', None)
+            if hook is not None:
+                hook(checks, sandbox_dir)
+
+    def fingerprint(self, name: str) -> str:
+        """
+        check 实现的内容指纹（不 import 模块）
+
+        从 check 函数出发，沿同模块引用和本地模块的 from-import 引用收集全部定义的源码；
+        引用到的名字不是顶层定义（如再导出）时退回整个文件的哈希。
+        """
+        if name not in self._fingerprints:
+            path = self.module_path(name)
+            func_name = self._builtin[name].__name__ if name in self._builtin else self._index[name][1]
+            h = hashlib.sha256()
+            seen = set()
+            stack = [(path, func_name)]
+            while stack:
+                key = stack.pop()
+                if key in seen:
+                    continue
+                seen.add(key)
+                source = self._source(key[0])
+                if key[1] not in source.definitions:
+                    h.update(hashlib.sha256(source.text.encode('utf-8')).digest())
+                    continue
+                local, imported = source.references(key[1])
+                stack.extend((key[0], ref) for ref in local)
+                for module, ref in imported:
+                    module_path = _local_module_path(module, [SCRIPT_DIR, key[0].parent])
+                    if module_path is not None:
+                        stack.append((module_path.resolve(), ref))
+            for module_path, definition in sorted(seen, key=lambda k: (str(k[0]), k[1])):
+                source = self._source(module_path)
+                segment = source.segment(definition) if definition in source.definitions else ''
+                h.update(f"{module_path.name}:{definition}\0{segment}\0".encode('utf-8'))
+            self._fingerprints[name] = h.hexdigest()[:FINGERPRINT_LEN]
+        return self._fingerprints[name]
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='列出 check 注册表（不 import 插件模块）')
+    parser.add_argument('--fingerprints', action='store_true', help='同时输出每个 check 的实现指纹')
+
+    args = parser.parse_args()
+    sys.path.insert(0, str(SCRIPT_DIR))
+    from custom_checks import CHECK_REGISTRY
+
+    for name in sorted(CHECK_REGISTRY):
+        module = CHECK_REGISTRY.module_path(name).stem
+        line = f"  {name:<28} {module}"
+        if args.fingerprints:
+            line += f"  {CHECK_REGISTRY.fingerprint(name)}"
+        print(line)
+    print(f"\nTotal: {len(CHECK_REGISTRY)} types, plugins loaded: {CHECK_REGISTRY.loaded_plugins() or '-'}")
+
+
+if __name__ == '__main__':
+    main()
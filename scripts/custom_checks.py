@@ -14,13 +14,17 @@
 
 import os
 import re
-import json
+import mmap
 import glob as glob_module
 import subprocess
 import tempfile
 from pathlib import Path
 from typing import Tuple, Optional, List, Dict, Any
 
+from check_registry import CheckRegistry
+from isolation import active_namespace, run_command, wrap_command
+from safe_regex import DEFAULT_TIMEOUT as REGEX_TIMEOUT, search_file
+
 
 # =============================================================================
 # 核心验证函数
@@ -81,10 +85,55 @@ def _resolve_path(path: str, sandbox_dir: Path) -> Path:
         return sandbox_dir
     p = Path(path)
     if p.is_absolute():
-        return p
+        # 隔离模式下命令看到的是私有 /tmp，文件 check 在宿主机上执行
+        namespace = active_namespace()
+        return namespace.host_path(p) if namespace is not None else p
     return sandbox_dir / path
 
 
+# =============================================================================
+# 文件内容流式匹配
+# =============================================================================
+
+_STREAM_CHUNK = 1 << 20
+
+
+def _text_stream_contains(full_path: Path, keyword: str, case_insensitive: bool) -> bool:
+    """文本模式分块读取（与 read_text 相同的解码和换行转换），块间保留 len-1 个字符"""
+    needle = keyword.lower() if case_insensitive else keyword
+    tail = ''
+    with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
+        while True:
+            chunk = f.read(_STREAM_CHUNK)
+            if not chunk:
+                return False
+            window = tail + (chunk.lower() if case_insensitive else chunk)
+            if needle in window:
+                return True
+            tail = window[len(window) - len(needle) + 1:] if len(needle) > 1 else ''
+
+
+def _file_contains(full_path: Path, keyword: str, case_insensitive: bool = False) -> bool:
+    """
+    文件是否包含 keyword，内存占用与文件大小无关，命中即返回
+
+    大小写敏感且不含换行的关键词直接在 mmap 上按 UTF-8 字节查找；其余情况走文本
+    模式分块读取，逐块 lower()，结果与整文件 read_text 一致（含换行转换和
+    Unicode 大小写折叠）。
+    """
+    if not keyword:
+        return True
+    if case_insensitive or '\n' in keyword or '\r' in keyword:
+        return _text_stream_contains(full_path, keyword, case_insensitive)
+
+    needle = keyword.encode('utf-8')
+    with open(full_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < len(needle):
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return buf.find(needle) >= 0
+
+
 # =============================================================================
 # 标准类型验证函数
 # =============================================================================
@@ -111,11 +160,7 @@ def check_file_content_contains(sandbox_dir: Path, params: dict, trajectory=None
         return False, f"file not found: {path}"
 
     try:
-        content = full_path.read_text(encoding='utf-8', errors='replace')
-        if case_insensitive:
-            found = keyword.lower() in content.lower()
-        else:
-            found = keyword in content
+        found = _file_contains(full_path, keyword, case_insensitive)
 
         if found:
             return True, f"keyword '{keyword}' found in {path}"
@@ -136,11 +181,7 @@ def check_file_content_not_contains(sandbox_dir: Path, params: dict, trajectory=
         return True, f"file not found (OK for not_contains): {path}"
 
     try:
-        content = full_path.read_text(encoding='utf-8', errors='replace')
-        if case_insensitive:
-            found = keyword.lower() in content.lower()
-        else:
-            found = keyword in content
+        found = _file_contains(full_path, keyword, case_insensitive)
 
         if not found:
             return True, f"keyword '{keyword}' correctly not in {path}"
@@ -150,9 +191,10 @@ def check_file_content_not_contains(sandbox_dir: Path, params: dict, trajectory=
 
 
 def check_file_content_matches(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
-    """检查文件内容是否匹配正则表达式"""
+    """检查文件内容是否匹配正则表达式（有时间预算，见 safe_regex.py）"""
     path = params.get('path', '')
     pattern = params.get('pattern', '')
+    timeout = float(params.get('timeout_sec', REGEX_TIMEOUT))
 
     full_path = _resolve_path(path, sandbox_dir)
 
@@ -160,8 +202,10 @@ def check_file_content_matches(sandbox_dir: Path, params: dict, trajectory=None)
         return False, f"file not found: {path}"
 
     try:
-        content = full_path.read_text(encoding='utf-8', errors='replace')
-        if re.search(pattern, content, re.MULTILINE | re.DOTALL):
+        matched, detail = search_file(full_path, pattern, timeout=timeout)
+        if matched is None:
+            return False, detail
+        if matched:
             return True, f"pattern matched in {path}"
         return False, f"pattern not matched in {path}"
     except re.error as e:
@@ -178,6 +222,7 @@ def check_file_content_match(sandbox_dir: Path, params: dict, trajectory=None) -
     """file_content_match - 类似 file_content_matches，支持 regex 或 pattern 参数"""
     path = params.get('path', '')
     pattern = params.get('pattern', params.get('regex', ''))
+    timeout = float(params.get('timeout_sec', REGEX_TIMEOUT))
 
     full_path = _resolve_path(path, sandbox_dir)
 
@@ -185,8 +230,10 @@ def check_file_content_match(sandbox_dir: Path, params: dict, trajectory=None) -
         return False, f"file not found: {path}"
 
     try:
-        content = full_path.read_text(encoding='utf-8', errors='replace')
-        if re.search(pattern, content, re.MULTILINE | re.DOTALL):
+        matched, detail = search_file(full_path, pattern, timeout=timeout)
+        if matched is None:
+            return False, detail
+        if matched:
             return True, f"pattern '{pattern[:50]}...' matched"
         return False, f"pattern not matched"
     except Exception as e:
@@ -480,16 +527,18 @@ def check_custom_script(sandbox_dir: Path, params: dict, trajectory=None) -> Tup
         return False, "no script_content provided"
 
     try:
-        # 创建临时脚本文件
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
+        # 创建临时脚本文件（隔离模式下放进命名空间的私有 /tmp）
+        namespace = active_namespace()
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False,
+                                         dir=namespace.tmp_dir if namespace else None) as f:
             f.write(script_content)
             script_path = f.name
 
         try:
             # 在 sandbox 目录下执行
-            result = subprocess.run(
-                ['python3', script_path],
-                cwd=str(sandbox_dir),
+            result = run_command(
+                ['python3', namespace.inner_path(script_path) if namespace else script_path],
+                cwd=sandbox_dir,
                 capture_output=True,
                 text=True,
                 timeout=timeout
@@ -516,10 +565,10 @@ def check_bash_check(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[
         return False, "no command provided"
 
     try:
-        result = subprocess.run(
+        result = run_command(
             command,
             shell=True,
-            cwd=str(sandbox_dir),
+            cwd=sandbox_dir,
             capture_output=True,
             text=True,
             timeout=30
@@ -542,10 +591,10 @@ def check_bash_exit_code(sandbox_dir: Path, params: dict, trajectory=None) -> Tu
         return False, "no command provided"
 
     try:
-        result = subprocess.run(
+        result = run_command(
             command,
             shell=True,
-            cwd=str(sandbox_dir),
+            cwd=sandbox_dir,
             capture_output=True,
             text=True,
             timeout=60
@@ -562,6 +611,9 @@ def check_bash_exit_code(sandbox_dir: Path, params: dict, trajectory=None) -> Tu
 # 工具调用检查类型
 # =============================================================================
 
+# 只依赖轨迹的 check（tool_used / glob_executed / tool_used_web* 等）在 batch_grading.PROBES
+# 中另有整批求值的实现，修改语义或 message 时要同步
+
 def check_tool_used(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
     """检查是否使用了特定工具"""
     tool_name = params.get('tool', params.get('tool_name', ''))
@@ -634,8 +686,8 @@ def check_bash_process_running(sandbox_dir: Path, params: dict, trajectory=None)
 
         try:
             pid = pid_path.read_text().strip()
-            cmd = f"ps -p {pid}"
-            result = subprocess.run(cmd, shell=True, capture_output=True)
+            cmd, shell = wrap_command(f"ps -p {pid}", shell=True, cwd=sandbox_dir)
+            result = subprocess.run(cmd, shell=shell, capture_output=True)
             if result.returncode == 0:
                 return True, f"process with PID {pid} is running"
             return False, f"process with PID {pid} is not running"
@@ -644,8 +696,8 @@ def check_bash_process_running(sandbox_dir: Path, params: dict, trajectory=None)
 
     if process_name:
         # 通过进程名检查
-        cmd = f"pgrep -f '{process_name}'"
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        cmd, shell = wrap_command(f"pgrep -f '{process_name}'", shell=True, cwd=sandbox_dir)
+        result = subprocess.run(cmd, shell=shell, capture_output=True, text=True)
         if result.returncode == 0:
             pids = result.stdout.strip()
             return True, f"process '{process_name}' is running (PID: {pids})"
@@ -828,137 +880,10 @@ def check_git_file_committed(sandbox_dir: Path, params: dict, trajectory=None) -
         return False, f"git error: {e}"
 
 
-# =============================================================================
-# 结构化数据检查函数
-# =============================================================================
-
-def check_json_path_equals(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
-    """检查 JSON 文件中特定路径的值"""
-    path = params.get('path', '')
-    json_path = params.get('json_path', '')
-    expected = params.get('expected', '')
-
-    full_path = _resolve_path(path, sandbox_dir)
-
-    if not full_path.exists():
-        return False, f"file not found: {path}"
-
-    try:
-        content = json.loads(full_path.read_text(encoding='utf-8'))
-
-        # 解析 JSON 路径 (支持 a.b.c 格式)
-        keys = json_path.split('.')
-        value = content
-        for key in keys:
-            if isinstance(value, dict):
-                value = value.get(key)
-            elif isinstance(value, list) and key.isdigit():
-                value = value[int(key)]
-            else:
-                return False, f"invalid path: {json_path}"
-
-        if str(value) == str(expected):
-            return True, f"json_path '{json_path}' equals '{expected}'"
-        return False, f"json_path '{json_path}' is '{value}', expected '{expected}'"
-    except json.JSONDecodeError as e:
-        return False, f"invalid JSON: {e}"
-    except Exception as e:
-        return False, f"error: {e}"
-
-
-def check_yaml_key_equals(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
-    """检查 YAML 文件中特定键的值"""
-    path = params.get('path', '')
-    key_path = params.get('key_path', '')
-    expected = params.get('expected', '')
-
-    full_path = _resolve_path(path, sandbox_dir)
-
-    if not full_path.exists():
-        return False, f"file not found: {path}"
-
-    try:
-        import yaml
-        content = yaml.safe_load(full_path.read_text(encoding='utf-8'))
-
-        # 解析键路径 (支持 a.b.c 格式)
-        keys = key_path.split('.')
-        value = content
-        for key in keys:
-            if isinstance(value, dict):
-                value = value.get(key)
-            elif isinstance(value, list) and key.isdigit():
-                value = value[int(key)]
-            else:
-                return False, f"invalid key path: {key_path}"
-
-        if str(value) == str(expected):
-            return True, f"yaml_key '{key_path}' equals '{expected}'"
-        return False, f"yaml_key '{key_path}' is '{value}', expected '{expected}'"
-    except ImportError:
-        # 如果没有 yaml 模块，使用简单的字符串匹配
-        content = full_path.read_text(encoding='utf-8')
-        if f"{key_path.split('.')[-1]}: {expected}" in content:
-            return True, f"yaml contains '{key_path}: {expected}' (simple match)"
-        return False, f"yaml does not contain expected value (yaml module not available)"
-    except Exception as e:
-        return False, f"error: {e}"
-
-
 # =============================================================================
 # Plan 模式专用检查函数
 # =============================================================================
 
-def check_file_moved(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
-    """检查文件是否从源位置移动到目标位置"""
-    source = params.get('source', '')
-    destination = params.get('destination', '')
-
-    source_path = _resolve_path(source, sandbox_dir)
-    dest_path = _resolve_path(destination, sandbox_dir)
-
-    source_exists = source_path.exists()
-    dest_exists = dest_path.exists()
-
-    if not source_exists and dest_exists:
-        return True, f"file moved from '{source}' to '{destination}'"
-    elif source_exists and dest_exists:
-        return False, f"file copied (source still exists): {source}"
-    elif source_exists and not dest_exists:
-        return False, f"file not moved (still at source): {source}"
-    else:
-        return False, f"neither source nor destination exists"
-
-
-def check_import_updated(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
-    """检查文件中的导入语句是否已更新"""
-    path = params.get('path', '')
-    old_import = params.get('old_import', '')
-    new_import = params.get('new_import', '')
-
-    full_path = _resolve_path(path, sandbox_dir)
-
-    if not full_path.exists():
-        return False, f"file not found: {path}"
-
-    try:
-        content = full_path.read_text(encoding='utf-8')
-
-        has_old = old_import in content
-        has_new = new_import in content
-
-        if not has_old and has_new:
-            return True, f"import updated from '{old_import}' to '{new_import}'"
-        elif has_old and has_new:
-            return False, f"both old and new imports exist"
-        elif has_old and not has_new:
-            return False, f"import not updated (old import still exists)"
-        else:
-            return False, f"neither old nor new import found"
-    except Exception as e:
-        return False, f"error: {e}"
-
-
 def check_file_not_exists(sandbox_dir: Path, params: dict, trajectory=None) -> Tuple[bool, str]:
     """检查文件不存在"""
     path = params.get('path', '')
@@ -985,7 +910,8 @@ def check_directory_exists(sandbox_dir: Path, params: dict, trajectory=None) ->
 # Check 注册表
 # =============================================================================
 
-CHECK_REGISTRY = {
+# 内置 check；其余 check 族（结构化文档、Plan 模式重构等）在 check_plugins/ 下，按需加载
+CHECKS = {
     # 标准类型
     'file_exists': check_file_exists,
     'file_content_contains': check_file_content_contains,
@@ -1037,13 +963,7 @@ CHECK_REGISTRY = {
     'git_file_staged': check_git_file_staged,
     'git_file_committed': check_git_file_committed,
 
-    # 结构化数据检查
-    'json_path_equals': check_json_path_equals,
-    'yaml_key_equals': check_yaml_key_equals,
-
     # Plan 模式检查
-    'file_moved': check_file_moved,
-    'import_updated': check_import_updated,
     'file_not_exists': check_file_not_exists,
     'directory_exists': check_directory_exists,
 
@@ -1053,6 +973,8 @@ CHECK_REGISTRY = {
     'file_found': check_file_found,
 }
 
+CHECK_REGISTRY = CheckRegistry(CHECKS, __file__)
+
 
 # =============================================================================
 # 便捷函数
@@ -1118,11 +1040,13 @@ if __name__ == '__main__':
         print("Supported check types:")
         for i, t in enumerate(sorted(get_supported_check_types()), 1):
             print(f"  {i:2}. {t}")
-        print(f"\nTotal: {len(CHECK_REGISTRY)} types")
+        print(f"\nTotal: {len(CHECK_REGISTRY)} types (see check_registry.py --fingerprints)")
 
     elif args.test:
         print(f"Testing check type: {args.test}")
         if args.test in CHECK_REGISTRY:
             print(f"  Function: {CHECK_REGISTRY[args.test].__name__}")
+            print(f"  Module: {CHECK_REGISTRY.module_path(args.test).name}")
+            print(f"  Fingerprint: {CHECK_REGISTRY.fingerprint(args.test)}")
         else:
             print(f"  Not found in registry")
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+题库近似重复检测（MinHash + LSH）
+
+同一组槽位批量生成的题目经常是"换皮"克隆：场景相同，只是文件改了名、端口
+换了个数字。本脚本把每个 case 的 Query、环境文件内容和 grader 答案切成
+shingle，计算 MinHash 签名，再用 LSH 分桶找出候选对，只对候选对估计相似度，
+整体耗时与题目数近似线性，几十万道题也可以一次扫完。
+
+归一化规则（让"换皮"落到同一批 shingle 上）:
+- 全部转小写，只保留单词 token
+- 数字统一替换为 #（端口、版本号、PID 微调不影响相似度）
+- 不使用文件路径，只使用文件内容（文件改名不影响相似度）
+
+用法:
+    python3 dedup_cases.py <case_file_or_dir>... [--threshold 0.8] [--num-perm 128]
+                           [--workers 4] [--json] [--output clusters.json]
+
+    目录会递归查找 case.json（--pattern 可修改文件名模式）。
+"""
+import sys
+import os
+import re
+import json
+import argparse
+import hashlib
+import struct
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Iterator, Optional, Tuple
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from answer_scan import collect_answer_tokens
+from blob_store import env_content
+
+
+SHINGLE_SIZE = 3
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN_RE = re.compile(r'\w+')
+_DIGITS_RE = re.compile(r'\d+')
+BUCKET_COMPARE_LIMIT = 32
+
+
+# ============================================================
+# Shingle 与 MinHash
+# ============================================================
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(_DIGITS_RE.sub('#', text.lower()))
+
+
+def case_shingles(case_data: dict, size: int = SHINGLE_SIZE) -> set:
+    """
+    把 case 切成 shingle 集合
+
+    各部分分别切分并加上前缀，避免 Query 的词和环境文件的词拼成跨段 shingle。
+    """
+    sections = [('q', case_data.get('task', {}).get('desc', ''))]
+    for env_file in case_data.get('environment', []):
+        sections.append(('e', env_content(env_file)))
+    answers = ' '.join(t['token'] for t in collect_answer_tokens(case_data.get('graders', [])))
+    sections.append(('a', answers))
+
+    shingles = set()
+    for prefix, text in sections:
+        tokens = _tokens(text)
+        if len(tokens) < size:
+            if tokens:
+                shingles.add(prefix + ' ' + ' '.join(tokens))
+            continue
+        for i in range(len(tokens) - size + 1):
+            shingles.add(prefix + ' ' + ' '.join(tokens[i:i + size]))
+    return shingles
+
+
+class MinHasher:
+    """固定种子的 MinHash：h_i(x) = (a_i * x + b_i) mod p，取低 32 位"""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        self.num_perm = num_perm
+        params = []
+        for i in range(num_perm):
+            digest = hashlib.sha256(f"{seed}:{i}".encode()).digest()
+            a, b = struct.unpack('<QQ', digest[:16])
+            params.append((a % (_MERSENNE_PRIME - 1) + 1, b % _MERSENNE_PRIME))
+        self.params = params
+
+    def signature(self, shingles: set) -> array:
+        values = [struct.unpack('<Q', hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest())[0]
+                  for s in shingles]
+        sig = array('I', [_MAX_HASH] * self.num_perm)
+        if not values:
+            return sig
+        for i, (a, b) in enumerate(self.params):
+            sig[i] = min(((a * v + b) % _MERSENNE_PRIME) & _MAX_HASH for v in values)
+        return sig
+
+
+def estimate_similarity(sig_a: array, sig_b: array) -> float:
+    """签名相同位置的比例即 Jaccard 相似度的估计"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    选择 (bands, rows)：使 S 曲线拐点 (1/b)^(1/r) 最接近阈值
+
+    拐点略低于阈值时宁可多出候选对（之后会用签名复核），不漏掉真正的重复。
+    """
+    best = (num_perm, 1)
+    best_gap = float('inf')
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        knee = (1 / bands) ** (1 / rows)
+        gap = threshold - knee if knee <= threshold else 2 * (knee - threshold)
+        if gap < best_gap:
+            best, best_gap = (bands, rows), gap
+    return best
+
+
+# ============================================================
+# LSH 分桶与聚类
+# ============================================================
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int) -> None:
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+
+def find_clusters(signatures: List[array], threshold: float) -> List[List[Tuple[int, float]]]:
+    """
+    LSH 分桶后只在桶内比较
+
+    新成员与桶内已有成员逐个比较（跳过已在同一簇的成员），每个桶最多保留
+    BUCKET_COMPARE_LIMIT 个成员参与比较，大桶（大量完全相同的题）也保持线性。
+    相似度达到阈值的对用并查集合并，簇是这些对的连通分量：A~B、B~C 时 A、C
+    在同一簇，但 A、C 本身不一定达到阈值（输出的相似度是与代表的估计值）。
+
+    Returns:
+        簇列表，每个簇为 [(下标, 与代表的相似度)]，代表排在第一位，只返回大小 >= 2 的簇
+    """
+    if not signatures:
+        return []
+    bands, rows = lsh_params(threshold, len(signatures[0]))
+    uf = _UnionFind(len(signatures))
+
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = {}
+        start = band * rows
+        for index, sig in enumerate(signatures):
+            members = buckets.setdefault(sig[start:start + rows].tobytes(), [])
+            for other in members:
+                if uf.find(other) != uf.find(index) and \
+                        estimate_similarity(signatures[other], sig) >= threshold:
+                    uf.union(other, index)
+            if len(members) < BUCKET_COMPARE_LIMIT:
+                members.append(index)
+
+    groups: Dict[int, List[int]] = {}
+    for index in range(len(signatures)):
+        groups.setdefault(uf.find(index), []).append(index)
+
+    clusters = []
+    for root, members in groups.items():
+        if len(members) < 2:
+            continue
+        clusters.append([(m, 1.0 if m == root else estimate_similarity(signatures[root], signatures[m]))
+                         for m in members])
+    clusters.sort(key=len, reverse=True)
+    return clusters
+
+
+# ============================================================
+# 输入
+# ============================================================
+
+def iter_case_files(inputs: List[str], pattern: str) -> Iterator[Path]:
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            yield from sorted(path.rglob(pattern))
+        else:
+            yield path
+
+
+_hasher: Optional[MinHasher] = None
+
+
+def _init_worker(num_perm: int) -> None:
+    global _hasher
+    _hasher = MinHasher(num_perm)
+
+
+def _signature_for_file(path: str) -> Tuple[str, str, Optional[bytes]]:
+    """
+    工作进程：读取 case 并返回 (路径, case_id, 签名字节)
+
+    解析失败时签名为 None；没有任何 shingle（Query、环境、答案都为空）时签名为 b''，
+    这类 case 的签名全为最大值，彼此相似度恒为 1.0，不参与聚类。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            case_data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return path, '', None
+    case_id = case_data.get('task', {}).get('id', Path(path).parent.name)
+    shingles = case_shingles(case_data)
+    if not shingles:
+        return path, case_id, b''
+    return path, case_id, _hasher.signature(shingles).tobytes()
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='题库近似重复检测（MinHash + LSH）')
+    parser.add_argument('inputs', nargs='+', help='case.json 文件或目录')
+    parser.add_argument('--pattern', default='case.json', help='目录中查找的文件名模式（默认: case.json）')
+    parser.add_argument('--threshold', type=float, default=0.8, help='相似度阈值（默认: 0.8）')
+    parser.add_argument('--num-perm', type=int, default=128, help='MinHash 签名长度（默认: 128）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='计算签名的进程数')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出簇')
+    parser.add_argument('--output', help='把簇写入 JSON 文件')
+
+    args = parser.parse_args()
+
+    paths = [str(p) for p in iter_case_files(args.inputs, args.pattern)]
+    case_ids: List[str] = []
+    case_paths: List[str] = []
+    signatures: List[array] = []
+    skipped = 0
+    empty: List[Dict[str, str]] = []
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.num_perm,)) as pool:
+        for path, case_id, sig_bytes in pool.map(_signature_for_file, paths, chunksize=64):
+            if sig_bytes is None:
+                skipped += 1
+                continue
+            if not sig_bytes:
+                empty.append({'case_id': case_id, 'path': path})
+                continue
+            sig = array('I')
+            sig.frombytes(sig_bytes)
+            case_paths.append(path)
+            case_ids.append(case_id)
+            signatures.append(sig)
+
+    clusters = find_clusters(signatures, args.threshold)
+    output = [
+        [{'case_id': case_ids[i], 'path': case_paths[i], 'similarity': round(sim, 3)} for i, sim in cluster]
+        for cluster in clusters
+    ]
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+
+    if args.json:
+        print(json.dumps(output, indent=2, ensure_ascii=False))
+        if empty:
+            print(f"Warning: {len(empty)} cases have no content to compare: "
+                  + ', '.join(e['case_id'] for e in empty[:10]), file=sys.stderr)
+    else:
+        for n, cluster in enumerate(output, 1):
+            print(f"Cluster {n} ({len(cluster)} cases)")
+            for member in cluster:
+                print(f"  {member['similarity']:.2f}  {member['case_id']}  {member['path']}")
+        if empty:
+            print(f"\nNo content to compare ({len(empty)} cases, not clustered)")
+            for e in empty:
+                print(f"  {e['case_id']}  {e['path']}")
+        duplicates = sum(len(c) - 1 for c in output)
+        print(f"\n{len(signatures)} cases, {len(output)} clusters, {duplicates} near-duplicates"
+              f" (threshold {args.threshold})" + (f", {skipped} unreadable" if skipped else "")
+              + (f", {len(empty)} empty" if empty else ""))
+
+    sys.exit(1 if output else 0)
+
+
+if __name__ == '__main__':
+    main()
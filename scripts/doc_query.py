@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+结构化文档查询：解析缓存 + 编译后的路径语言
+
+json_path_equals / yaml_key_equals 原本每个 check 都重新读取、解析整个文件，
+且只支持 a.b.0 形式的路径。本模块提供：
+
+1. DocumentCache：一次 grader 评估内按 (路径, mtime, size) 缓存解析结果
+2. 路径语言（编译后缓存），兼容原有的 a.b.0 写法：
+       $.services[0].port          下标（支持负数）
+       services.*.port / [*]       通配
+       services[1:3]               切片 [start:stop:step]
+       services[?(@.name == 'db')] 过滤（== != > >= < <=，或 [?(@.field)] 判断存在）
+       ..port                      递归下降
+       ['key.with.dots']           带特殊字符的键
+3. 同一文档上的多条路径合并成前缀树，一次遍历得到全部结果
+
+使用方式:
+    from doc_query import document_cache, active_cache
+    with document_cache() as cache:
+        cache.prefetch(path, 'json', ['a.b', 'a.c[*]'])
+        matches = active_cache().query(path, 'json', 'a.b')
+"""
+import re
+import json
+import contextvars
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple
+
+
+class PathSyntaxError(ValueError):
+    pass
+
+
+# ============================================================
+# 路径编译
+# ============================================================
+
+_NAME = re.compile(r'[^.\[\]]+')
+_FILTER = re.compile(r'\?\(\s*@((?:\.[^\s!=<>)]+)*)\s*(?:(==|!=|>=|<=|>|<)\s*(.+?))?\s*\)$')
+_SLICE = re.compile(r'(-?\d*):(-?\d*)(?::(-?\d+))?$')
+
+_MISSING = object()
+
+
+def _literal(text: str) -> Any:
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in '\'"':
+        return text[1:-1]
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _parse_bracket(body: str, expr: str) -> tuple:
+    body = body.strip()
+    if body == '*':
+        return ('wildcard',)
+    if len(body) >= 2 and body[0] == body[-1] and body[0] in '\'"':
+        return ('key', body[1:-1])
+    if re.fullmatch(r'-?\d+', body):
+        return ('index', int(body))
+    m = _SLICE.match(body)
+    if m:
+        start, stop, step = (int(g) if g else None for g in m.groups())
+        return ('slice', start, stop, step)
+    m = _FILTER.match(body)
+    if m:
+        subpath = tuple(('key', name) for name in m.group(1).split('.')[1:])
+        op = m.group(2) or 'exists'
+        value = _literal(m.group(3)) if m.group(3) is not None else None
+        return ('filter', subpath, op, value)
+    raise PathSyntaxError(f"invalid bracket expression [{body}] in '{expr}'")
+
+
+@lru_cache(maxsize=1024)
+def compile_path(expr: str) -> 'CompiledPath':
+    """把路径表达式编译为步骤元组（结果缓存）"""
+    steps = []
+    i = 0
+    text = expr.strip()
+    # '$' 后接 '.'、'[' 或结尾时表示根；'$schema' 之类是普通键名
+    if text.startswith('$') and text[1:2] in ('', '.', '['):
+        i = 1
+    while i < len(text):
+        ch = text[i]
+        if text.startswith('..', i):
+            i += 2
+            if i < len(text) and text[i] == '*':
+                steps.append(('descend', None))
+                i += 1
+                continue
+            m = _NAME.match(text, i)
+            if not m:
+                raise PathSyntaxError(f"expected name after '..' in '{expr}'")
+            steps.append(('descend', m.group()))
+            i = m.end()
+        elif ch == '.':
+            i += 1
+        elif ch == '[':
+            depth = 0
+            quote = None
+            j = i
+            while j < len(text):
+                c = text[j]
+                if quote:
+                    if c == quote:
+                        quote = None
+                elif c in '\'"':
+                    quote = c
+                elif c == '[':
+                    depth += 1
+                elif c == ']':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            if j >= len(text):
+                raise PathSyntaxError(f"unterminated '[' in '{expr}'")
+            steps.append(_parse_bracket(text[i + 1:j], expr))
+            i = j + 1
+        else:
+            m = _NAME.match(text, i)
+            if not m:
+                raise PathSyntaxError(f"unexpected '{ch}' at {i} in '{expr}'")
+            name = m.group()
+            steps.append(('wildcard',) if name == '*' else ('key', name))
+            i = m.end()
+    return CompiledPath(expr, tuple(steps))
+
+
+def _children(value: Any) -> List[Any]:
+    if isinstance(value, dict):
+        return list(value.values())
+    if isinstance(value, list):
+        return value
+    return []
+
+
+def _compare(actual: Any, op: str, expected: Any) -> bool:
+    if op == 'exists':
+        return actual is not _MISSING
+    if actual is _MISSING:
+        return False
+    if op in ('==', '!='):
+        equal = actual == expected or str(actual) == str(expected)
+        return equal if op == '==' else not equal
+    try:
+        a, b = float(actual), float(expected)
+    except (TypeError, ValueError):
+        a, b = str(actual), str(expected)
+    return {'>': a > b, '>=': a >= b, '<': a < b, '<=': a <= b}[op]
+
+
+def _resolve_single(value: Any, steps: Sequence[tuple]) -> Any:
+    for step in steps:
+        value = _apply_step(step, [value])
+        if not value:
+            return _MISSING
+        value = value[0]
+    return value
+
+
+def _apply_step(step: tuple, values: List[Any]) -> List[Any]:
+    """对当前结果集应用一个步骤"""
+    kind = step[0]
+    out: List[Any] = []
+    for value in values:
+        if kind == 'key':
+            name = step[1]
+            if isinstance(value, dict):
+                if name in value:
+                    out.append(value[name])
+            elif isinstance(value, list) and re.fullmatch(r'-?\d+', name):
+                # 兼容 a.b.0 写法
+                index = int(name)
+                if -len(value) <= index < len(value):
+                    out.append(value[index])
+        elif kind == 'index':
+            if isinstance(value, list) and -len(value) <= step[1] < len(value):
+                out.append(value[step[1]])
+        elif kind == 'wildcard':
+            out.extend(_children(value))
+        elif kind == 'slice':
+            if isinstance(value, list):
+                out.extend(value[slice(step[1], step[2], step[3])])
+        elif kind == 'filter':
+            _, subpath, op, expected = step
+            out.extend(item for item in _children(value)
+                       if _compare(_resolve_single(item, subpath), op, expected))
+        elif kind == 'descend':
+            name = step[1]
+            stack = [value]
+            while stack:
+                node = stack.pop()
+                if isinstance(node, dict):
+                    if name is None:
+                        out.extend(node.values())
+                    elif name in node:
+                        out.append(node[name])
+                    stack.extend(reversed(list(node.values())))
+                elif isinstance(node, list):
+                    if name is None:
+                        out.extend(node)
+                    stack.extend(reversed(node))
+    return out
+
+
+class CompiledPath:
+    """编译后的路径"""
+
+    def __init__(self, expr: str, steps: Tuple[tuple, ...]):
+        self.expr = expr
+        self.steps = steps
+        # 只含键 / 下标的路径最多一个结果，check 按单值语义比较
+        self.singular = all(step[0] in ('key', 'index') for step in steps)
+
+    def find(self, document: Any) -> List[Any]:
+        values = [document]
+        for step in self.steps:
+            values = _apply_step(step, values)
+            if not values:
+                break
+        return values
+
+
+def query_many(document: Any, paths: Sequence[CompiledPath]) -> Dict[str, List[Any]]:
+    """
+    多条路径一次遍历：按步骤建前缀树，公共前缀只计算一次
+
+    Returns:
+        {表达式: 匹配值列表}
+    """
+    trie: Dict[str, Any] = {'children': {}, 'ends': []}
+    for path in paths:
+        node = trie
+        for step in path.steps:
+            node = node['children'].setdefault(step, {'children': {}, 'ends': []})
+        node['ends'].append(path.expr)
+
+    results: Dict[str, List[Any]] = {}
+    stack = [(trie, [document])]
+    while stack:
+        node, values = stack.pop()
+        for expr in node['ends']:
+            results[expr] = values
+        for step, child in node['children'].items():
+            stack.append((child, _apply_step(step, values) if values else []))
+    return results
+
+
+# ============================================================
+# 文档缓存
+# ============================================================
+
+def _parse(full_path: Path, fmt: str) -> Any:
+    text = full_path.read_text(encoding='utf-8')
+    if fmt == 'yaml':
+        import yaml
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+
+class DocumentCache:
+    """一次评估内的解析缓存与查询结果缓存"""
+
+    def __init__(self):
+        self._documents: Dict[tuple, Any] = {}
+        self._results: Dict[tuple, List[Any]] = {}
+        self._memo: Dict[tuple, Any] = {}
+        self.parses = 0
+
+    def _key(self, full_path: Path, fmt: str) -> tuple:
+        st = full_path.stat()
+        return (str(full_path), fmt, st.st_mtime_ns, st.st_size)
+
+    def load(self, full_path: Path, fmt: str) -> Any:
+        """读取并解析文档（文件变化后自动重新解析）"""
+        key = self._key(full_path, fmt)
+        if key not in self._documents:
+            self._documents[key] = _parse(full_path, fmt)
+            self.parses += 1
+        return self._documents[key]
+
+    def prefetch(self, full_path: Path, fmt: str, exprs: Sequence[str]) -> None:
+        """一次遍历算出同一文档上全部路径的结果"""
+        key = self._key(full_path, fmt)
+        document = self.load(full_path, fmt)
+        paths = [compile_path(expr) for expr in exprs]
+        for expr, values in query_many(document, paths).items():
+            self._results[key + (expr,)] = values
+
+    def query(self, full_path: Path, fmt: str, expr: str) -> List[Any]:
+        key = self._key(full_path, fmt) + (expr,)
+        if key not in self._results:
+            self._results[key] = compile_path(expr).find(self.load(full_path, fmt))
+        return self._results[key]
+
+    def memo(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        """评估内共享的其它派生索引（如沙箱导入图），按 key 只构建一次"""
+        if key not in self._memo:
+            self._memo[key] = factory()
+        return self._memo[key]
+
+
+_active: contextvars.ContextVar[Optional[DocumentCache]] = contextvars.ContextVar('doc_query_cache', default=None)
+
+
+@contextmanager
+def document_cache():
+    """在 with 块内启用一个共享的 DocumentCache"""
+    cache = DocumentCache()
+    token = _active.set(cache)
+    try:
+        yield cache
+    finally:
+        _active.reset(token)
+
+
+def active_cache() -> DocumentCache:
+    """当前评估的缓存；不在 document_cache() 内时返回一次性缓存"""
+    return _active.get() or DocumentCache()
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+离线 claude CLI 替身
+
+模拟 `claude --output-format stream-json` 的输出协议，按录制或脚本化的会话
+逐轮回放工具调用，并在当前目录（即 haiku_space）中真实执行这些工具。
+用于在无网络、无模型的机器上压测和回归 phase6 的并发、流式解析、超时与评分流程。
+
+用法:
+    python3 fake_claude.py --output-format stream-json --verbose -p <query> [--session <file>] [--latency <sec>]
+
+    # 作为 phase6 的 claude 替身
+    FAKE_CLAUDE_SESSION=/abs/path/case.json \\
+        python3 phase6_haiku.py case.json --claude-bin "python3 /abs/path/scripts/fake_claude.py"
+
+会话来源（--session 或环境变量 FAKE_CLAUDE_SESSION，路径需为绝对路径）:
+    *.jsonl                     录制的 stream-json 输出，回放其中每条 assistant 消息
+    {"turns": [...]}            脚本化会话
+    {"reference_solution": ...} 直接把 case.json 的 reference_solution 当作会话（每步一轮）
+
+脚本化会话格式:
+    {
+      "turns": [
+        {"text": "先看看配置", "tool_calls": [{"name": "Read", "input": {"file_path": "config.yaml"}}], "latency": 0.2}
+      ],
+      "result": "已修复",
+      "exit_code": 0
+    }
+
+其他环境变量:
+    FAKE_CLAUDE_LATENCY  每轮延迟秒数（默认 0，turn 内 latency 优先）
+    FAKE_CLAUDE_JITTER   延迟抖动幅度（秒，均匀分布 ±jitter）
+    FAKE_CLAUDE_SEED     抖动随机种子（默认 0，保证可复现）
+"""
+import sys
+import os
+import json
+import argparse
+import subprocess
+import signal
+import random
+import time
+import re
+import fnmatch
+import uuid
+from pathlib import Path
+from typing import Tuple, List, Dict, Any, Optional
+
+
+FAKE_CLAUDE_VERSION = '0.0.0'
+
+
+# ============================================================
+# 会话加载
+# ============================================================
+
+def _load_recorded_session(path: Path) -> Dict[str, Any]:
+    """把录制的 stream-json 输出转换为脚本化会话"""
+    turns = []
+    result_text = ''
+
+    for line in path.read_text(encoding='utf-8').splitlines():
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+
+        event_type = event.get('type', '')
+        if event_type == 'assistant':
+            texts = []
+            tool_calls = []
+            for block in event.get('message', {}).get('content', []):
+                if block.get('type') == 'text':
+                    texts.append(block.get('text', ''))
+                elif block.get('type') == 'tool_use':
+                    tool_calls.append({'name': block.get('name', ''), 'input': block.get('input', {})})
+            turns.append({'text': '\n'.join(texts), 'tool_calls': tool_calls})
+        elif event_type == 'result':
+            result_text = event.get('result', '')
+
+    return {'turns': turns, 'result': result_text}
+
+
+def _session_from_reference_solution(case_data: dict) -> Dict[str, Any]:
+    """把 reference_solution 的每一步作为一轮工具调用"""
+    turns = []
+    for action in case_data.get('reference_solution', []):
+        turns.append({
+            'text': action.get('reasoning', ''),
+            'tool_calls': [{'name': action.get('tool', ''), 'input': action.get('input', {})}]
+        })
+    return {'turns': turns, 'result': 'Done.'}
+
+
+def load_session(path: Path) -> Dict[str, Any]:
+    """
+    加载会话文件
+
+    Args:
+        path: 会话文件路径（.jsonl 录制 / .json 脚本 / case.json）
+
+    Returns:
+        脚本化会话 {"turns": [...], "result": str, "exit_code": int}
+    """
+    if path.suffix == '.jsonl':
+        return _load_recorded_session(path)
+
+    data = json.loads(path.read_text(encoding='utf-8'))
+    if 'turns' in data:
+        return data
+    if 'reference_solution' in data:
+        return _session_from_reference_solution(data)
+    raise ValueError(f"unrecognized session format: {path}")
+
+
+# ============================================================
+# 工具执行
+# ============================================================
+
+class ToolExecutor:
+    """在 cwd 中执行工具调用，输出格式尽量贴近真实 CLI"""
+
+    def __init__(self, cwd: Path):
+        self.cwd = cwd
+        self.shells: Dict[str, subprocess.Popen] = {}
+
+    def _path(self, file_path: str) -> Path:
+        file_path = file_path.replace('{{SANDBOX}}/', '').replace('{{SANDBOX}}', '')
+        p = Path(file_path) if file_path else self.cwd
+        return p if p.is_absolute() else self.cwd / p
+
+    def execute(self, name: str, tool_input: dict) -> Tuple[str, bool]:
+        """
+        执行一次工具调用
+
+        Returns:
+            (output, is_error)
+        """
+        handler = getattr(self, f"_tool_{name}", None)
+        if handler is None:
+            if 'web_search' in name:
+                handler = self._tool_web_search
+            else:
+                return f"Error: No such tool available: {name}", True
+        try:
+            return handler(tool_input)
+        except Exception as e:
+            return f"Error: {e}", True
+
+    def _tool_Read(self, tool_input: dict) -> Tuple[str, bool]:
+        full_path = self._path(tool_input.get('file_path', ''))
+        if not full_path.is_file():
+            return f"File does not exist: {full_path}", True
+        offset = int(tool_input.get('offset', 1) or 1)
+        limit = int(tool_input.get('limit', 2000) or 2000)
+        lines = full_path.read_text(encoding='utf-8', errors='replace').splitlines()
+        selected = lines[offset - 1:offset - 1 + limit]
+        return '\n'.join(f"{i:6}\t{line}" for i, line in enumerate(selected, offset)), False
+
+    def _tool_Write(self, tool_input: dict) -> Tuple[str, bool]:
+        full_path = self._path(tool_input.get('file_path', ''))
+        content = tool_input.get('content', '')
+        existed = full_path.exists()
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_text(content, encoding='utf-8')
+        verb = 'updated' if existed else 'created'
+        return f"File {verb} successfully at: {full_path}", False
+
+    def _tool_Edit(self, tool_input: dict) -> Tuple[str, bool]:
+        full_path = self._path(tool_input.get('file_path', ''))
+        old_string = tool_input.get('old_string', '')
+        new_string = tool_input.get('new_string', '')
+        replace_all = tool_input.get('replace_all', False)
+
+        if not full_path.is_file():
+            return f"File does not exist: {full_path}", True
+        content = full_path.read_text(encoding='utf-8')
+        count = content.count(old_string) if old_string else 0
+        if count == 0:
+            return f"String to replace not found in file.\nString: {old_string}", True
+        if count > 1 and not replace_all:
+            return (f"Found {count} matches of the string to replace, but replace_all is false. "
+                    f"String: {old_string}"), True
+
+        full_path.write_text(content.replace(old_string, new_string), encoding='utf-8')
+        return f"The file {full_path} has been updated.", False
+
+    def _tool_Bash(self, tool_input: dict) -> Tuple[str, bool]:
+        command = tool_input.get('command', '')
+        if tool_input.get('run_in_background') or tool_input.get('background'):
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                cwd=str(self.cwd),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True
+            )
+            shell_id = f"bash_{len(self.shells) + 1}"
+            self.shells[shell_id] = process
+            return f"Command running in background with ID: {shell_id}", False
+
+        timeout = tool_input.get('timeout', 120000) / 1000
+        try:
+            result = subprocess.run(
+                command,
+                shell=True,
+                cwd=str(self.cwd),
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            return f"Command timed out after {timeout:.0f}s", True
+        output = (result.stdout + result.stderr).rstrip('\n')
+        return output, result.returncode != 0
+
+    def _tool_KillShell(self, tool_input: dict) -> Tuple[str, bool]:
+        shell_id = tool_input.get('shell_id', '')
+        pid_file = tool_input.get('pid_file', '')
+
+        if shell_id in self.shells:
+            process = self.shells.pop(shell_id)
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            return f"Successfully killed shell: {shell_id}", False
+
+        if pid_file:
+            pid_path = self._path(pid_file)
+            if not pid_path.exists():
+                return f"PID file not found: {pid_file}", True
+            pid = int(pid_path.read_text().strip())
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            pid_path.unlink()
+            return f"Successfully killed process: {pid}", False
+
+        return f"No shell found with ID: {shell_id}", True
+
+    def _walk(self, base: Path):
+        for root, dirs, files in os.walk(base):
+            dirs[:] = [d for d in dirs if d != '.git']
+            for name in files:
+                yield Path(root) / name
+
+    def _tool_Glob(self, tool_input: dict) -> Tuple[str, bool]:
+        base = self._path(tool_input.get('path', ''))
+        pattern = tool_input.get('pattern', '**/*')
+        matches = sorted(str(p) for p in base.glob(pattern) if p.is_file())
+        if not matches:
+            return "No files found", False
+        return '\n'.join(matches), False
+
+    def _tool_Grep(self, tool_input: dict) -> Tuple[str, bool]:
+        base = self._path(tool_input.get('path', ''))
+        flags = re.IGNORECASE if tool_input.get('-i') else 0
+        regex = re.compile(tool_input.get('pattern', ''), flags)
+        file_glob = tool_input.get('glob', '')
+        output_mode = tool_input.get('output_mode', 'files_with_matches')
+
+        files = [base] if base.is_file() else self._walk(base)
+        matched_files = []
+        matched_lines = []
+        for f in files:
+            if file_glob and not fnmatch.fnmatch(f.name, file_glob):
+                continue
+            try:
+                lines = f.read_text(encoding='utf-8', errors='replace').splitlines()
+            except OSError:
+                continue
+            hits = [(i, line) for i, line in enumerate(lines, 1) if regex.search(line)]
+            if hits:
+                matched_files.append(str(f))
+                matched_lines.extend(f"{f}:{i}:{line}" for i, line in hits)
+
+        if output_mode == 'content':
+            return '\n'.join(matched_lines) or "No matches found", False
+        if not matched_files:
+            return "No files found", False
+        return f"Found {len(matched_files)} files\n" + '\n'.join(matched_files), False
+
+    def _tool_WebFetch(self, tool_input: dict) -> Tuple[str, bool]:
+        return f"[offline] WebFetch not available for {tool_input.get('url', '')}", False
+
+    def _tool_web_search(self, tool_input: dict) -> Tuple[str, bool]:
+        return f"[offline] web_search not available for {tool_input.get('query', '')}", False
+
+    def _tool_TodoWrite(self, tool_input: dict) -> Tuple[str, bool]:
+        return "Todos have been modified successfully.", False
+
+    def cleanup(self) -> None:
+        """终止所有仍在运行的后台 shell"""
+        for process in self.shells.values():
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+# ============================================================
+# stream-json 输出
+# ============================================================
+
+def _emit(event: dict) -> None:
+    sys.stdout.write(json.dumps(event, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+
+def _usage(text: str, output_text: str) -> Dict[str, int]:
+    """按字符数粗略估算 token 用量（约 4 字符 / token）"""
+    return {
+        'input_tokens': max(1, len(text) // 4),
+        'output_tokens': max(1, len(output_text) // 4),
+        'cache_creation_input_tokens': 0,
+        'cache_read_input_tokens': 0
+    }
+
+
+def run_session(session: Dict[str, Any], query: str, cwd: Path, model: str,
+                latency: float, jitter: float, seed: int) -> int:
+    """
+    回放会话，逐轮输出 stream-json 事件
+
+    Returns:
+        进程退出码
+    """
+    session_id = str(uuid.uuid4())
+    rng = random.Random(seed)
+    executor = ToolExecutor(cwd)
+    start_time = time.time()
+    context = query
+    tool_counter = 0
+
+    _emit({
+        'type': 'system',
+        'subtype': 'init',
+        'cwd': str(cwd),
+        'session_id': session_id,
+        'model': model,
+        'tools': ['Bash', 'Edit', 'Glob', 'Grep', 'KillShell', 'Read', 'WebFetch', 'Write'],
+        'permissionMode': 'bypassPermissions'
+    })
+
+    turns = session.get('turns', [])
+    try:
+        for turn_index, turn in enumerate(turns, 1):
+            delay = turn.get('latency', latency)
+            if jitter:
+                delay = max(0.0, delay + rng.uniform(-jitter, jitter))
+            if delay:
+                time.sleep(delay)
+
+            content = []
+            if turn.get('text'):
+                content.append({'type': 'text', 'text': turn['text']})
+            tool_uses = []
+            for call in turn.get('tool_calls', []):
+                tool_counter += 1
+                block = {
+                    'type': 'tool_use',
+                    'id': f"toolu_fake_{tool_counter:04d}",
+                    'name': call.get('name', ''),
+                    'input': call.get('input', {})
+                }
+                content.append(block)
+                tool_uses.append(block)
+
+            output_text = json.dumps(content, ensure_ascii=False)
+            _emit({
+                'type': 'assistant',
+                'message': {
+                    'id': f"msg_fake_{turn_index:04d}",
+                    'type': 'message',
+                    'role': 'assistant',
+                    'model': model,
+                    'content': content,
+                    'usage': _usage(context, output_text)
+                },
+                'session_id': session_id
+            })
+            context += output_text
+
+            if not tool_uses:
+                continue
+
+            results = []
+            for block in tool_uses:
+                output, is_error = executor.execute(block['name'], block['input'])
+                results.append({
+                    'type': 'tool_result',
+                    'tool_use_id': block['id'],
+                    'content': output,
+                    'is_error': is_error
+                })
+                context += output
+
+            _emit({
+                'type': 'user',
+                'message': {'role': 'user', 'content': results},
+                'session_id': session_id
+            })
+    finally:
+        executor.cleanup()
+
+    exit_code = session.get('exit_code', 0)
+    _emit({
+        'type': 'result',
+        'subtype': 'success' if exit_code == 0 else 'error_during_execution',
+        'is_error': exit_code != 0,
+        'duration_ms': int((time.time() - start_time) * 1000),
+        'num_turns': len(turns),
+        'result': session.get('result', ''),
+        'session_id': session_id,
+        'total_cost_usd': 0.0
+    })
+    return exit_code
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='离线 claude CLI 替身（stream-json 回放）')
+    parser.add_argument('-p', '--print', dest='query', default='', help='用户问题')
+    parser.add_argument('--model', default='haiku', help='模型名（仅回显）')
+    parser.add_argument('--output-format', default='stream-json', help='仅支持 stream-json')
+    parser.add_argument('--verbose', action='store_true', help='兼容参数')
+    parser.add_argument('--dangerously-skip-permissions', action='store_true', help='兼容参数')
+    parser.add_argument('--session', default=os.environ.get('FAKE_CLAUDE_SESSION', ''), help='会话文件路径')
+    parser.add_argument('--latency', type=float, default=float(os.environ.get('FAKE_CLAUDE_LATENCY', 0)),
+                        help='每轮延迟秒数')
+    parser.add_argument('--jitter', type=float, default=float(os.environ.get('FAKE_CLAUDE_JITTER', 0)),
+                        help='延迟抖动秒数')
+    parser.add_argument('--seed', type=int, default=int(os.environ.get('FAKE_CLAUDE_SEED', 0)), help='随机种子')
+    parser.add_argument('--version', action='store_true', help='输出版本号')
+
+    args, _ = parser.parse_known_args()
+
+    if args.version:
+        print(f"{FAKE_CLAUDE_VERSION} (fake_claude replay)")
+        return
+
+    if args.output_format != 'stream-json':
+        print(f"Error: only stream-json output is supported, got {args.output_format}", file=sys.stderr)
+        sys.exit(2)
+
+    if not args.session:
+        print("Error: no session given (use --session or FAKE_CLAUDE_SESSION)", file=sys.stderr)
+        sys.exit(2)
+
+    try:
+        session = load_session(Path(args.session))
+    except (OSError, ValueError) as e:
+        print(f"Error: failed to load session: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    exit_code = run_session(session, args.query, Path.cwd(), args.model,
+                            args.latency, args.jitter, args.seed)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
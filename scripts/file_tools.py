@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Read / Edit 工具仿真（按字节处理，不解码整个文件）
+
+execute_reference_solution 原来的 Edit 是 read_text → replace → write_text，
+200 MB 的日志要在内存里放三份；而且会替换所有出现位置，和真实 Edit 工具
+"old_string 必须唯一（除非 replace_all）"的规则不一致。
+
+本模块：
+- Edit：在 mmap 上查找 old_string 并确认唯一，把拼接结果分块写入临时文件后
+  rename 覆盖（保留权限位），内存占用与文件大小无关
+- Read：按 offset / limit（行号，默认前 2000 行）报告读取的行范围和文件大小，
+  只按块统计换行，不解码
+
+使用方式:
+    from file_tools import read_file, edit_file
+    ok, message = edit_file(full_path, old_string, new_string, replace_all=False)
+    ok, message = read_file(full_path, offset=None, limit=None)
+"""
+import os
+import mmap
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple
+
+CHUNK_SIZE = 1 << 20
+DEFAULT_READ_LIMIT = 2000
+
+
+def _format_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} MB"
+    if size >= 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size} B"
+
+
+class _Mapped:
+    """只读映射文件内容；空文件不能 mmap，用 b'' 代替"""
+
+    def __init__(self, full_path: Path):
+        self._file = open(full_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __enter__(self):
+        return self.buf
+
+    def __exit__(self, *exc):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self._file.close()
+
+
+def _count_lines(buf, end: Optional[int] = None) -> int:
+    end = len(buf) if end is None else end
+    count = 0
+    for start in range(0, end, CHUNK_SIZE):
+        count += buf[start:min(start + CHUNK_SIZE, end)].count(b'\n')
+    return count
+
+
+def _find_all(buf, needle: bytes, limit: Optional[int] = None) -> list:
+    """needle 的不重叠出现位置（最多 limit 个）"""
+    positions = []
+    pos = buf.find(needle)
+    while pos >= 0:
+        positions.append(pos)
+        if limit is not None and len(positions) >= limit:
+            break
+        pos = buf.find(needle, pos + len(needle))
+    return positions
+
+
+def read_file(full_path: Path, offset: Optional[int] = None, limit: Optional[int] = None) -> Tuple[bool, str]:
+    """
+    仿真 Read：报告行范围和大小
+
+    Args:
+        full_path: 文件路径
+        offset: 起始行号（1 起，默认 1）
+        limit: 读取行数（默认 2000）
+    """
+    if not full_path.is_file():
+        return False, f"File not found: {full_path.name}"
+    start_line = max(int(offset or 1), 1)
+    limit = int(limit or DEFAULT_READ_LIMIT)
+    with _Mapped(full_path) as buf:
+        size = len(buf)
+        total = _count_lines(buf) + (1 if size and buf[size - 1:size] != b'\n' else 0)
+    if not total:
+        return True, f"0 lines ({_format_size(size)})"
+    if start_line > total:
+        return False, f"offset {start_line} beyond end of file ({total} lines)"
+    end_line = min(start_line + limit - 1, total)
+    return True, f"lines {start_line}-{end_line} of {total} ({_format_size(size)})"
+
+
+def edit_file(full_path: Path, old_string: str, new_string: str,
+              replace_all: bool = False) -> Tuple[bool, str]:
+    """
+    仿真 Edit：old_string 必须存在且唯一（replace_all 时替换全部）
+
+    文件中是 CRLF 换行而 old_string 用 LF 时，按 CRLF 匹配和写入。
+    """
+    if not full_path.is_file():
+        return False, "File not found"
+    if not old_string:
+        return False, "old_string is empty"
+    if old_string == new_string:
+        return False, "old_string and new_string are identical"
+
+    old = old_string.encode('utf-8')
+    new = new_string.encode('utf-8')
+    with _Mapped(full_path) as buf:
+        positions = _find_all(buf, old, None if replace_all else 2)
+        if not positions and b'\n' in old and buf.find(b'\r\n') >= 0:
+            old = old.replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+            new = new.replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+            positions = _find_all(buf, old, None if replace_all else 2)
+        if not positions:
+            return False, "old_string not found"
+        if len(positions) > 1 and not replace_all:
+            line = _count_lines(buf, positions[0]) + 1
+            return False, f"old_string is not unique (first at line {line}); add context or use replace_all"
+
+        fd, tmp = tempfile.mkstemp(prefix='.edit_', dir=str(full_path.parent))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                cursor = 0
+                for pos in positions:
+                    for start in range(cursor, pos, CHUNK_SIZE):
+                        out.write(buf[start:min(start + CHUNK_SIZE, pos)])
+                    out.write(new)
+                    cursor = pos + len(old)
+                for start in range(cursor, len(buf), CHUNK_SIZE):
+                    out.write(buf[start:start + CHUNK_SIZE])
+            shutil.copymode(full_path, tmp)
+            os.replace(tmp, full_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    count = len(positions)
+    return True, f"replaced {count} occurrence{'s' if count > 1 else ''}"
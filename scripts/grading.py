@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Grader 验证公共模块
+
+phase4_verify.py、phase6_haiku.py 和 pipeline.py 共用的 grader 执行逻辑：
+state_check 逐项调用 custom_checks.py 中的检查函数，tool_calls 按工具名和参数规范匹配轨迹。
+
+一批 rollout 的评分见 batch_grading.py（复用 run_check / match_step_params）。
+
+使用方式:
+    from grading import verify_graders, grader_result_to_dict
+    result = verify_graders(case_data, sandbox_dir, trajectory)
+"""
+import re
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable
+
+from custom_checks import CHECK_REGISTRY
+from doc_query import document_cache
+
+
+# ============================================================
+# Grader 验证
+# ============================================================
+
+def match_param_value(actual_value, match_spec) -> bool:
+    """
+    检查参数值是否匹配规范
+
+    Args:
+        actual_value: 实际的参数值
+        match_spec: 匹配规范，可以是：
+            - 字符串：等同于 {"match": "exact", "value": "..."}
+            - dict：{"match": "exact|contains|regex|any", "value": "..."}
+
+    Returns:
+        是否匹配
+    """
+    if isinstance(match_spec, str):
+        # 简化写法：字符串默认为精确匹配
+        return str(actual_value) == match_spec
+
+    match_type = match_spec.get('match', 'exact')
+    expected_value = match_spec.get('value', '')
+    actual_str = str(actual_value) if actual_value is not None else ''
+
+    if match_type == 'exact':
+        return actual_str == expected_value
+    elif match_type == 'contains':
+        return expected_value in actual_str
+    elif match_type == 'regex':
+        try:
+            return bool(re.search(expected_value, actual_str))
+        except re.error:
+            return False
+    elif match_type == 'any':
+        return True  # 不检查参数值
+    else:
+        return False
+
+
+def match_step_params(step_input: dict, params_spec: Dict[str, Any]) -> bool:
+    """工具调用的 input 是否满足 tool_calls 要求中的每个参数规范"""
+    for param_name, match_spec in params_spec.items():
+        if not match_param_value(step_input.get(param_name), match_spec):
+            return False
+    return True
+
+
+class CheckResult:
+    """单个检查的结果"""
+    def __init__(self, check_type: str, passed: bool, message: str, description: str = "",
+                 duration_ms: float = 0.0, fingerprint: str = ""):
+        self.check_type = check_type
+        self.passed = passed
+        self.message = message
+        self.description = description
+        self.duration_ms = duration_ms
+        self.fingerprint = fingerprint    # check 实现的内容指纹，实现变化后旧结果即失效
+
+
+class GraderResult:
+    """Grader 验证结果"""
+    def __init__(self):
+        self.passed = False
+        self.total_checks = 0
+        self.passed_checks = 0
+        self.failed_checks = 0
+        self.tool_calls_verified = False
+        self.tool_calls_details = []
+        self.results: List[CheckResult] = []
+
+
+def run_check(check: dict, work_dir: Path, trajectory: List[Dict]) -> CheckResult:
+    """执行单个 state_check 项（调用 custom_checks.py / 插件中的检查函数）"""
+    check_type = check.get('check', '')
+    params = check.get('params', {})
+    description = check.get('description', '')
+
+    check_start = time.perf_counter()
+    fingerprint = ""
+    if check_type in CHECK_REGISTRY:
+        check_func = CHECK_REGISTRY[check_type]
+        fingerprint = CHECK_REGISTRY.fingerprint(check_type)
+        try:
+            passed, message = check_func(work_dir, params, trajectory)
+        except Exception as e:
+            passed, message = False, f"Check error: {e}"
+    else:
+        passed, message = False, f"Unknown check type: {check_type}"
+    duration_ms = (time.perf_counter() - check_start) * 1000
+
+    return CheckResult(check_type, passed, message, description, duration_ms, fingerprint)
+
+
+def verify_graders(case_data: dict, work_dir: Path, trajectory: List[Dict],
+                   on_check: Optional[Callable[[CheckResult], None]] = None) -> GraderResult:
+    """
+    执行 grader 验证
+
+    Args:
+        case_data: 测试用例数据
+        work_dir: 工作目录
+        trajectory: 执行轨迹
+        on_check: 可选回调，每完成一个 state_check 调用一次（用于流式输出）
+
+    Returns:
+        GraderResult 验证结果
+    """
+    # 结构化文档在本次评估内只解析一次，同一文件上的路径 check 一次遍历算完
+    with document_cache():
+        return _verify_graders(case_data, work_dir, trajectory, on_check)
+
+
+def _verify_graders(case_data: dict, work_dir: Path, trajectory: List[Dict],
+                    on_check: Optional[Callable[[CheckResult], None]]) -> GraderResult:
+    result = GraderResult()
+    graders = case_data.get('graders', [])
+
+    for grader in graders:
+        grader_type = grader.get('type', '')
+
+        if grader_type == 'state_check':
+            checks = grader.get('checks', [])
+            CHECK_REGISTRY.prefetch(checks, work_dir)
+            for check in checks:
+                result.total_checks += 1
+                check_result = run_check(check, work_dir, trajectory)
+                if check_result.passed:
+                    result.passed_checks += 1
+                else:
+                    result.failed_checks += 1
+
+                result.results.append(check_result)
+                if on_check is not None:
+                    on_check(check_result)
+
+        elif grader_type == 'tool_calls':
+            required = grader.get('required', [])
+
+            all_verified = True
+            for req in required:
+                tool = req.get('tool', '')
+                params_spec = req.get('params', {})
+                desc = req.get('description', '')
+
+                verified = False
+                matched_step = None
+
+                for step in trajectory:
+                    if step.get('tool') != tool:
+                        continue
+
+                    # 如果没有参数要求，只要工具匹配就通过（向后兼容）
+                    if not params_spec:
+                        verified = True
+                        matched_step = step
+                        break
+
+                    # 检查每个参数是否匹配
+                    if match_step_params(step.get('input', {}), params_spec):
+                        verified = True
+                        matched_step = step
+                        break
+
+                if not verified:
+                    all_verified = False
+
+                result.tool_calls_details.append({
+                    'tool': tool,
+                    'description': desc,
+                    'verified': verified,
+                    'params_spec': params_spec if params_spec else None,
+                    'matched_step': matched_step.get('step') if matched_step else None
+                })
+
+            result.tool_calls_verified = all_verified
+
+    # 计算总体是否通过
+    result.passed = (result.failed_checks == 0) and result.tool_calls_verified
+
+    return result
+
+
+def grader_result_to_dict(result: GraderResult) -> Dict[str, Any]:
+    """把 GraderResult 转换为结果文件中的 grader_result 字段"""
+    return {
+        'passed': result.passed,
+        'total_checks': result.total_checks,
+        'passed_checks': result.passed_checks,
+        'failed_checks': result.failed_checks,
+        'tool_calls_verified': result.tool_calls_verified,
+        'tool_calls_details': result.tool_calls_details,
+        'details': [
+            {
+                'check_type': r.check_type,
+                'passed': r.passed,
+                'message': r.message,
+                'description': r.description,
+                'duration_ms': round(r.duration_ms, 3),
+                'fingerprint': r.fingerprint
+            }
+            for r in result.results
+        ]
+    }
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+沙箱模块依赖图
+
+Plan 模式的移动 / 重命名题目需要回答"还有没有文件在导入旧模块"，逐文件做子串
+匹配既慢又不准（注释、字符串、别名都会干扰）。本模块一次遍历沙箱，解析
+Python（ast，语法错误时退回逐行扫描）和 JS/TS（import / export from / require /
+动态 import）的导入语句，建立双向索引，之后每次查询都是字典查找。
+
+模块键:
+    Python  点分模块名，如 src.utils.date_utils（from a import b 同时记 a 和 a.b）
+    JS/TS   相对导入解析为去掉扩展名的沙箱相对路径，如 src/utils/date；
+            包导入保留原样，如 lodash
+
+使用方式:
+    from import_graph import get_import_graph
+    graph = get_import_graph(sandbox_dir)          # 同一次评估内只构建一次
+    graph.importers(module='src.utils.date_utils')
+    graph.importers(path='src/utils/date.ts')
+    graph.imports_of('src/main.py')
+
+命令行:
+    python3 import_graph.py <sandbox_dir> [--importers <module_or_path>] [--imports <file>]
+"""
+import os
+import re
+import ast
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from doc_query import active_cache
+
+
+PY_SUFFIXES = ('.py',)
+JS_SUFFIXES = ('.ts', '.tsx', '.js', '.jsx', '.mjs', '.cjs')
+SKIP_DIRS = {'.git', 'node_modules', '__pycache__', '.venv', 'venv', 'dist', 'build'}
+
+_PY_IMPORT_LINE = re.compile(r'^\s*(?:from\s+(\.*[\w.]*)\s+import\s+([\w*, ()]+)|import\s+([\w., ]+))', re.MULTILINE)
+# 注释和普通字符串整体匹配后丢弃，其中的 import 文本不会被当成导入
+_JS_TOKEN = re.compile(
+    r'''/\*.*?(?:\*/|\Z)|//[^\n]*'''
+    r'''|(?<![\w$.])(?:import|export)\s+(?:[\w*{}\s,$]+?\s+from\s+)?['"]([^'"\n]+)['"]'''
+    r'''|(?<![\w$.])(?:require|import)\s*\(\s*['"]([^'"\n]+)['"]\s*\)'''
+    r'''|'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`''',
+    re.DOTALL
+)
+
+
+def _strip_suffix(rel_path: str) -> str:
+    return os.path.splitext(rel_path)[0]
+
+
+def python_module_name(rel_path: str) -> str:
+    """src/utils/date_utils.py -> src.utils.date_utils；包的 __init__.py 取目录名"""
+    parts = _strip_suffix(rel_path).split('/')
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    return '.'.join(parts)
+
+
+class ImportGraph:
+    """沙箱内的导入关系索引"""
+
+    def __init__(self, sandbox_dir: Path):
+        self.sandbox_dir = Path(sandbox_dir)
+        self._imports: Dict[str, Set[str]] = {}
+        self._importers: Dict[str, Set[str]] = {}
+        self.files: List[str] = []
+        self.parse_errors: List[str] = []
+        self._build()
+
+    # ------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------
+
+    def _build(self) -> None:
+        for dirpath, dirnames, filenames in os.walk(self.sandbox_dir):
+            dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+            for name in sorted(filenames):
+                if not name.endswith(PY_SUFFIXES + JS_SUFFIXES):
+                    continue
+                full_path = Path(dirpath) / name
+                rel_path = full_path.relative_to(self.sandbox_dir).as_posix()
+                try:
+                    source = full_path.read_text(encoding='utf-8', errors='replace')
+                except OSError:
+                    continue
+                self.files.append(rel_path)
+                if name.endswith(PY_SUFFIXES):
+                    modules = self._python_imports(rel_path, source)
+                else:
+                    modules = self._js_imports(rel_path, source)
+                self._imports[rel_path] = modules
+                for module in modules:
+                    self._importers.setdefault(module, set()).add(rel_path)
+
+    def _python_imports(self, rel_path: str, source: str) -> Set[str]:
+        package = python_module_name(rel_path).split('.')
+        if not rel_path.endswith('__init__.py'):
+            package = package[:-1]
+
+        def absolute(module: str, level: int) -> str:
+            if level == 0:
+                return module
+            base = package[:len(package) - level + 1] if level > 1 else package
+            return '.'.join(base + ([module] if module else []))
+
+        modules: Set[str] = set()
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            self.parse_errors.append(rel_path)
+            for m in _PY_IMPORT_LINE.finditer(source):
+                if m.group(3):
+                    modules.update(n.split(' as ')[0].strip() for n in m.group(3).split(','))
+                else:
+                    dots = len(m.group(1)) - len(m.group(1).lstrip('.'))
+                    base = absolute(m.group(1).lstrip('.'), dots)
+                    modules.add(base)
+                    names = m.group(2).replace('(', '').replace(')', '')
+                    modules.update(f"{base}.{n.split(' as ')[0].strip()}" for n in names.split(',')
+                                   if n.strip() and n.strip() != '*')
+            modules.discard('')
+            return modules
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    modules.add(alias.name)
+            elif isinstance(node, ast.ImportFrom):
+                base = absolute(node.module or '', node.level)
+                if base:
+                    modules.add(base)
+                for alias in node.names:
+                    if alias.name != '*':
+                        # 可能是子模块（from pkg import module）
+                        modules.add(f"{base}.{alias.name}" if base else alias.name)
+        return modules
+
+    def _js_imports(self, rel_path: str, source: str) -> Set[str]:
+        modules: Set[str] = set()
+        directory = os.path.dirname(rel_path)
+        for m in _JS_TOKEN.finditer(source):
+            spec = m.group(1) or m.group(2)
+            if not spec:
+                continue
+            if spec.startswith('.'):
+                resolved = os.path.normpath(os.path.join(directory, spec)).replace(os.sep, '/')
+                modules.add(self._js_module_key(resolved))
+            else:
+                modules.add(spec)
+        return modules
+
+    @staticmethod
+    def _js_module_key(path: str) -> str:
+        """去掉扩展名和 /index，./date、./date.ts、./date/index 指向同一个键"""
+        path = _strip_suffix(path) if path.endswith(JS_SUFFIXES) else path
+        return path[:-len('/index')] if path.endswith('/index') else path
+
+    # ------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------
+
+    def module_keys(self, path: str) -> Set[str]:
+        """文件路径对应的模块键（文件不需要存在，可用于查询已移走的模块）"""
+        path = os.path.normpath(path).replace(os.sep, '/')
+        if path.endswith(PY_SUFFIXES):
+            return {python_module_name(path)}
+        return {self._js_module_key(path)}
+
+    def importers(self, module: Optional[str] = None, path: Optional[str] = None) -> Set[str]:
+        """导入某模块（模块键或文件路径）的文件集合"""
+        keys = {module} if module else self.module_keys(path or '')
+        result: Set[str] = set()
+        for key in keys:
+            result |= self._importers.get(key, set())
+        return result
+
+    def imports_of(self, rel_path: str) -> Set[str]:
+        """某文件导入的模块键集合"""
+        return self._imports.get(os.path.normpath(rel_path).replace(os.sep, '/'), set())
+
+    def imports(self, rel_path: str, module: Optional[str] = None, path: Optional[str] = None) -> bool:
+        keys = {module} if module else self.module_keys(path or '')
+        return bool(self.imports_of(rel_path) & keys)
+
+
+def get_import_graph(sandbox_dir: Path) -> ImportGraph:
+    """取当前评估缓存中的导入图（没有则构建）"""
+    return active_cache().memo(('import_graph', str(Path(sandbox_dir).resolve())),
+                               lambda: ImportGraph(sandbox_dir))
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='沙箱模块依赖图')
+    parser.add_argument('sandbox_dir')
+    parser.add_argument('--importers', help='列出导入该模块（模块键或文件路径）的文件')
+    parser.add_argument('--imports', help='列出该文件导入的模块')
+
+    args = parser.parse_args()
+    graph = ImportGraph(Path(args.sandbox_dir))
+
+    if args.importers:
+        target = args.importers
+        is_path = '/' in target or target.endswith(PY_SUFFIXES + JS_SUFFIXES)
+        for rel_path in sorted(graph.importers(path=target) if is_path else graph.importers(module=target)):
+            print(rel_path)
+    elif args.imports:
+        for module in sorted(graph.imports_of(args.imports)):
+            print(module)
+    else:
+        edges = sum(len(m) for m in graph._imports.values())
+        print(f"{len(graph.files)} files, {edges} import edges, {len(graph._importers)} modules")
+        for rel_path in graph.parse_errors:
+            print(f"  syntax error (fallback scan): {rel_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+内核命名空间隔离（可选）
+
+并行运行的 phase4 / phase6 共用一个 PID 空间、一个网络和一个 /tmp：绑定固定端口、
+写 /tmp、用 pgrep -f 检查进程的题目会互相干扰，只能串行跑。本模块为每个沙箱创建
+一组非特权命名空间（user + pid + mount + net，通过 unshare）：
+
+- 私有 /tmp：绑定到宿主机上的一个临时目录（tmp_dir），关闭时删除
+- 私有网络：只有 loopback，各沙箱可以绑定同一端口
+- 私有 PID 空间：pgrep / ps 只看到本沙箱的进程；关闭时命名空间内的进程全部结束
+
+命名空间内常驻一个 holder 进程（PID 1，负责回收孤儿进程），init_commands、
+reference_solution 的 Bash、Agent 和进程 / 脚本类 check 都通过 nsenter 进入同一组命名空间执行。
+沙箱目录位于 /tmp 下时，其父目录会重新绑定到私有 /tmp 中的原路径，路径在内外一致。
+
+Agent 需要访问 API：egress=True 时 holder 在命名空间内监听 127.0.0.1:EGRESS_PORT，
+经 tmp_dir 中的 unix socket 转发到宿主机一侧的 CONNECT 代理，Agent 通过 HTTPS_PROXY 出网。
+中转端口对命名空间内的所有进程可见，因此代理只放行白名单中的 host:port（默认 API 域名的 443，
+可用环境变量 SANDBOX_EGRESS_ALLOW 覆盖，逗号分隔，host 支持 * 通配），并拒绝解析到
+loopback / 私有 / 链路本地等非公网地址的目标。
+
+使用方式:
+    from isolation import sandbox_namespace, run_command
+    with sandbox_namespace(work_dir, enabled=args.isolate):
+        # 超时时结束整个进程组（包括 nsenter fork 出的命令）
+        run_command(command, shell=True, cwd=work_dir, timeout=30)
+
+命令行（检查当前环境是否支持）:
+    python3 isolation.py --check
+"""
+import os
+import sys
+import fcntl
+import shutil
+import signal
+import socket
+import struct
+import argparse
+import fnmatch
+import ipaddress
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+EGRESS_PORT = 47613
+EGRESS_SOCKET = '.egress.sock'
+EGRESS_ALLOW_ENV = 'SANDBOX_EGRESS_ALLOW'
+DEFAULT_EGRESS_ALLOW = 'api.anthropic.com:443'
+START_TIMEOUT = 10
+
+_active: ContextVar[Optional['Namespace']] = ContextVar('active_namespace', default=None)
+
+
+class IsolationError(RuntimeError):
+    pass
+
+
+# ============================================================
+# 宿主机一侧
+# ============================================================
+
+@lru_cache(maxsize=1)
+def available() -> Tuple[bool, str]:
+    """当前环境能否创建非特权命名空间"""
+    for tool in ('unshare', 'nsenter', 'mount'):
+        if shutil.which(tool) is None:
+            return False, f"{tool} not found"
+    try:
+        result = subprocess.run(['unshare', '--user', '--map-root-user', '--pid', '--fork', '--mount',
+                                 '--net', '--mount-proc', 'true'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return False, str(e)
+    if result.returncode != 0:
+        return False, result.stderr.strip()[:200] or f"unshare exited {result.returncode}"
+    return True, 'ok'
+
+
+def _child_pid(parent: int) -> Optional[int]:
+    """unshare --fork 的子进程（命名空间内的 PID 1）在宿主机上的 PID"""
+    try:
+        children = Path(f'/proc/{parent}/task/{parent}/children').read_text().split()
+        if children:
+            return int(children[0])
+    except OSError:
+        pass
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+        except OSError:
+            continue
+        # comm 可能含空格，ppid 在最后一个 ')' 之后的第二个字段
+        if int(stat.rsplit(')', 1)[1].split()[1]) == parent:
+            return int(entry.name)
+    return None
+
+
+def _pipe(src: socket.socket, dst: socket.socket) -> None:
+    try:
+        while True:
+            data = src.recv(65536)
+            if not data:
+                break
+            dst.sendall(data)
+    except OSError:
+        pass
+    finally:
+        for sock in (src, dst):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _splice(a: socket.socket, b: socket.socket) -> None:
+    """双向转发直到任一端关闭"""
+    threading.Thread(target=_pipe, args=(a, b), daemon=True).start()
+    _pipe(b, a)
+    a.close()
+    b.close()
+
+
+def _egress_allowed(host: str, port: int) -> bool:
+    """目标是否在出网白名单中（host[:port]，端口缺省为 443）"""
+    for item in os.environ.get(EGRESS_ALLOW_ENV, DEFAULT_EGRESS_ALLOW).split(','):
+        item = item.strip()
+        pattern, _, allowed_port = item.rpartition(':') if ':' in item else (item, '', '443')
+        if pattern and fnmatch.fnmatchcase(host.lower(), pattern.lower()) and str(port) == allowed_port:
+            return True
+    return False
+
+
+def _public_addresses(host: str, port: int) -> List[tuple]:
+    """解析目标，只保留公网地址（连接时直接用解析结果，避免二次解析绕过检查）"""
+    addresses = []
+    for family, socktype, proto, _, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        ip = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if getattr(ip, 'ipv4_mapped', None):
+            ip = ip.ipv4_mapped
+        if ip.is_global and not ip.is_multicast:
+            addresses.append((family, socktype, proto, sockaddr))
+    return addresses
+
+
+def _open_upstream(host: str, port: int) -> Optional[socket.socket]:
+    """连接白名单内的公网目标；不允许时返回 None"""
+    if not _egress_allowed(host, port):
+        return None
+    error: Optional[OSError] = None
+    for family, socktype, proto, sockaddr in _public_addresses(host, port):
+        upstream = socket.socket(family, socktype, proto)
+        upstream.settimeout(30)
+        try:
+            upstream.connect(sockaddr)
+        except OSError as e:
+            upstream.close()
+            error = e
+            continue
+        upstream.settimeout(None)
+        return upstream
+    if error is not None:
+        raise error
+    return None
+
+
+def _serve_connect(client: socket.socket) -> None:
+    """宿主机一侧的 HTTP CONNECT 代理（只支持 CONNECT，即 HTTPS）"""
+    try:
+        head = b''
+        while b'\r\n\r\n' not in head and len(head) < 65536:
+            chunk = client.recv(4096)
+            if not chunk:
+                client.close()
+                return
+            head += chunk
+        request, _, rest = head.partition(b'\r\n\r\n')
+        method, target = request.split(b' ', 2)[:2]
+        if method.upper() != b'CONNECT':
+            client.sendall(b'HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\n\r\n')
+            client.close()
+            return
+        host, _, port = target.decode('ascii').rpartition(':')
+        upstream = _open_upstream(host.strip('[]'), int(port))
+        if upstream is None:
+            client.sendall(b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n')
+            client.close()
+            return
+    except (OSError, ValueError):
+        try:
+            client.sendall(b'HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n')
+        except OSError:
+            pass
+        client.close()
+        return
+    client.sendall(b'HTTP/1.1 200 Connection Established\r\n\r\n')
+    if rest:
+        upstream.sendall(rest)
+    _splice(client, upstream)
+
+
+class Namespace:
+    """一个沙箱的命名空间组"""
+
+    def __init__(self, sandbox_dir: Path, egress: bool = False):
+        self.sandbox_dir = Path(sandbox_dir).resolve()
+        self.egress = egress
+        self.tmp_dir: Optional[Path] = None
+        self.pid: Optional[int] = None
+        self._proc: Optional[subprocess.Popen] = None
+        self._egress_server: Optional[socket.socket] = None
+
+    def start(self) -> 'Namespace':
+        ok, reason = available()
+        if not ok:
+            raise IsolationError(f"namespace isolation unavailable: {reason}")
+        self.sandbox_dir.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix='case_ns_'))
+        if self.egress:
+            self._start_egress()
+
+        cmd = ['unshare', '--user', '--map-root-user', '--pid', '--fork', '--mount', '--net', '--mount-proc',
+               sys.executable, str(Path(__file__).resolve()), '--holder',
+               str(self.tmp_dir), str(self.sandbox_dir.parent)]
+        if self.egress:
+            cmd.append('--egress')
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE, text=True)
+        ready = [None]
+        reader = threading.Thread(target=lambda: ready.__setitem__(0, self._proc.stdout.readline()), daemon=True)
+        reader.start()
+        reader.join(START_TIMEOUT)
+        if not ready[0] or not ready[0].startswith('ready'):
+            self.pid = _child_pid(self._proc.pid)
+            proc = self._proc
+            self.close()
+            detail = proc.stderr.read().strip()[-300:]
+            raise IsolationError(f"namespace holder failed to start: {detail}")
+        self.pid = _child_pid(self._proc.pid)
+        if self.pid is None:
+            self.close()
+            raise IsolationError("cannot locate namespace holder process")
+        return self
+
+    def _start_egress(self) -> None:
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(self.tmp_dir / EGRESS_SOCKET))
+        server.listen(64)
+        self._egress_server = server
+
+        def accept_loop():
+            while True:
+                try:
+                    client, _ = server.accept()
+                except OSError:
+                    return
+                threading.Thread(target=_serve_connect, args=(client,), daemon=True).start()
+
+        threading.Thread(target=accept_loop, daemon=True).start()
+
+    def close(self) -> None:
+        # holder（PID 1）退出时内核结束命名空间内的所有进程
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        if self._proc is not None:
+            # 等 unshare 回收 holder 后自行退出；先杀 unshare 会把 holder 的僵尸进程留给 init
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+                self._proc.wait()
+            self._proc = None
+        if self._egress_server is not None:
+            self._egress_server.close()
+            self._egress_server = None
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            self.tmp_dir = None
+        self.pid = None
+
+    def __enter__(self) -> 'Namespace':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def wrap(self, argv: List[str], cwd: Optional[Path] = None) -> List[str]:
+        """在命名空间内执行 argv 的命令行"""
+        if cwd is None:
+            cwd = self.sandbox_dir if self.sandbox_dir.is_dir() else self.sandbox_dir.parent
+        wd = Path(cwd).resolve()
+        return ['nsenter', f'--target={self.pid}', '--user', '--mount', '--net', '--pid',
+                f'--wd={wd}', '--'] + list(argv)
+
+    def inner_path(self, host_path: Union[str, Path]) -> str:
+        """tmp_dir 下的宿主机路径 → 命名空间内 /tmp 下的路径"""
+        return str(Path('/tmp') / Path(host_path).resolve().relative_to(self.tmp_dir.resolve()))
+
+    def host_path(self, path: Union[str, Path]) -> Path:
+        """命名空间内的绝对路径 → 宿主机上的路径（私有 /tmp 映射到 tmp_dir，沙箱所在目录不变）"""
+        path = Path(path)
+        keep = self.sandbox_dir.parent
+        if path == keep or keep in path.parents:
+            return path
+        if path == Path('/tmp') or Path('/tmp') in path.parents:
+            return self.tmp_dir / path.relative_to('/tmp')
+        return path
+
+    def agent_env(self, base: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Agent 进程的环境变量：出网代理；命名空间内是 root，声明处于沙箱中"""
+        env = dict(os.environ if base is None else base)
+        env['IS_SANDBOX'] = '1'
+        if self.egress:
+            proxy = f'http://127.0.0.1:{EGRESS_PORT}'
+            env.update({'HTTPS_PROXY': proxy, 'https_proxy': proxy,
+                        'NO_PROXY': 'localhost,127.0.0.1', 'no_proxy': 'localhost,127.0.0.1'})
+        return env
+
+
+@contextmanager
+def sandbox_namespace(sandbox_dir: Path, enabled: bool = True, egress: bool = False):
+    """在 with 块内，wrap_command 把命令放进该沙箱的命名空间执行；enabled=False 时什么都不做"""
+    if not enabled:
+        yield None
+        return
+    with Namespace(sandbox_dir, egress) as ns:
+        token = _active.set(ns)
+        try:
+            yield ns
+        finally:
+            _active.reset(token)
+
+
+def active_namespace() -> Optional[Namespace]:
+    return _active.get()
+
+
+def wrap_command(command: Union[str, List[str]], shell: bool = False,
+                 cwd: Optional[Path] = None) -> Tuple[Union[str, List[str]], bool]:
+    """
+    有活动命名空间时改写为 nsenter 命令
+
+    Returns:
+        (command, shell)：直接传给 subprocess；没有活动命名空间时原样返回
+    """
+    ns = _active.get()
+    if ns is None:
+        return command, shell
+    argv = ['/bin/sh', '-c', command] if shell else list(command)
+    return ns.wrap(argv, cwd), False
+
+
+def kill_process_group(proc: subprocess.Popen) -> None:
+    """
+    结束以 start_new_session=True 启动的进程的整个进程组
+
+    nsenter --pid 会 fork：只杀 nsenter 时命令仍在命名空间内运行并占着输出管道。
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_command(command: Union[str, List[str]], shell: bool = False, cwd: Optional[Path] = None,
+                timeout: Optional[float] = None, capture_output: bool = False,
+                **kwargs) -> subprocess.CompletedProcess:
+    """
+    subprocess.run 的替代：有活动命名空间时经 nsenter 执行；超时时结束整个进程组再抛出 TimeoutExpired
+
+    Args:
+        command / shell / cwd: 同 wrap_command
+        timeout / capture_output / kwargs: 同 subprocess.run（不支持 input / check）
+    """
+    cmd, shell = wrap_command(command, shell=shell, cwd=cwd)
+    if capture_output:
+        kwargs['stdout'] = kwargs['stderr'] = subprocess.PIPE
+    proc = subprocess.Popen(cmd, shell=shell, cwd=str(cwd) if cwd is not None else None,
+                            start_new_session=True, **kwargs)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_group(proc)
+        try:
+            stdout, stderr = proc.communicate(timeout=5)
+        except subprocess.TimeoutExpired:
+            # 脱离进程组的后代仍占着管道，放弃剩余输出
+            stdout = stderr = None
+            proc.kill()
+            proc.wait()
+        raise subprocess.TimeoutExpired(proc.args, timeout, stdout, stderr)
+    except BaseException:
+        kill_process_group(proc)
+        proc.wait()
+        raise
+    return subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
+
+
+# ============================================================
+# 命名空间内（holder）
+# ============================================================
+
+_SIOCGIFFLAGS = 0x8913
+_SIOCSIFFLAGS = 0x8914
+_IFF_UP = 0x1
+
+
+def _loopback_up() -> None:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        ifreq = struct.pack('16sh', b'lo', 0)
+        flags = struct.unpack('16sh', fcntl.ioctl(sock, _SIOCGIFFLAGS, ifreq)[:18])[1]
+        fcntl.ioctl(sock, _SIOCSIFFLAGS, struct.pack('16sh', b'lo', flags | _IFF_UP))
+
+
+def _egress_relay() -> None:
+    """127.0.0.1:EGRESS_PORT → tmp 中的 unix socket（宿主机上的 CONNECT 代理）"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', EGRESS_PORT))
+    server.listen(64)
+
+    def handle(client):
+        upstream = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            upstream.connect(f'/tmp/{EGRESS_SOCKET}')
+        except OSError:
+            client.close()
+            upstream.close()
+            return
+        _splice(client, upstream)
+
+    def accept_loop():
+        while True:
+            client, _ = server.accept()
+            threading.Thread(target=handle, args=(client,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+
+
+def _reap(signum, frame) -> None:
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def run_holder(tmp_dir: str, keep_dir: str, egress: bool) -> None:
+    """命名空间内的 PID 1：挂载私有 /tmp、启用 loopback，然后回收孤儿进程直到被结束"""
+    # 沙箱父目录在 /tmp 下时，先把它挂到私有 tmp 的对应位置，再整体覆盖 /tmp
+    keep = Path(keep_dir)
+    if keep == Path('/tmp') or Path('/tmp') in keep.parents:
+        inner = Path(tmp_dir) / keep.relative_to('/tmp')
+        inner.mkdir(parents=True, exist_ok=True)
+        subprocess.run(['mount', '--bind', keep_dir, str(inner)], check=True)
+    subprocess.run(['mount', '--rbind', tmp_dir, '/tmp'], check=True)
+    os.chmod('/tmp', 0o1777)
+    _loopback_up()
+    if egress:
+        _egress_relay()
+
+    signal.signal(signal.SIGCHLD, _reap)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print('ready', flush=True)
+    while True:
+        signal.pause()
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='沙箱命名空间隔离')
+    parser.add_argument('--check', action='store_true', help='检查当前环境是否支持，并做一次端口 / PID / tmp 隔离自检')
+    parser.add_argument('--holder', nargs=2, metavar=('TMP_DIR', 'KEEP_DIR'), help=argparse.SUPPRESS)
+    parser.add_argument('--egress', action='store_true', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    if args.holder:
+        run_holder(args.holder[0], args.holder[1], args.egress)
+        return
+
+    ok, reason = available()
+    print(f"Namespace isolation: {'available' if ok else 'unavailable'} ({reason})")
+    if not ok or not args.check:
+        sys.exit(0 if ok else 1)
+
+    with tempfile.TemporaryDirectory() as base:
+        probe = ("python3 -c \"import socket; s=socket.socket(); s.bind(('127.0.0.1', 18080)); print('bound')\" "
+                 "&& ls /tmp | wc -l && ps -e --no-headers | wc -l")
+        for name in ('a', 'b'):
+            with sandbox_namespace(Path(base) / name) as ns:
+                cmd, shell = wrap_command(probe, shell=True, cwd=Path(base))
+                result = subprocess.run(cmd, shell=shell, capture_output=True, text=True, timeout=30)
+                print(f"  sandbox {name}: holder pid {ns.pid}, "
+                      f"{' / '.join(result.stdout.split()) or result.stderr.strip()[:100]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+自适应 Haiku 通过率估计
+
+phase6 只跑一次 Haiku，单次 pass/fail 说明不了题目的真实难度；固定跑 k 次
+又会在明显太简单或明显做不出的题目上浪费模型调用。本脚本按顺序重复运行
+Haiku，每跑完一批就检查通过率的置信区间（或 SPRT）是否已经能相对目标区间
+下结论，能下结论就停止。
+
+判定结果:
+    below_band   通过率明显低于目标区间（题目过难 / 有问题）
+    in_band      通过率落在目标区间内（难度合适）
+    above_band   通过率明显高于目标区间（题目过简单）
+    undecided    达到 --max-runs 仍无法判定
+
+用法:
+    python3 pass_rate.py <case_file> [--band 0.2,0.8] [--confidence 0.9]
+                         [--min-runs 3] [--max-runs 20] [--method wilson|sprt]
+                         [--parallel 1] [--claude-bin <cmd>] [--store <db>]
+
+输出:
+    pass_rate_result.json（估计值、区间、运行次数、每次运行摘要）
+"""
+import sys
+import os
+import json
+import math
+import argparse
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from statistics import NormalDist
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+# 添加 scripts 目录到路径
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from grading import verify_graders
+from sandbox import apply_run_vars, build_template, clone_template, run_init_commands
+from isolation import sandbox_namespace
+from run_vars import RunVars
+import phase6_haiku
+
+
+DEFAULT_BAND = (0.2, 0.8)
+
+
+# ============================================================
+# 统计
+# ============================================================
+
+def wilson_interval(passes: int, runs: int, confidence: float) -> Tuple[float, float]:
+    """通过率的 Wilson 置信区间（小样本、接近 0/1 时比正态近似可靠）"""
+    if runs == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = passes / runs
+    denom = 1 + z * z / runs
+    center = (p + z * z / (2 * runs)) / denom
+    half = z * math.sqrt(p * (1 - p) / runs + z * z / (4 * runs * runs)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def sprt_side(passes: int, runs: int, edge: float, delta: float, confidence: float) -> Optional[str]:
+    """
+    Wald SPRT：检验通过率在 edge 的哪一侧
+
+    H0: p = edge - delta，H1: p = edge + delta，两类错误率均为 1 - confidence。
+    |p - edge| < delta 的无差别区内可能一直不下结论。
+
+    Returns:
+        'above' / 'below'，尚无结论返回 None
+    """
+    p0 = min(max(edge - delta, 1e-6), 1 - 1e-6)
+    p1 = min(max(edge + delta, 1e-6), 1 - 1e-6)
+    error = 1 - confidence
+    upper = math.log((1 - error) / error)
+    llr = passes * math.log(p1 / p0) + (runs - passes) * math.log((1 - p1) / (1 - p0))
+    if llr >= upper:
+        return 'above'
+    if llr <= -upper:
+        return 'below'
+    return None
+
+
+def decide(passes: int, runs: int, band: Tuple[float, float], confidence: float,
+           method: str = 'wilson', delta: float = 0.1) -> str:
+    """根据当前样本判定通过率相对目标区间的位置"""
+    lo, hi = band
+    if method == 'sprt':
+        lower_side = sprt_side(passes, runs, lo, delta, confidence)
+        if lower_side == 'below':
+            return 'below_band'
+        upper_side = sprt_side(passes, runs, hi, delta, confidence)
+        if upper_side == 'above':
+            return 'above_band'
+        if lower_side == 'above' and upper_side == 'below':
+            return 'in_band'
+        return 'undecided'
+
+    ci_lo, ci_hi = wilson_interval(passes, runs, confidence)
+    if ci_hi < lo:
+        return 'below_band'
+    if ci_lo > hi:
+        return 'above_band'
+    if ci_lo >= lo and ci_hi <= hi:
+        return 'in_band'
+    return 'undecided'
+
+
+def estimate_pass_rate(run_once: Callable[[int], bool], band: Tuple[float, float] = DEFAULT_BAND,
+                       confidence: float = 0.9, min_runs: int = 3, max_runs: int = 20,
+                       method: str = 'wilson', delta: float = 0.1, parallel: int = 1) -> Dict[str, Any]:
+    """
+    顺序采样直到通过率相对目标区间有结论
+
+    Args:
+        run_once: 执行第 i 次运行并返回是否通过
+        band: 目标通过率区间 (lo, hi)
+        confidence: 置信水平
+        min_runs: 至少运行次数
+        max_runs: 最多运行次数
+        method: 'wilson'（置信区间）或 'sprt'
+        delta: SPRT 的无差别区半宽
+        parallel: 每批并行运行数（批内不提前停止，可能多跑几次）
+
+    Returns:
+        {estimate, interval, runs, passes, decision, outcomes}
+    """
+    outcomes: List[bool] = []
+    decision = 'undecided'
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+        while len(outcomes) < max_runs:
+            batch = min(max(1, parallel), max_runs - len(outcomes))
+            start = len(outcomes)
+            outcomes.extend(pool.map(run_once, range(start, start + batch)))
+
+            if len(outcomes) < min_runs:
+                continue
+            decision = decide(sum(outcomes), len(outcomes), band, confidence, method, delta)
+            if decision != 'undecided':
+                break
+
+    passes = sum(outcomes)
+    runs = len(outcomes)
+    return {
+        'estimate': passes / runs if runs else 0.0,
+        'interval': list(wilson_interval(passes, runs, confidence)),
+        'runs': runs,
+        'passes': passes,
+        'decision': decision,
+        'outcomes': outcomes
+    }
+
+
+# ============================================================
+# Haiku 运行
+# ============================================================
+
+def make_haiku_runner(case_data: dict, runs_dir: Path, timeout: int, claude_bin: str,
+                      records: List[Dict[str, Any]], isolate: bool = False) -> Callable[[int], bool]:
+    """
+    构造 run_once：每次运行使用独立沙箱（模板复制 + init_commands）
+
+    isolate=True 时每个沙箱有自己的命名空间，并行运行的后台服务可以用相同端口。
+    按运行占位符（{{PORT:name}} 等）每次运行单独分配，并行运行互不冲突。
+
+    每次运行的 phase6 结果字典追加到 records。
+    """
+    case_id = case_data.get('task', {}).get('id', 'unknown')
+    query = case_data.get('task', {}).get('desc', '')
+    template_dir = runs_dir / '.template'
+    build_template(case_data, template_dir)
+
+    def run_once(index: int) -> bool:
+        sandbox_dir = runs_dir / f"run_{index:03d}"
+        with RunVars.allocate(case_data) as run_vars, \
+                sandbox_namespace(sandbox_dir, enabled=isolate, egress=True):
+            run_case = run_vars.render(case_data)
+            clone_template(template_dir, sandbox_dir)
+            apply_run_vars(case_data, run_vars, sandbox_dir)
+            run_init_commands(run_case, sandbox_dir)
+
+            haiku_result = phase6_haiku.run_haiku_cli(run_vars.render(query), sandbox_dir, timeout, claude_bin)
+            result = verify_graders(run_case, sandbox_dir, haiku_result.get('trajectory', []))
+        if run_vars.values:
+            haiku_result['run_vars'] = run_vars.values
+
+        output_data = phase6_haiku.build_output(case_id, haiku_result, result)
+        output_data['run_index'] = index
+        records.append(output_data)
+
+        status = "✓" if result.passed else "✗"
+        print(f"  {status} run {index + 1}: {result.passed_checks}/{result.total_checks} checks, "
+              f"{haiku_result.get('total_steps', 0)} steps, {haiku_result.get('duration_sec', 0):.1f}s")
+        return result.passed
+
+    return run_once
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def _parse_band(text: str) -> Tuple[float, float]:
+    lo, hi = (float(x) for x in text.split(','))
+    if not 0 <= lo < hi <= 1:
+        raise argparse.ArgumentTypeError(f"invalid band: {text}")
+    return lo, hi
+
+
+def main():
+    parser = argparse.ArgumentParser(description='自适应 Haiku 通过率估计')
+    parser.add_argument('case_file', help='测试用例 JSON 文件路径')
+    parser.add_argument('--band', type=_parse_band, default=DEFAULT_BAND,
+                        help='目标通过率区间 lo,hi（默认: 0.2,0.8）')
+    parser.add_argument('--confidence', type=float, default=0.9, help='置信水平（默认: 0.9）')
+    parser.add_argument('--min-runs', type=int, default=3, help='最少运行次数（默认: 3）')
+    parser.add_argument('--max-runs', type=int, default=20, help='最多运行次数（默认: 20）')
+    parser.add_argument('--method', choices=['wilson', 'sprt'], default='wilson',
+                        help='停止规则：wilson 置信区间 / sprt 序贯检验（默认: wilson）')
+    parser.add_argument('--delta', type=float, default=0.1, help='SPRT 无差别区半宽（默认: 0.1）')
+    parser.add_argument('--parallel', type=int, default=1, help='每批并行运行数（默认: 1）')
+    parser.add_argument('--runs-dir', default='pass_rate_runs', help='运行目录名（默认: pass_rate_runs）')
+    parser.add_argument('--keep-runs', action='store_true', help='保留每次运行的沙箱')
+    parser.add_argument('--timeout', type=int, default=600, help='单次 Haiku 超时秒数（默认: 600）')
+    parser.add_argument('--claude-bin', default=os.environ.get('CLAUDE_BIN', 'claude'),
+                        help='Claude CLI 命令（默认: $CLAUDE_BIN 或 claude）')
+    parser.add_argument('--isolate', action='store_true', help='每次运行在独立的命名空间中执行（见 isolation.py）')
+    parser.add_argument('--store', help='把每次运行写入 SQLite 结果库（见 results_store.py）')
+    parser.add_argument('--output', help='输出结果文件路径')
+
+    args = parser.parse_args()
+
+    case_path = Path(args.case_file).resolve()
+    if not case_path.exists():
+        print(f"Error: Case file not found: {args.case_file}")
+        sys.exit(1)
+
+    with open(case_path, 'r', encoding='utf-8') as f:
+        case_data = json.load(f)
+
+    task = case_data.get('task', {})
+    case_id = task.get('id', case_path.stem)
+    working_dir = case_path.parent
+    runs_dir = working_dir / args.runs_dir
+
+    print(f"\n{'='*60}")
+    print(f"Haiku 通过率估计")
+    print(f"{'='*60}")
+    print(f"Case ID: {case_id}")
+    print(f"Target band: [{args.band[0]:.2f}, {args.band[1]:.2f}]  "
+          f"confidence {args.confidence}  method {args.method}")
+    print(f"Runs: {args.min_runs}..{args.max_runs}  parallel {args.parallel}")
+    print()
+
+    records: List[Dict[str, Any]] = []
+    run_once = make_haiku_runner(case_data, runs_dir, args.timeout, args.claude_bin, records, args.isolate)
+    try:
+        estimate = estimate_pass_rate(
+            run_once, args.band, args.confidence, args.min_runs, args.max_runs,
+            args.method, args.delta, args.parallel
+        )
+    finally:
+        if not args.keep_runs:
+            shutil.rmtree(runs_dir, ignore_errors=True)
+
+    records.sort(key=lambda r: r['run_index'])
+    ci_lo, ci_hi = estimate['interval']
+
+    print(f"\n{'='*60}")
+    print(f"Pass rate: {estimate['estimate']:.2f} ({estimate['passes']}/{estimate['runs']})")
+    print(f"{int(args.confidence * 100)}% interval: [{ci_lo:.2f}, {ci_hi:.2f}]")
+    print(f"Decision: {estimate['decision']}")
+    print(f"{'='*60}")
+
+    if args.store:
+        from results_store import ResultsStore
+        with ResultsStore(Path(args.store)) as store:
+            for output_data in records:
+                store.record(output_data, case_data)
+        print(f"\n{len(records)} runs recorded in: {args.store}")
+
+    output_data = {
+        'case_id': case_id,
+        'timestamp': datetime.now().isoformat(),
+        'model': 'haiku',
+        'band': list(args.band),
+        'confidence': args.confidence,
+        'method': args.method,
+        'estimate': estimate['estimate'],
+        'interval': estimate['interval'],
+        'runs': estimate['runs'],
+        'passes': estimate['passes'],
+        'decision': estimate['decision'],
+        'run_results': [
+            {
+                'run_index': r['run_index'],
+                'passed': r['haiku_evaluation']['passed'],
+                'passed_checks': r['haiku_evaluation']['passed_checks'],
+                'total_checks': r['haiku_evaluation']['total_checks'],
+                'haiku_steps': r['haiku_evaluation']['haiku_steps'],
+                'duration_sec': r['haiku_evaluation']['duration_sec']
+            }
+            for r in records
+        ]
+    }
+
+    output_path = Path(args.output) if args.output else working_dir / 'pass_rate_result.json'
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(output_data, f, indent=2, ensure_ascii=False)
+    print(f"\nResult saved to: {output_path}")
+
+    sys.exit(0 if estimate['decision'] == 'in_band' else 1)
+
+
+if __name__ == '__main__':
+    main()
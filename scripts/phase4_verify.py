@@ -5,7 +5,7 @@ Phase 4: 自测验证脚本
 验证测试用例的 reference_solution 是否能正确通过 graders。
 
 用法:
-    python3 phase4_verify.py <case_file> [--work-dir <dir>] [--keep-env]
+    python3 phase4_verify.py <case_file> [--work-dir <dir>] [--keep-env] [--checkpoint]
 
 功能:
 1. 在当前目录创建 phase4_workspace/ 子目录
@@ -18,6 +18,9 @@ Phase 4: 自测验证脚本
 区别于 phase6_haiku.py：
 - 本脚本直接按 reference_solution 执行，不调用 AI 模型
 - 用于快速验证出题设计是否正确
+
+--checkpoint 时每步执行后保存沙箱快照（见 step_cache.py），修改 reference_solution
+后再次验证只重跑改动之后的步骤。
 """
 import sys
 import os
@@ -27,16 +30,20 @@ import subprocess
 import shutil
 import time
 import signal
-import re
 from pathlib import Path
 from datetime import datetime
-from typing import Tuple, List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 # 添加 scripts 目录到路径，以便导入 custom_checks
 SCRIPT_DIR = Path(__file__).parent
 sys.path.insert(0, str(SCRIPT_DIR))
 
-from custom_checks import CHECK_REGISTRY, _resolve_path
+from grading import GraderResult, verify_graders, grader_result_to_dict
+from sandbox import setup_sandbox
+from step_cache import CheckpointStore, ReplaySession
+from file_tools import read_file, edit_file
+from isolation import active_namespace, run_command, sandbox_namespace, wrap_command
+from run_vars import RunVars
 
 
 # ============================================================
@@ -51,83 +58,43 @@ def setup_workspace(case_data: dict, work_dir: Path) -> None:
         case_data: 测试用例数据
         work_dir: 工作目录
     """
-    # 清理并创建目录
-    if work_dir.exists():
-        shutil.rmtree(work_dir)
-    work_dir.mkdir(parents=True, exist_ok=True)
-
-    # 1. 根据 environment 创建文件
-    environment = case_data.get('environment', [])
-    for file_info in environment:
-        file_path = file_info.get('path', '')
-        content = file_info.get('content', '')
-        executable = file_info.get('executable', False)
-
-        if not file_path:
-            continue
-
-        full_path = work_dir / file_path
-        full_path.parent.mkdir(parents=True, exist_ok=True)
-        full_path.write_text(content, encoding='utf-8')
-
-        if executable:
-            full_path.chmod(0o755)
-
-    print(f"  Created {len(environment)} environment files")
-
-    # 2. 执行 init_commands
-    init_commands = case_data.get('init_commands', [])
-    if init_commands:
-        print(f"  Executing {len(init_commands)} init commands...")
-        for cmd_info in init_commands:
-            command = cmd_info.get('command', '')
-            description = cmd_info.get('description', '')
-            wait_sec = cmd_info.get('wait_sec', 0)
-
-            if not command:
-                continue
-
-            print(f"    - {description}")
-            try:
-                result = subprocess.run(
-                    command,
-                    shell=True,
-                    cwd=str(work_dir),
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                if result.returncode != 0:
-                    print(f"      Warning: command returned {result.returncode}")
-                    if result.stderr:
-                        print(f"      stderr: {result.stderr[:100]}")
-            except subprocess.TimeoutExpired:
-                print(f"      Warning: command timed out")
-            except Exception as e:
-                print(f"      Error: {e}")
-
-            if wait_sec > 0:
-                time.sleep(wait_sec)
+    setup_sandbox(case_data, work_dir)
 
 
 # ============================================================
 # Reference Solution 执行
 # ============================================================
 
-def execute_reference_solution(work_dir: Path, reference_solution: list) -> List[Dict]:
+def _terminate(pid: int, work_dir: Path) -> None:
+    """向 pid 发送 SIGTERM；隔离模式下 PID 文件里是命名空间内的 PID，要在命名空间内执行 kill"""
+    if active_namespace() is None:
+        os.kill(pid, signal.SIGTERM)
+        return
+    cmd, _ = wrap_command(['kill', '-TERM', str(pid)], cwd=work_dir)
+    if subprocess.run(cmd, capture_output=True).returncode != 0:
+        raise ProcessLookupError(pid)
+
+
+def execute_reference_solution(work_dir: Path, reference_solution: list,
+                               checkpoints: Optional[ReplaySession] = None,
+                               completed: Optional[List[Dict]] = None) -> List[Dict]:
     """
     执行 reference_solution
 
     Args:
         work_dir: 工作目录
         reference_solution: 参考解决方案列表
+        checkpoints: 检查点会话，每步执行后保存快照
+        completed: 从检查点恢复的已完成步骤轨迹，从其后一步继续执行
 
     Returns:
         执行轨迹
     """
-    trajectory = []
+    trajectory = list(completed or [])
+    if checkpoints is not None:
+        checkpoints.save(trajectory, work_dir)
 
-    for i, action in enumerate(reference_solution):
+    for i, action in enumerate(reference_solution[len(trajectory):], start=len(trajectory)):
         tool = action.get('tool', '')
         input_data = action.get('input', {})
         reasoning = action.get('reasoning', '')
@@ -147,9 +114,9 @@ def execute_reference_solution(work_dir: Path, reference_solution: list) -> List
                 file_path = file_path.replace('{{SANDBOX}}/', '').replace('{{SANDBOX}}', '')
                 full_path = work_dir / file_path
                 if full_path.exists():
-                    content = full_path.read_text(encoding='utf-8')
-                    step['success'] = True
-                    step['output'] = f"Read {len(content)} chars from {file_path}"
+                    ok, detail = read_file(full_path, input_data.get('offset'), input_data.get('limit'))
+                    step['success'] = ok
+                    step['output'] = f"Read {detail} from {file_path}" if ok else f"{detail}: {file_path}"
                 else:
                     step['output'] = f"File not found: {file_path}"
 
@@ -161,14 +128,11 @@ def execute_reference_solution(work_dir: Path, reference_solution: list) -> List
 
                 full_path = work_dir / file_path
                 if full_path.exists():
-                    content = full_path.read_text(encoding='utf-8')
-                    if old_string in content:
-                        new_content = content.replace(old_string, new_string)
-                        full_path.write_text(new_content, encoding='utf-8')
-                        step['success'] = True
-                        step['output'] = f"Edited {file_path}"
-                    else:
-                        step['output'] = f"old_string not found in {file_path}"
+                    # 与真实 Edit 工具一致：old_string 必须唯一，除非 replace_all
+                    ok, detail = edit_file(full_path, old_string, new_string,
+                                           replace_all=bool(input_data.get('replace_all', False)))
+                    step['success'] = ok
+                    step['output'] = f"Edited {file_path} ({detail})" if ok else f"{detail} in {file_path}"
                 else:
                     step['output'] = f"File not found: {file_path}"
 
@@ -200,9 +164,10 @@ def execute_reference_solution(work_dir: Path, reference_solution: list) -> List
                 if background:
                     # 后台执行
                     try:
+                        cmd, shell = wrap_command(command, shell=True, cwd=work_dir)
                         process = subprocess.Popen(
-                            command,
-                            shell=True,
+                            cmd,
+                            shell=shell,
                             cwd=str(work_dir),
                             stdout=subprocess.PIPE,
                             stderr=subprocess.PIPE,
@@ -217,10 +182,10 @@ def execute_reference_solution(work_dir: Path, reference_solution: list) -> List
                 else:
                     # 同步执行
                     try:
-                        result = subprocess.run(
+                        result = run_command(
                             command,
                             shell=True,
-                            cwd=str(work_dir),
+                            cwd=work_dir,
                             capture_output=True,
                             text=True,
                             timeout=60
@@ -242,7 +207,7 @@ def execute_reference_solution(work_dir: Path, reference_solution: list) -> List
                         if pid_path.exists():
                             pid = int(pid_path.read_text().strip())
                             try:
-                                os.kill(pid, signal.SIGTERM)
+                                _terminate(pid, work_dir)
                                 step['success'] = True
                                 step['output'] = f"Killed process {pid}"
                                 # 清理 PID 文件
@@ -278,169 +243,27 @@ def execute_reference_solution(work_dir: Path, reference_solution: list) -> List
             step['output'] = f"Error: {str(e)}"
 
         trajectory.append(step)
+        if checkpoints is not None:
+            checkpoints.save(trajectory, work_dir)
 
     return trajectory
 
 
-# ============================================================
-# Grader 验证
-# ============================================================
-
-def match_param_value(actual_value, match_spec) -> bool:
-    """
-    检查参数值是否匹配规范
-
-    Args:
-        actual_value: 实际的参数值
-        match_spec: 匹配规范，可以是：
-            - 字符串：等同于 {"match": "exact", "value": "..."}
-            - dict：{"match": "exact|contains|regex|any", "value": "..."}
-
-    Returns:
-        是否匹配
-    """
-    if isinstance(match_spec, str):
-        # 简化写法：字符串默认为精确匹配
-        return str(actual_value) == match_spec
-
-    match_type = match_spec.get('match', 'exact')
-    expected_value = match_spec.get('value', '')
-    actual_str = str(actual_value) if actual_value is not None else ''
-
-    if match_type == 'exact':
-        return actual_str == expected_value
-    elif match_type == 'contains':
-        return expected_value in actual_str
-    elif match_type == 'regex':
-        try:
-            return bool(re.search(expected_value, actual_str))
-        except re.error:
-            return False
-    elif match_type == 'any':
-        return True  # 不检查参数值
-    else:
-        return False
-
-
-class CheckResult:
-    """单个检查的结果"""
-    def __init__(self, check_type: str, passed: bool, message: str, description: str = ""):
-        self.check_type = check_type
-        self.passed = passed
-        self.message = message
-        self.description = description
-
-
-class GraderResult:
-    """Grader 验证结果"""
-    def __init__(self):
-        self.passed = False
-        self.total_checks = 0
-        self.passed_checks = 0
-        self.failed_checks = 0
-        self.tool_calls_verified = False
-        self.tool_calls_details = []
-        self.results: List[CheckResult] = []
-
-
-def verify_graders(case_data: dict, work_dir: Path, trajectory: List[Dict]) -> GraderResult:
-    """
-    执行 grader 验证
-
-    Args:
-        case_data: 测试用例数据
-        work_dir: 工作目录
-        trajectory: 执行轨迹
-
-    Returns:
-        GraderResult 验证结果
-    """
-    result = GraderResult()
-    graders = case_data.get('graders', [])
-
-    for grader in graders:
-        grader_type = grader.get('type', '')
-
-        if grader_type == 'state_check':
-            checks = grader.get('checks', [])
-            for check in checks:
-                check_type = check.get('check', '')
-                params = check.get('params', {})
-                description = check.get('description', '')
-
-                result.total_checks += 1
-
-                # 调用 custom_checks.py 中的检查函数
-                if check_type in CHECK_REGISTRY:
-                    check_func = CHECK_REGISTRY[check_type]
-                    try:
-                        passed, message = check_func(work_dir, params, trajectory)
-                    except Exception as e:
-                        passed, message = False, f"Check error: {e}"
-                else:
-                    passed, message = False, f"Unknown check type: {check_type}"
-
-                if passed:
-                    result.passed_checks += 1
-                else:
-                    result.failed_checks += 1
-
-                result.results.append(CheckResult(check_type, passed, message, description))
-
-        elif grader_type == 'tool_calls':
-            required = grader.get('required', [])
-
-            all_verified = True
-            for req in required:
-                tool = req.get('tool', '')
-                params_spec = req.get('params', {})
-                desc = req.get('description', '')
-
-                verified = False
-                matched_step = None
-
-                for step in trajectory:
-                    if step.get('tool') != tool:
-                        continue
-
-                    # 如果没有参数要求，只要工具匹配就通过（向后兼容）
-                    if not params_spec:
-                        verified = True
-                        matched_step = step
-                        break
-
-                    # 检查每个参数是否匹配
-                    step_input = step.get('input', {})
-                    all_params_match = True
-
-                    for param_name, match_spec in params_spec.items():
-                        actual_value = step_input.get(param_name)
-                        if not match_param_value(actual_value, match_spec):
-                            all_params_match = False
-                            break
-
-                    if all_params_match:
-                        verified = True
-                        matched_step = step
-                        break
-
-                if not verified:
-                    all_verified = False
-
-                result.tool_calls_details.append({
-                    'tool': tool,
-                    'description': desc,
-                    'verified': verified,
-                    'params_spec': params_spec if params_spec else None,
-                    'matched_step': matched_step.get('step') if matched_step else None
-                })
-
-            result.tool_calls_verified = all_verified
-
-    # 计算总体是否通过
-    result.passed = (result.failed_checks == 0) and result.tool_calls_verified
-
-    return result
+def build_output(case_id: str, trajectory: List[Dict], result: GraderResult, duration_sec: float,
+                 run_vars: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """构建 phase4_result.json 的内容（run_vars 为本次运行的占位符取值，见 run_vars.py）"""
+    output_data = {
+        'phase': 4,
+        'case_id': case_id,
+        'timestamp': datetime.now().isoformat(),
+        'passed': result.passed,
+        'duration_sec': round(duration_sec, 3),
+        'execution_trajectory': trajectory,
+        'grader_result': grader_result_to_dict(result)
+    }
+    if run_vars:
+        output_data['run_vars'] = run_vars
+    return output_data
 
 
 # ============================================================
@@ -453,9 +276,17 @@ def main():
     parser.add_argument('--work-dir', default='phase4_workspace', help='工作目录名（默认: phase4_workspace）')
     parser.add_argument('--output', help='输出结果文件路径')
     parser.add_argument('--keep-env', action='store_true', help='保留工作环境（不删除）')
+    parser.add_argument('--store', help='写入 SQLite 结果库（见 results_store.py）')
+    parser.add_argument('--no-json', action='store_true', help='不写 phase4_result.json（需配合 --store）')
+    parser.add_argument('--checkpoint', action='store_true', help='逐步保存沙箱快照，从最长未变前缀恢复（见 step_cache.py）')
+    parser.add_argument('--checkpoint-dir', help='检查点目录（默认: $CASE_STEP_CACHE 或 ~/.cache/agent-testcase/steps）')
+    parser.add_argument('--isolate', action='store_true',
+                        help='在独立的 user/pid/mount/net 命名空间中执行（私有 /tmp 和 loopback，见 isolation.py）')
     parser.add_argument('-v', '--verbose', action='store_true', help='详细输出')
 
     args = parser.parse_args()
+    if args.no_json and not args.store:
+        parser.error('--no-json requires --store')
 
     # 加载 case 文件
     case_path = Path(args.case_file).resolve()
@@ -487,34 +318,58 @@ def main():
     print(f"Reference solution steps: {len(reference_solution)}")
     print(f"Work directory: {work_dir}")
 
-    # Step 1: 设置工作环境
-    print(f"\n--- Setting up workspace ---")
-    setup_workspace(case_data, work_dir)
-
-    # Step 2: 执行 reference_solution
-    print(f"\n--- Executing Reference Solution ---")
-    trajectory = execute_reference_solution(work_dir, reference_solution)
-
-    for step in trajectory:
-        status = "✓" if step['success'] else "✗"
-        output_preview = step['output'][:60] if step['output'] else ''
-        print(f"  {status} Step {step['step']}: {step['tool']} - {output_preview}")
-
-    # Step 3: 验证 graders
-    print(f"\n--- Verifying Graders ---")
-    result = verify_graders(case_data, work_dir, trajectory)
-
-    for check_result in result.results:
-        status = "✓" if check_result.passed else "✗"
-        print(f"  {status} [{check_result.check_type}] {check_result.message}")
-        if args.verbose and check_result.description:
-            print(f"      {check_result.description}")
-
-    if result.tool_calls_details:
-        print(f"\n--- Tool Calls ---")
-        for tc in result.tool_calls_details:
-            status = "✓" if tc.get('verified') else "✗"
-            print(f"  {status} {tc.get('tool')}: {tc.get('description')}")
+    # 按运行占位符（{{PORT:name}} 等）：分配本次取值，之后全部使用渲染后的 case
+    run_vars = RunVars.allocate(case_data)
+    if run_vars.values:
+        case_data = run_vars.render(case_data)
+        reference_solution = case_data.get('reference_solution', [])
+        print(f"Run variables: {', '.join(f'{k}={v}' for k, v in run_vars.values.items())}")
+        if args.checkpoint:
+            print(f"Note: checkpoints disabled (case uses per-run placeholders)")
+            args.checkpoint = False
+
+    start_time = time.perf_counter()
+
+    # 隔离模式：init_commands、Bash 步骤和 check 都在该沙箱的命名空间内执行
+    with sandbox_namespace(work_dir, enabled=args.isolate):
+        # Step 1: 设置工作环境（有检查点时从最长未变前缀恢复）
+        print(f"\n--- Setting up workspace ---")
+        checkpoints = CheckpointStore(args.checkpoint_dir).session(case_data) if args.checkpoint else None
+        completed = checkpoints.restore(work_dir) if checkpoints else None
+        if completed is None:
+            setup_workspace(case_data, work_dir)
+        else:
+            print(f"  Resumed from checkpoint: {len(completed)}/{len(reference_solution)} steps cached")
+
+        # Step 2: 执行 reference_solution
+        print(f"\n--- Executing Reference Solution ---")
+        trajectory = execute_reference_solution(work_dir, reference_solution, checkpoints, completed)
+
+        for step in trajectory:
+            status = "✓" if step['success'] else "✗"
+            output_preview = step['output'][:60] if step['output'] else ''
+            cached = " (cached)" if completed and step['step'] <= len(completed) else ''
+            print(f"  {status} Step {step['step']}: {step['tool']} - {output_preview}{cached}")
+        if checkpoints is not None and checkpoints.limit < 0:
+            print(f"  Note: checkpoints disabled (init_commands start background processes)")
+        elif checkpoints is not None and checkpoints.limit < len(reference_solution):
+            print(f"  Note: checkpoints stop before step {checkpoints.limit + 1} (background process / KillShell)")
+
+        # Step 3: 验证 graders
+        print(f"\n--- Verifying Graders ---")
+        result = verify_graders(case_data, work_dir, trajectory)
+
+        for check_result in result.results:
+            status = "✓" if check_result.passed else "✗"
+            print(f"  {status} [{check_result.check_type}] {check_result.message}")
+            if args.verbose and check_result.description:
+                print(f"      {check_result.description}")
+
+        if result.tool_calls_details:
+            print(f"\n--- Tool Calls ---")
+            for tc in result.tool_calls_details:
+                status = "✓" if tc.get('verified') else "✗"
+                print(f"  {status} {tc.get('tool')}: {tc.get('description')}")
 
     # 输出结果
     print(f"\n{'='*60}")
@@ -527,39 +382,24 @@ def main():
     print(f"{'='*60}")
 
     # 保存结果
-    output_data = {
-        'phase': 4,
-        'case_id': case_id,
-        'timestamp': datetime.now().isoformat(),
-        'passed': result.passed,
-        'execution_trajectory': trajectory,
-        'grader_result': {
-            'passed': result.passed,
-            'total_checks': result.total_checks,
-            'passed_checks': result.passed_checks,
-            'failed_checks': result.failed_checks,
-            'tool_calls_verified': result.tool_calls_verified,
-            'tool_calls_details': result.tool_calls_details,
-            'details': [
-                {
-                    'check_type': r.check_type,
-                    'passed': r.passed,
-                    'message': r.message,
-                    'description': r.description
-                }
-                for r in result.results
-            ]
-        }
-    }
-
-    if args.output:
-        output_path = Path(args.output)
-    else:
-        output_path = working_dir / 'phase4_result.json'
-
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=2, ensure_ascii=False)
-    print(f"\nResult saved to: {output_path}")
+    output_data = build_output(case_id, trajectory, result, time.perf_counter() - start_time, run_vars.values)
+    run_vars.release()
+
+    if args.store:
+        from results_store import ResultsStore
+        with ResultsStore(Path(args.store)) as store:
+            store.record(output_data, case_data)
+        print(f"\nResult recorded in: {args.store}")
+
+    if not args.no_json:
+        if args.output:
+            output_path = Path(args.output)
+        else:
+            output_path = working_dir / 'phase4_result.json'
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        print(f"\nResult saved to: {output_path}")
 
     # 清理工作环境
     if not args.keep_env and work_dir.exists():
@@ -5,7 +5,7 @@ Phase 6: Haiku 验证脚本
 使用 Haiku 模型执行测试用例，验证弱模型是否能完成任务。
 
 用法:
-    python3 phase6_haiku.py <case_file> [--haiku-dir <dir>] [--timeout <seconds>]
+    python3 phase6_haiku.py <case_file> [--haiku-dir <dir>] [--timeout <seconds>] [--claude-bin <cmd>]
 
 功能:
 1. 在当前目录创建 haiku_space/ 子目录
@@ -20,17 +20,21 @@ import os
 import json
 import argparse
 import subprocess
-import shutil
+import shlex
 import time
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import Tuple, List, Dict, Any
+from typing import Tuple, List, Dict, Any, Optional
 
 # 添加 scripts 目录到路径，以便导入 custom_checks
 SCRIPT_DIR = Path(__file__).parent
 sys.path.insert(0, str(SCRIPT_DIR))
 
-from custom_checks import CHECK_REGISTRY, _resolve_path
+from grading import GraderResult, verify_graders, grader_result_to_dict
+from sandbox import setup_sandbox
+from isolation import active_namespace, kill_process_group, sandbox_namespace
+from run_vars import RunVars
 
 
 # ============================================================
@@ -45,87 +49,42 @@ def setup_haiku_space(case_data: dict, haiku_dir: Path) -> None:
         case_data: 测试用例数据
         haiku_dir: haiku 工作目录
     """
-    # 清理并创建目录
-    if haiku_dir.exists():
-        shutil.rmtree(haiku_dir)
-    haiku_dir.mkdir(parents=True, exist_ok=True)
-
-    # 1. 根据 environment 创建文件
-    environment = case_data.get('environment', [])
-    for file_info in environment:
-        file_path = file_info.get('path', '')
-        content = file_info.get('content', '')
-        executable = file_info.get('executable', False)
-
-        if not file_path:
-            continue
-
-        full_path = haiku_dir / file_path
-        full_path.parent.mkdir(parents=True, exist_ok=True)
-        full_path.write_text(content, encoding='utf-8')
-
-        if executable:
-            full_path.chmod(0o755)
-
-    print(f"  Created {len(environment)} environment files")
-
-    # 2. 执行 init_commands（KillShell 场景关键！）
-    init_commands = case_data.get('init_commands', [])
-    if init_commands:
-        print(f"  Executing {len(init_commands)} init commands...")
-        for cmd_info in init_commands:
-            command = cmd_info.get('command', '')
-            description = cmd_info.get('description', '')
-            wait_sec = cmd_info.get('wait_sec', 0)
-
-            if not command:
-                continue
-
-            print(f"    - {description}")
-            try:
-                result = subprocess.run(
-                    command,
-                    shell=True,
-                    cwd=str(haiku_dir),
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                if result.returncode != 0:
-                    print(f"      Warning: command returned {result.returncode}")
-                    if result.stderr:
-                        print(f"      stderr: {result.stderr[:100]}")
-            except subprocess.TimeoutExpired:
-                print(f"      Warning: command timed out")
-            except Exception as e:
-                print(f"      Error: {e}")
-
-            if wait_sec > 0:
-                time.sleep(wait_sec)
+    setup_sandbox(case_data, haiku_dir)
 
 
 # ============================================================
 # Haiku CLI 调用
 # ============================================================
 
-def _parse_stream_json(stdout: str) -> Tuple[List[Dict], str]:
+TOKEN_FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+
+
+def _parse_stream_json(stdout: str, arrivals: Optional[List[float]] = None) -> Tuple[List[Dict], str, Dict[str, Any]]:
     """
-    解析 stream-json 格式的输出，提取工具调用轨迹
+    解析 stream-json 格式的输出，提取工具调用轨迹和用量指标
 
     Args:
         stdout: stream-json 格式的输出
+        arrivals: 每一行到达的时间（相对启动的秒数，与 stdout 的行一一对应）；
+                  没有时（如回放）不计算延迟
 
     Returns:
-        (trajectory, final_output): 工具调用轨迹列表和最终文本输出
+        (trajectory, final_output, metrics): 工具调用轨迹列表、最终文本输出和用量指标（见 _new_metrics）
     """
     trajectory = []
     final_output_parts = []
     step_counter = 0
     tool_use_map = {}  # tool_use_id -> step_index 的映射
+    tool_started = {}  # tool_use_id -> tool_use 到达时间
+    metrics = _new_metrics()
+    turns = metrics['turns']
+    turn_ids = {}  # message id -> turns 下标
+    last_boundary = 0.0  # 上一次轮到模型的时间（启动或工具结果返回）
 
-    for line in stdout.strip().split('\n'):
+    for line_no, line in enumerate(stdout.split('\n')):
         if not line.strip():
             continue
+        arrival = arrivals[line_no] if arrivals is not None and line_no < len(arrivals) else None
 
         try:
             event = json.loads(line)
@@ -135,6 +94,21 @@ def _parse_stream_json(stdout: str) -> Tuple[List[Dict], str]:
                 message = event.get('message', {})
                 content_blocks = message.get('content', [])
 
+                # CLI 对同一条消息的每个内容块各发一个事件，usage 重复出现，按 message id 合并
+                message_id = message.get('id') or f"_line{line_no}"
+                if message_id not in turn_ids:
+                    turn_ids[message_id] = len(turns)
+                    turns.append({
+                        'turn': len(turns) + 1,
+                        **{field: 0 for field in TOKEN_FIELDS},
+                        'latency_ms': round((arrival - last_boundary) * 1000, 1) if arrival is not None else None,
+                        'tool_calls': 0
+                    })
+                turn = turns[turn_ids[message_id]]
+                usage = message.get('usage') or {}
+                for field in TOKEN_FIELDS:
+                    turn[field] = max(turn[field], usage.get(field) or 0)
+
                 for block in content_blocks:
                     block_type = block.get('type', '')
 
@@ -151,6 +125,9 @@ def _parse_stream_json(stdout: str) -> Tuple[List[Dict], str]:
                             'output': ''
                         })
                         tool_use_map[tool_use_id] = len(trajectory) - 1
+                        tool_started[tool_use_id] = arrival
+                        metrics['steps'].append({'step': step_counter, 'tool': tool_name, 'tool_ms': None})
+                        turn['tool_calls'] += 1
 
                     elif block_type == 'text':
                         text = block.get('text', '')
@@ -160,6 +137,8 @@ def _parse_stream_json(stdout: str) -> Tuple[List[Dict], str]:
             elif event_type == 'user':
                 message = event.get('message', {})
                 content_blocks = message.get('content', [])
+                if arrival is not None:
+                    last_boundary = arrival
 
                 for block in content_blocks:
                     if block.get('type') == 'tool_result':
@@ -169,39 +148,99 @@ def _parse_stream_json(stdout: str) -> Tuple[List[Dict], str]:
                         if tool_use_id in tool_use_map:
                             step_index = tool_use_map[tool_use_id]
                             trajectory[step_index]['output'] = content[:500] if len(content) > 500 else content
+                            started = tool_started.get(tool_use_id)
+                            if started is not None and arrival is not None:
+                                metrics['steps'][step_index]['tool_ms'] = round((arrival - started) * 1000, 1)
 
             elif event_type == 'result':
                 result_text = event.get('result', '')
                 if result_text and not final_output_parts:
                     final_output_parts.append(result_text)
+                for field in ('total_cost_usd', 'duration_ms', 'duration_api_ms', 'num_turns'):
+                    if event.get(field) is not None:
+                        metrics[field] = event[field]
 
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, AttributeError):
             continue
 
+    _summarize_metrics(metrics)
     final_output = '\n'.join(final_output_parts)
-    return trajectory, final_output
+    return trajectory, final_output, metrics
 
 
-def run_haiku_cli(query: str, haiku_dir: Path, timeout: int = 600) -> Dict[str, Any]:
+def _new_metrics() -> Dict[str, Any]:
+    """
+    用量指标：
+        turns   每轮模型调用的 token（input / output / cache 写入 / cache 读取）、
+                延迟（上一次工具结果返回到这条消息到达）、发起的工具调用数
+        steps   每个工具调用的执行时间（tool_use 到达到 tool_result 到达），与 trajectory 一一对应
+        totals  token 合计、模型延迟合计、工具时间合计
+        total_cost_usd / duration_ms / duration_api_ms / num_turns  取自 result 事件（CLI 提供时）
+    """
+    return {'turns': [], 'steps': [], 'totals': {}, 'total_cost_usd': None,
+            'duration_ms': None, 'duration_api_ms': None, 'num_turns': None}
+
+
+def _summarize_metrics(metrics: Dict[str, Any]) -> None:
+    turns = metrics['turns']
+    totals = {field: sum(t[field] for t in turns) for field in TOKEN_FIELDS}
+    latencies = [t['latency_ms'] for t in turns if t['latency_ms'] is not None]
+    tool_times = [s['tool_ms'] for s in metrics['steps'] if s['tool_ms'] is not None]
+    totals['model_ms'] = round(sum(latencies), 1) if latencies else None
+    totals['tool_ms'] = round(sum(tool_times), 1) if tool_times else None
+    metrics['totals'] = totals
+
+
+def format_usage(metrics: Dict[str, Any]) -> str:
+    """一行用量摘要"""
+    totals = metrics.get('totals') or {}
+    cost = metrics.get('total_cost_usd')
+    parts = [
+        f"Tokens: in {totals.get('input_tokens', 0)} / out {totals.get('output_tokens', 0)} / "
+        f"cache write {totals.get('cache_creation_input_tokens', 0)} / cache read {totals.get('cache_read_input_tokens', 0)}",
+        f"cost ${cost:.4f}" if cost is not None else "cost n/a",
+    ]
+    if totals.get('model_ms') is not None:
+        parts.append(f"model {totals['model_ms'] / 1000:.1f}s")
+    if totals.get('tool_ms') is not None:
+        parts.append(f"tools {totals['tool_ms'] / 1000:.1f}s")
+    return ', '.join(parts)
+
+
+def _read_stream(proc: subprocess.Popen, start: float) -> Tuple[str, List[float]]:
+    """逐行读取 stdout 并记录每行到达时间"""
+    lines, arrivals = [], []
+    for line in proc.stdout:
+        arrivals.append(time.monotonic() - start)
+        lines.append(line.rstrip('\n'))
+    return '\n'.join(lines), arrivals
+
+
+def run_haiku_cli(query: str, haiku_dir: Path, timeout: int = 600,
+                  claude_bin: str = 'claude', model: str = 'haiku') -> Dict[str, Any]:
     """
     使用 Claude CLI 运行 Haiku 验证
 
     关键：cwd 设置为 haiku_dir，Haiku 看不到外部的 case.json
 
+    stdout 边读边记录每行的到达时间，用于计算每轮模型延迟和每步工具耗时。
+
     Args:
         query: 用户问题
         haiku_dir: haiku 工作目录（Haiku 的 cwd）
         timeout: 超时秒数
+        claude_bin: CLI 命令（可带参数，如 "python3 fake_claude.py" 离线替身）
+        model: --model 参数（calibrate.py 用不同模型校准难度）
 
     Returns:
-        验证结果字典
+        验证结果字典（含 metrics 用量指标）
     """
     start_time = datetime.now()
+    start = time.monotonic()
 
     try:
-        cmd = [
-            'claude',
-            '--model', 'haiku',
+        cmd = shlex.split(claude_bin) + [
+            '--model', model,
             '--dangerously-skip-permissions',
             '--output-format', 'stream-json',
             '--verbose',
@@ -209,29 +248,58 @@ def run_haiku_cli(query: str, haiku_dir: Path, timeout: int = 600) -> Dict[str,
         ]
 
         # 关键：cwd 设置为 haiku_dir，Haiku 看不到外部的 case.json
-        result = subprocess.run(
+        env = None
+        namespace = active_namespace()
+        if namespace is not None:
+            cmd = namespace.wrap(cmd, haiku_dir)
+            env = namespace.agent_env()
+        proc = subprocess.Popen(
             cmd,
             cwd=str(haiku_dir),
-            capture_output=True,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=timeout
+            start_new_session=True
         )
+        stderr_parts: List[str] = []
+        stderr_reader = threading.Thread(target=lambda: stderr_parts.append(proc.stderr.read()), daemon=True)
+        stderr_reader.start()
+        timed_out = threading.Event()
+
+        def _kill():
+            # 结束整个进程组：隔离模式下 Agent 是 nsenter fork 出的子进程，只杀 nsenter 它会继续运行
+            timed_out.set()
+            kill_process_group(proc)
+
+        timer = threading.Timer(timeout, _kill)
+        timer.start()
+        try:
+            stdout, arrivals = _read_stream(proc, start)
+            returncode = proc.wait()
+        finally:
+            timer.cancel()
+        stderr_reader.join(timeout=5)
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
 
         duration = (datetime.now() - start_time).total_seconds()
 
         trajectory = []
         final_output = ""
+        metrics = _new_metrics()
 
-        if result.returncode == 0:
-            trajectory, final_output = _parse_stream_json(result.stdout)
+        if returncode == 0:
+            trajectory, final_output, metrics = _parse_stream_json(stdout, arrivals)
 
         return {
-            "success": result.returncode == 0,
+            "success": returncode == 0,
             "trajectory": trajectory,
             "total_steps": len(trajectory),
             "duration_sec": duration,
             "stdout": final_output,
-            "stderr": result.stderr
+            "stderr": ''.join(stderr_parts),
+            "metrics": metrics
         }
 
     except subprocess.TimeoutExpired:
@@ -254,100 +322,34 @@ def run_haiku_cli(query: str, haiku_dir: Path, timeout: int = 600) -> Dict[str,
         }
 
 
-# ============================================================
-# Grader 验证
-# ============================================================
-
-class CheckResult:
-    """单个检查的结果"""
-    def __init__(self, check_type: str, passed: bool, message: str, description: str = ""):
-        self.check_type = check_type
-        self.passed = passed
-        self.message = message
-        self.description = description
-
-
-class GraderResult:
-    """Grader 验证结果"""
-    def __init__(self):
-        self.passed = False
-        self.total_checks = 0
-        self.passed_checks = 0
-        self.failed_checks = 0
-        self.tool_calls_verified = False
-        self.tool_calls_details = []
-        self.results: List[CheckResult] = []
-
-
-def verify_graders(case_data: dict, haiku_dir: Path, trajectory: List[Dict]) -> GraderResult:
-    """
-    执行 grader 验证
-
-    Args:
-        case_data: 测试用例数据
-        haiku_dir: haiku 工作目录
-        trajectory: Haiku 执行轨迹
-
-    Returns:
-        GraderResult 验证结果
-    """
-    result = GraderResult()
-    graders = case_data.get('graders', [])
-
-    for grader in graders:
-        grader_type = grader.get('type', '')
-
-        if grader_type == 'state_check':
-            checks = grader.get('checks', [])
-            for check in checks:
-                check_type = check.get('check', '')
-                params = check.get('params', {})
-                description = check.get('description', '')
-
-                result.total_checks += 1
-
-                # 调用 custom_checks.py 中的检查函数
-                if check_type in CHECK_REGISTRY:
-                    check_func = CHECK_REGISTRY[check_type]
-                    try:
-                        passed, message = check_func(haiku_dir, params, trajectory)
-                    except Exception as e:
-                        passed, message = False, f"Check error: {e}"
-                else:
-                    passed, message = False, f"Unknown check type: {check_type}"
-
-                if passed:
-                    result.passed_checks += 1
-                else:
-                    result.failed_checks += 1
-
-                result.results.append(CheckResult(check_type, passed, message, description))
-
-        elif grader_type == 'tool_calls':
-            required = grader.get('required', [])
-            tools_used = set(step.get('tool', '') for step in trajectory)
-
-            all_verified = True
-            for req in required:
-                tool = req.get('tool', '')
-                desc = req.get('description', '')
-                verified = tool in tools_used
-
-                if not verified:
-                    all_verified = False
-
-                result.tool_calls_details.append({
-                    'tool': tool,
-                    'description': desc,
-                    'verified': verified
-                })
-
-            result.tool_calls_verified = all_verified
-
-    # 计算总体是否通过
-    result.passed = (result.failed_checks == 0) and result.tool_calls_verified
-
-    return result
+def build_output(case_id: str, haiku_result: Dict[str, Any], result: GraderResult,
+                 model: str = 'haiku') -> Dict[str, Any]:
+    """构建 phase6_result.json 的内容（haiku_result 中的 run_vars 为本次运行的占位符取值）"""
+    output_data = {
+        'phase': 6,
+        'case_id': case_id,
+        'timestamp': datetime.now().isoformat(),
+        'model': model,
+        'haiku_execution': {
+            'success': haiku_result.get('success', False),
+            'total_steps': haiku_result.get('total_steps', 0),
+            'duration_sec': haiku_result.get('duration_sec', 0),
+            'trajectory': haiku_result.get('trajectory', []),
+            'error': haiku_result.get('error'),
+            'metrics': haiku_result.get('metrics', _new_metrics())
+        },
+        'grader_result': grader_result_to_dict(result),
+        'haiku_evaluation': {
+            'passed': result.passed,
+            'haiku_steps': haiku_result.get('total_steps', 0),
+            'duration_sec': haiku_result.get('duration_sec', 0),
+            'passed_checks': result.passed_checks,
+            'total_checks': result.total_checks
+        }
+    }
+    if haiku_result.get('run_vars'):
+        output_data['run_vars'] = haiku_result['run_vars']
+    return output_data
 
 
 # ============================================================
@@ -360,9 +362,23 @@ def main():
     parser.add_argument('--haiku-dir', default='haiku_space', help='Haiku 工作目录名（默认: haiku_space）')
     parser.add_argument('--output', help='输出结果文件路径')
     parser.add_argument('--timeout', type=int, default=600, help='Haiku 执行超时秒数（默认: 600）')
+    parser.add_argument('--model', default='haiku', help='模型（默认: haiku；多模型校准见 calibrate.py）')
+    parser.add_argument('--store', help='写入 SQLite 结果库（见 results_store.py）')
+    parser.add_argument('--no-json', action='store_true', help='不写 phase6_result.json（需配合 --store）')
+    parser.add_argument('--claude-bin', default=os.environ.get('CLAUDE_BIN', 'claude'),
+                        help='claude CLI 命令（默认: claude，可用 fake_claude.py 离线替身）')
+    parser.add_argument('--replay-cache', default=os.environ.get('PHASE6_REPLAY_CACHE'),
+                        help='轨迹回放缓存目录（见 replay_cache.py）')
+    parser.add_argument('--capture-state', metavar='BLOB_DIR',
+                        help='把最终沙箱状态以差异形式写入结果（内容存入 BLOB_DIR，见 state_diff.py）')
+    parser.add_argument('--regrade', action='store_true', help='从回放缓存恢复状态并重新评分，不调用模型')
+    parser.add_argument('--isolate', action='store_true',
+                        help='在独立的命名空间中运行模型和 check（私有 /tmp、loopback，外网走代理，见 isolation.py）')
     parser.add_argument('-v', '--verbose', action='store_true', help='详细输出')
 
     args = parser.parse_args()
+    if args.no_json and not args.store:
+        parser.error('--no-json requires --store')
 
     # 加载 case 文件
     case_path = Path(args.case_file).resolve()
@@ -389,33 +405,80 @@ def main():
     print(f"Query: {query[:80]}..." if len(query) > 80 else f"Query: {query}")
     print(f"Working directory: {working_dir}")
     print(f"Haiku directory: {haiku_dir}")
-
-    # Step 1: 设置 haiku_space 环境
-    print(f"\n--- Setting up Haiku environment ---")
-    setup_haiku_space(case_data, haiku_dir)
-
-    # Step 2: 执行 Haiku 验证
-    print(f"\n--- Running Haiku validation ---")
-    print(f"This may take a few minutes...")
-
-    haiku_result = run_haiku_cli(query, haiku_dir, args.timeout)
-
-    print(f"Execution completed in {haiku_result.get('duration_sec', 0):.1f}s")
-    print(f"Total steps: {haiku_result.get('total_steps', 0)}")
-
-    if not haiku_result.get('success'):
-        error = haiku_result.get('error', 'Unknown')
-        print(f"Warning: Haiku execution issue: {error}")
-
-    if args.verbose and haiku_result.get('trajectory'):
-        print(f"\n--- Haiku trajectory ---")
-        for step in haiku_result['trajectory']:
-            print(f"  Step {step['step']}: {step['tool']}")
-
-    # Step 3: 验证 graders
-    print(f"\n--- Verifying Graders ---")
-    trajectory = haiku_result.get('trajectory', [])
-    result = verify_graders(case_data, haiku_dir, trajectory)
+    print(f"Model: {args.model}")
+
+    replay_cache = None
+    cache_fields = None
+    if args.replay_cache:
+        from replay_cache import ReplayCache, get_cli_version
+        replay_cache = ReplayCache(Path(args.replay_cache))
+        # regrade 不调用 CLI（可能没装或已升级），按不含 CLI 版本的字段取最近一次运行
+        cli_version = '' if args.regrade else get_cli_version(args.claude_bin)
+        cache_fields = ReplayCache.key_fields(query, case_data, args.model, cli_version)
+    elif args.regrade:
+        print("Error: --regrade requires --replay-cache")
+        sys.exit(2)
+
+    # 隔离模式：模型、init_commands 和 check 都在该沙箱的命名空间内执行，外网经 egress 代理
+    with sandbox_namespace(haiku_dir, enabled=args.isolate, egress=True):
+        if args.regrade:
+            # 从缓存恢复最终状态，跳过模型调用
+            cache_key = replay_cache.latest_key(cache_fields)
+            cached = replay_cache.load(cache_key) if cache_key else None
+            if cached is None:
+                print(f"Error: no cached run for this case and model, run without --regrade first")
+                sys.exit(2)
+            print(f"\n--- Restoring cached run {cache_key[:12]} ({cached['saved_at']}, "
+                  f"CLI {cached['fields'].get('cli_version') or 'unknown'}) ---")
+            haiku_result = cached['haiku_result']
+            # 沿用缓存运行的占位符取值，最终状态和 grader 参数才对得上
+            run_vars = RunVars(haiku_result.get('run_vars'))
+            case_data = run_vars.render(case_data)
+            replay_cache.restore(cache_key, haiku_dir, case_data)
+        else:
+            # 按运行占位符（{{PORT:name}} 等）：分配本次取值，query、环境和 grader 使用同一组值
+            run_vars = RunVars.allocate(case_data)
+            if run_vars.values:
+                case_data = run_vars.render(case_data)
+                query = run_vars.render(query)
+                print(f"Run variables: {', '.join(f'{k}={v}' for k, v in run_vars.values.items())}")
+
+            # Step 1: 设置 haiku_space 环境
+            print(f"\n--- Setting up Haiku environment ---")
+            setup_haiku_space(case_data, haiku_dir)
+
+            # Step 2: 执行 Haiku 验证
+            print(f"\n--- Running Haiku validation ---")
+            print(f"This may take a few minutes...")
+
+            haiku_result = run_haiku_cli(query, haiku_dir, args.timeout, args.claude_bin, args.model)
+            if run_vars.values:
+                haiku_result['run_vars'] = run_vars.values
+
+            if replay_cache is not None and haiku_result.get('success'):
+                cache_key = replay_cache.save(cache_fields, haiku_result, haiku_dir, case_data)
+                print(f"Cached run as {cache_key[:12]}")
+
+        print(f"Execution completed in {haiku_result.get('duration_sec', 0):.1f}s")
+        print(f"Total steps: {haiku_result.get('total_steps', 0)}")
+
+        if not haiku_result.get('success'):
+            error = haiku_result.get('error', 'Unknown')
+            print(f"Warning: Haiku execution issue: {error}")
+
+        if args.verbose and haiku_result.get('trajectory'):
+            print(f"\n--- Haiku trajectory ---")
+            step_ms = {s['step']: s['tool_ms'] for s in haiku_result.get('metrics', _new_metrics())['steps']}
+            for step in haiku_result['trajectory']:
+                tool_ms = step_ms.get(step['step'])
+                timing = f" ({tool_ms:.0f} ms)" if tool_ms is not None else ""
+                print(f"  Step {step['step']}: {step['tool']}{timing}")
+
+        # Step 3: 验证 graders
+        print(f"\n--- Verifying Graders ---")
+        trajectory = haiku_result.get('trajectory', [])
+        result = verify_graders(case_data, haiku_dir, trajectory)
+        run_vars.release()
 
     for check_result in result.results:
         status = "✓" if check_result.passed else "✗"
@@ -436,54 +499,32 @@ def main():
     print(f"  Checks: {result.passed_checks}/{result.total_checks} passed")
     print(f"  Haiku steps: {haiku_result.get('total_steps', 0)}")
     print(f"  Duration: {haiku_result.get('duration_sec', 0):.1f}s")
+    print(f"  {format_usage(haiku_result.get('metrics', _new_metrics()))}")
     print(f"{'='*60}")
 
     # 保存结果
-    output_data = {
-        'phase': 6,
-        'case_id': case_id,
-        'timestamp': datetime.now().isoformat(),
-        'haiku_execution': {
-            'success': haiku_result.get('success', False),
-            'total_steps': haiku_result.get('total_steps', 0),
-            'duration_sec': haiku_result.get('duration_sec', 0),
-            'trajectory': haiku_result.get('trajectory', []),
-            'error': haiku_result.get('error')
-        },
-        'grader_result': {
-            'passed': result.passed,
-            'total_checks': result.total_checks,
-            'passed_checks': result.passed_checks,
-            'failed_checks': result.failed_checks,
-            'tool_calls_verified': result.tool_calls_verified,
-            'tool_calls_details': result.tool_calls_details,
-            'details': [
-                {
-                    'check_type': r.check_type,
-                    'passed': r.passed,
-                    'message': r.message,
-                    'description': r.description
-                }
-                for r in result.results
-            ]
-        },
-        'haiku_evaluation': {
-            'passed': result.passed,
-            'haiku_steps': haiku_result.get('total_steps', 0),
-            'duration_sec': haiku_result.get('duration_sec', 0),
-            'passed_checks': result.passed_checks,
-            'total_checks': result.total_checks
-        }
-    }
-
-    if args.output:
-        output_path = Path(args.output)
-    else:
-        output_path = working_dir / 'phase6_result.json'
-
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, indent=2, ensure_ascii=False)
-    print(f"\nResult saved to: {output_path}")
+    output_data = build_output(case_id, haiku_result, result, args.model)
+
+    if args.capture_state:
+        from state_diff import BlobDir, capture_state_diff, summarize
+        output_data['final_state'] = capture_state_diff(case_data, haiku_dir, BlobDir(Path(args.capture_state)))
+        print(f"Captured final state: {summarize(output_data['final_state'])}")
+
+    if args.store:
+        from results_store import ResultsStore
+        with ResultsStore(Path(args.store)) as store:
+            store.record(output_data, case_data)
+        print(f"\nResult recorded in: {args.store}")
+
+    if not args.no_json:
+        if args.output:
+            output_path = Path(args.output)
+        else:
+            output_path = working_dir / 'phase6_result.json'
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        print(f"\nResult saved to: {output_path}")
 
     sys.exit(0 if result.passed else 1)
 
@@ -21,19 +21,30 @@ import argparse
 import re
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Tuple, Optional
 
 # 添加 src 到路径
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent
 sys.path.insert(0, str(PROJECT_ROOT / 'src'))
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from answer_scan import scan_case
+from blob_store import env_content, env_size
+from case_reader import load_case
+
+# 提示语扫描只看这个大小以内的环境文件（大文件多为生成的数据，不读入内存）
+HINT_SCAN_MAX_BYTES = 1 << 20
 
 
 class QualityAnalyzer:
     """测试用例质量分析器"""
 
-    def __init__(self, case_data: Dict):
+    def __init__(self, case_data: Dict, phase4_result: Optional[Dict] = None,
+                 phase6_result: Optional[Dict] = None):
         self.case_data = case_data
+        self.phase4_result = phase4_result
+        self.phase6_result = phase6_result
         self.task = case_data.get('task', {})
         self.environment = case_data.get('environment', [])
         self.reference_solution = case_data.get('reference_solution', [])
@@ -57,6 +68,7 @@ class QualityAnalyzer:
             'info_distribution': self._analyze_info_distribution(),
             'query_quality': self._analyze_query_quality(),
             'grader_quality': self._analyze_grader_quality(),
+            'validation': self._analyze_validation(),
         }
 
         # 计算总体评级
@@ -92,18 +104,22 @@ class QualityAnalyzer:
                         risks.append(f"布尔值容易被猜测: {keyword}")
                         risk_score += 1
 
-        # 检查答案是否在 Query 中直接给出
-        query = self.task.get('desc', '')
-        for grader in self.graders:
-            for check in grader.get('checks', []):
-                keyword = check.get('params', {}).get('keyword', '')
-                if keyword and keyword in query:
-                    risks.append(f"答案值直接出现在 Query 中: {keyword[:30]}")
-                    risk_score += 5
+        # 检查答案是否在 Query 中直接给出，或已存在于目标文件中
+        answer_leaks = scan_case(self.case_data)
+        for leak in answer_leaks:
+            if leak['kind'] == 'query':
+                risks.append(f"答案值直接出现在 Query 中: {leak['token'][:30]}")
+                risk_score += 5
+            elif leak['kind'] == 'preexisting':
+                risks.append(f"答案值已存在于目标文件中: {leak['source']}:{leak['line']} "
+                             f"({leak['token'][:30]})")
+                risk_score += 3
 
         # 检查环境文件中是否有过于明显的提示
         for env_file in self.environment:
-            content = env_file.get('content', '')
+            if env_size(env_file) > HINT_SCAN_MAX_BYTES:
+                continue
+            content = env_content(env_file)
             # 检查是否有 "should be", "correct value is" 等提示
             if re.search(r'(should be|correct.*is|fix.*to|change.*to)\s*[:=]?\s*\w+', content, re.IGNORECASE):
                 risks.append(f"环境文件包含明显提示: {env_file.get('path', '')}")
@@ -114,7 +130,8 @@ class QualityAnalyzer:
         return {
             'level': level,
             'score': risk_score,
-            'risks': risks
+            'risks': risks,
+            'answer_leaks': answer_leaks
         }
 
     def _check_difficulty(self) -> Dict[str, Any]:
@@ -248,6 +265,31 @@ class QualityAnalyzer:
             'issues': issues
         }
 
+    def _analyze_validation(self) -> Dict[str, Any]:
+        """结合 Phase 4 / Phase 6 结果（如果提供）"""
+        issues = []
+        phase4_passed = None
+        phase6_passed = None
+
+        if self.phase4_result is not None:
+            phase4_passed = self.phase4_result.get('passed', False)
+            if not phase4_passed:
+                issues.append("Phase 4 自测未通过，reference_solution 无法满足 graders")
+
+        if self.phase6_result is not None:
+            phase6_passed = self.phase6_result.get('grader_result', {}).get('passed', False)
+            difficulty = self.task.get('difficulty', 0)
+            if phase6_passed and isinstance(difficulty, int) and difficulty >= 6:
+                issues.append(f"Haiku 通过了 D{difficulty} 题目，难度可能偏低")
+
+        return {
+            'available': self.phase4_result is not None or self.phase6_result is not None,
+            'phase4_passed': phase4_passed,
+            'phase6_passed': phase6_passed,
+            'passed': phase4_passed is not False,
+            'issues': issues
+        }
+
     def _calculate_overall_rating(self, results: Dict) -> Dict[str, Any]:
         """计算总体评级"""
         score = 100
@@ -270,6 +312,9 @@ class QualityAnalyzer:
         if not results['grader_quality']['passed']:
             score -= 10
 
+        if not results['validation']['passed']:
+            score -= 30
+
         # 评级
         if score >= 90:
             level = 'excellent'
@@ -305,6 +350,9 @@ class QualityAnalyzer:
         if not results['grader_quality']['passed']:
             recommendations.append("改进 Grader：增加内容验证，不只检查文件存在")
 
+        if not results['validation']['passed']:
+            recommendations.append("先修复 Phase 4 自测失败的问题")
+
         return "; ".join(recommendations) if recommendations else "质量良好，无需改进"
 
 
@@ -315,6 +363,7 @@ def main():
     parser.add_argument('--phase6-result', help='Phase 6 结果文件')
     parser.add_argument('--output', help='输出结果文件')
     parser.add_argument('--json', action='store_true', help='只输出 JSON')
+    parser.add_argument('--store', help='写入 SQLite 结果库（见 results_store.py）')
 
     args = parser.parse_args()
 
@@ -324,8 +373,8 @@ def main():
         print(f"Error: Case file not found: {args.case_file}")
         sys.exit(1)
 
-    with open(case_path, 'r', encoding='utf-8') as f:
-        case_data = json.load(f)
+    # 环境文件内容按需读取，不整体解码
+    case_data = load_case(case_path)
 
     # 提取信息
     task = case_data.get('task', {})
@@ -337,8 +386,18 @@ def main():
         print(f"{'='*60}")
         print(f"Case ID: {case_id}")
 
+    # 加载 Phase 4 / Phase 6 结果（可选）
+    phase4_result = None
+    phase6_result = None
+    if args.phase4_result:
+        with open(args.phase4_result, 'r', encoding='utf-8') as f:
+            phase4_result = json.load(f)
+    if args.phase6_result:
+        with open(args.phase6_result, 'r', encoding='utf-8') as f:
+            phase6_result = json.load(f)
+
     # 执行质量分析
-    analyzer = QualityAnalyzer(case_data)
+    analyzer = QualityAnalyzer(case_data, phase4_result, phase6_result)
     results = analyzer.analyze()
 
     if args.json:
@@ -350,6 +409,9 @@ def main():
         print(f"  风险分数: {results['hacking_risk']['score']}")
         for risk in results['hacking_risk']['risks']:
             print(f"  ⚠ {risk}")
+        clues = [l for l in results['hacking_risk']['answer_leaks'] if l['kind'] == 'clue']
+        for leak in clues:
+            print(f"  · 线索: {leak['source']}:{leak['line']} 包含答案值 '{leak['token'][:30]}'")
 
         # 难度检查
         print(f"\n--- 难度检查 ---")
@@ -384,6 +446,14 @@ def main():
         for issue in gq['issues']:
             print(f"  ⚠ {issue}")
 
+        # 验证结果
+        va = results['validation']
+        if va['available']:
+            print(f"\n--- 验证结果 ---")
+            print(f"  Phase 4: {va['phase4_passed']}, Phase 6: {va['phase6_passed']}")
+            for issue in va['issues']:
+                print(f"  ⚠ {issue}")
+
         # 总体评级
         print(f"\n{'='*60}")
         overall = results['overall']
@@ -399,6 +469,11 @@ def main():
         'quality_analysis': results
     }
 
+    if args.store:
+        from results_store import ResultsStore
+        with ResultsStore(Path(args.store)) as store:
+            store.record(output_data, case_data)
+
     if args.output:
         output_path = Path(args.output)
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+单进程流水线：Phase 4 → Phase 6 → Phase 7
+
+在一个进程内完成三个阶段，case.json 只解析一次，environment 只构建一次模板，
+阶段之间的结果直接在内存中传递。
+
+用法:
+    python3 pipeline.py <case_file>... [--phases 4,6,7] [--force] [--store <db>] [--no-json]
+
+阶段依赖（DAG）:
+    phase4  ← 无
+    phase6  ← phase4 通过（--force 或未选中 phase4 时不检查）
+    phase7  ← phase4、phase6 的结果（可缺省，缺省时只做静态分析）
+
+输出:
+    每个 case 目录下的 phase4_result.json / phase6_result.json / phase7_result.json
+    （--no-json 时不写），以及可选的 SQLite 结果库。
+"""
+import sys
+import os
+import json
+import argparse
+import shutil
+import time
+from datetime import datetime
+from graphlib import TopologicalSorter
+from pathlib import Path
+from typing import List, Dict, Any
+
+# 添加 scripts 目录到路径
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from grading import verify_graders
+from sandbox import apply_run_vars, build_template, clone_template, run_init_commands
+from step_cache import CheckpointStore
+from isolation import sandbox_namespace
+from run_vars import RunVars
+import phase4_verify
+import phase6_haiku
+from phase7_quality import QualityAnalyzer
+
+
+TEMPLATE_DIR_NAME = '.pipeline_template'
+
+
+class PipelineContext:
+    """单个 case 在流水线中的共享状态"""
+
+    def __init__(self, case_path: Path, case_data: dict, args: argparse.Namespace):
+        self.case_path = case_path
+        self.case_data = case_data
+        self.args = args
+        self.working_dir = case_path.parent
+        self.template_dir = self.working_dir / TEMPLATE_DIR_NAME
+        self.case_id = case_data.get('task', {}).get('id', case_path.stem)
+        self.outputs: Dict[str, Dict[str, Any]] = {}
+        self.status: Dict[str, str] = {}
+
+    def sandbox_from_template(self, name: str, run_vars: RunVars) -> Path:
+        """从模板复制一个沙箱，代入本阶段的占位符取值并执行 init_commands"""
+        if not self.template_dir.exists():
+            build_template(self.case_data, self.template_dir)
+        sandbox_dir = self.working_dir / name
+        clone_template(self.template_dir, sandbox_dir)
+        apply_run_vars(self.case_data, run_vars, sandbox_dir)
+        run_init_commands(run_vars.render(self.case_data), sandbox_dir)
+        return sandbox_dir
+
+
+# ============================================================
+# 阶段实现
+# ============================================================
+
+def run_phase4(ctx: PipelineContext) -> Dict[str, Any]:
+    """Phase 4：按 reference_solution 执行并验证 graders"""
+    start_time = time.perf_counter()
+    run_vars = RunVars.allocate(ctx.case_data)
+    run_case = run_vars.render(ctx.case_data)
+    # 含按运行占位符的 case 每次取值不同，检查点无法复用
+    use_checkpoint = ctx.args.checkpoint and not run_vars.values
+    checkpoints = CheckpointStore(ctx.args.checkpoint_dir).session(ctx.case_data) if use_checkpoint else None
+    work_dir = ctx.working_dir / ctx.args.work_dir
+    with run_vars, sandbox_namespace(work_dir, enabled=ctx.args.isolate):
+        completed = checkpoints.restore(work_dir) if checkpoints else None
+        if completed is None:
+            work_dir = ctx.sandbox_from_template(ctx.args.work_dir, run_vars)
+        else:
+            print(f"  Phase 4: resumed from checkpoint ({len(completed)} steps cached)")
+
+        trajectory = phase4_verify.execute_reference_solution(work_dir, run_case.get('reference_solution', []),
+                                                              checkpoints, completed)
+        result = verify_graders(run_case, work_dir, trajectory)
+
+    if not ctx.args.keep_env:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"  Phase 4: {'PASSED' if result.passed else 'FAILED'} "
+          f"({result.passed_checks}/{result.total_checks} checks)")
+    return phase4_verify.build_output(ctx.case_id, trajectory, result, time.perf_counter() - start_time,
+                                      run_vars.values)
+
+
+def run_phase6(ctx: PipelineContext) -> Dict[str, Any]:
+    """Phase 6：在隔离目录中运行 Haiku 并验证 graders"""
+    haiku_dir = ctx.working_dir / ctx.args.haiku_dir
+    run_vars = RunVars.allocate(ctx.case_data)
+    run_case = run_vars.render(ctx.case_data)
+    query = run_case.get('task', {}).get('desc', '')
+
+    with run_vars, sandbox_namespace(haiku_dir, enabled=ctx.args.isolate, egress=True):
+        haiku_dir = ctx.sandbox_from_template(ctx.args.haiku_dir, run_vars)
+        haiku_result = phase6_haiku.run_haiku_cli(query, haiku_dir, ctx.args.timeout, ctx.args.claude_bin)
+        result = verify_graders(run_case, haiku_dir, haiku_result.get('trajectory', []))
+    if run_vars.values:
+        haiku_result['run_vars'] = run_vars.values
+
+    if not ctx.args.keep_env:
+        shutil.rmtree(haiku_dir, ignore_errors=True)
+
+    print(f"  Phase 6: {'PASSED' if result.passed else 'FAILED'} "
+          f"({result.passed_checks}/{result.total_checks} checks, "
+          f"{haiku_result.get('total_steps', 0)} steps, {haiku_result.get('duration_sec', 0):.1f}s)")
+    return phase6_haiku.build_output(ctx.case_id, haiku_result, result)
+
+
+def run_phase7(ctx: PipelineContext) -> Dict[str, Any]:
+    """Phase 7：质量评估，直接使用内存中的 Phase 4 / 6 结果"""
+    analyzer = QualityAnalyzer(ctx.case_data, ctx.outputs.get('phase4'), ctx.outputs.get('phase6'))
+    results = analyzer.analyze()
+    overall = results['overall']
+    print(f"  Phase 7: {overall['score']}/100 ({overall['level'].upper()})")
+    return {
+        'phase': 7,
+        'case_id': ctx.case_id,
+        'timestamp': datetime.now().isoformat(),
+        'quality_analysis': results
+    }
+
+
+def _phase4_passed(ctx: PipelineContext) -> bool:
+    return ctx.outputs.get('phase4', {}).get('passed', False)
+
+
+# 阶段名 -> (依赖, 执行函数, 运行条件)
+PHASES = {
+    'phase4': ([], run_phase4, None),
+    'phase6': (['phase4'], run_phase6, _phase4_passed),
+    'phase7': (['phase4', 'phase6'], run_phase7, None),
+}
+
+
+# ============================================================
+# 调度
+# ============================================================
+
+def plan_phases(selected: List[str]) -> List[str]:
+    """按依赖关系排出执行顺序（只保留选中的阶段）"""
+    graph = {name: [d for d in PHASES[name][0] if d in selected] for name in selected}
+    return list(TopologicalSorter(graph).static_order())
+
+
+def run_case(case_path: Path, args: argparse.Namespace, order: List[str], store=None) -> bool:
+    """
+    对单个 case 执行流水线
+
+    Returns:
+        所有已执行阶段是否通过
+    """
+    with open(case_path, 'r', encoding='utf-8') as f:
+        case_data = json.load(f)
+
+    ctx = PipelineContext(case_path, case_data, args)
+    print(f"\n{'='*60}")
+    print(f"Case: {ctx.case_id} ({case_path})")
+    print(f"{'='*60}")
+
+    try:
+        for name in order:
+            deps, func, condition = PHASES[name]
+            # 运行条件针对本次执行的依赖阶段；依赖未被选中（如 --phases 6,7）时不检查
+            checked = condition is not None and not args.force and any(d in order for d in deps)
+            if checked and not condition(ctx):
+                ctx.status[name] = 'skipped'
+                print(f"  {name}: skipped (dependency not satisfied)")
+                continue
+
+            # 单个阶段出错不影响已产生的结果和后续 case
+            try:
+                ctx.outputs[name] = func(ctx)
+                ctx.status[name] = 'done'
+            except Exception as e:
+                ctx.status[name] = 'error'
+                print(f"  {name}: error: {e}")
+    finally:
+        if ctx.template_dir.exists():
+            shutil.rmtree(ctx.template_dir, ignore_errors=True)
+
+    for name, output_data in ctx.outputs.items():
+        if store is not None:
+            store.record(output_data, case_data)
+        if not args.no_json:
+            output_path = ctx.working_dir / f"{name}_result.json"
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, indent=2, ensure_ascii=False)
+
+    passed = True
+    if 'phase4' in ctx.outputs:
+        passed = passed and ctx.outputs['phase4'].get('passed', False)
+    if 'phase6' in ctx.outputs:
+        passed = passed and ctx.outputs['phase6']['grader_result'].get('passed', False)
+    if 'phase7' in ctx.outputs:
+        level = ctx.outputs['phase7']['quality_analysis']['overall']['level']
+        passed = passed and level != 'needs_improvement'
+    return passed and not {'skipped', 'error'} & set(ctx.status.values())
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='单进程流水线：Phase 4 → 6 → 7')
+    parser.add_argument('case_files', nargs='+', help='测试用例 JSON 文件路径')
+    parser.add_argument('--phases', default='4,6,7', help='执行的阶段（默认: 4,6,7）')
+    parser.add_argument('--force', action='store_true', help='Phase 4 失败时仍执行 Phase 6')
+    parser.add_argument('--work-dir', default='phase4_workspace', help='Phase 4 工作目录名')
+    parser.add_argument('--haiku-dir', default='haiku_space', help='Haiku 工作目录名')
+    parser.add_argument('--timeout', type=int, default=600, help='Haiku 执行超时秒数（默认: 600）')
+    parser.add_argument('--claude-bin', default=os.environ.get('CLAUDE_BIN', 'claude'), help='claude CLI 命令')
+    parser.add_argument('--keep-env', action='store_true', help='保留工作环境（不删除）')
+    parser.add_argument('--checkpoint', action='store_true', help='Phase 4 逐步保存沙箱快照，从最长未变前缀恢复')
+    parser.add_argument('--checkpoint-dir', help='检查点目录（默认: $CASE_STEP_CACHE 或 ~/.cache/agent-testcase/steps）')
+    parser.add_argument('--isolate', action='store_true', help='Phase 4 / 6 在独立的命名空间中执行（见 isolation.py）')
+    parser.add_argument('--store', help='写入 SQLite 结果库（见 results_store.py）')
+    parser.add_argument('--no-json', action='store_true', help='不写 phase*_result.json（需配合 --store）')
+
+    args = parser.parse_args()
+    if args.no_json and not args.store:
+        parser.error('--no-json requires --store')
+
+    selected = [f"phase{p.strip()}" for p in args.phases.split(',') if p.strip()]
+    unknown = [p for p in selected if p not in PHASES]
+    if unknown:
+        print(f"Error: unknown phase(s): {unknown}")
+        sys.exit(1)
+    order = plan_phases(selected)
+
+    store = None
+    if args.store:
+        from results_store import ResultsStore
+        store = ResultsStore(Path(args.store))
+
+    failed = []
+    try:
+        for case_file in args.case_files:
+            case_path = Path(case_file).resolve()
+            if not case_path.exists():
+                print(f"Error: Case file not found: {case_file}")
+                failed.append(case_file)
+                continue
+            try:
+                ok = run_case(case_path, args, order, store)
+            except Exception as e:
+                print(f"Error: {case_file}: {e}")
+                ok = False
+            if not ok:
+                failed.append(case_file)
+    finally:
+        if store is not None:
+            store.close()
+
+    print(f"\n{'='*60}")
+    print(f"Pipeline finished: {len(args.case_files) - len(failed)}/{len(args.case_files)} cases passed")
+    for case_file in failed:
+        print(f"  ✗ {case_file}")
+    print(f"{'='*60}")
+
+    sys.exit(0 if not failed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+轨迹回放缓存
+
+修了 grader 之后不必重新跑 Haiku：phase6 把每次运行的轨迹和最终沙箱状态
+按 (query, environment 哈希, model, CLI 版本) 存下来，`--regrade` 时恢复
+沙箱状态并直接对存档重新执行 verify_graders。regrade 不调用 CLI：按
+(query, environment, init_commands, model) 取最近一次保存的条目，不论 CLI 版本。
+
+最终状态以相对 environment 的差异保存（见 state_diff.py），文件内容在
+整个缓存目录内按哈希去重，每条记录通常只有几 KB。
+
+注意：只保存文件状态，后台进程不会被恢复，bash_process_running 一类
+依赖进程状态的 check 在 regrade 时结果不可靠。
+
+用法:
+    # phase6 运行时写入缓存
+    python3 phase6_haiku.py case.json --replay-cache <dir>
+    # 只重新评分，不调用模型
+    python3 phase6_haiku.py case.json --replay-cache <dir> --regrade
+
+    # 查看缓存
+    python3 replay_cache.py <dir> list
+"""
+import os
+import sys
+import json
+import argparse
+import hashlib
+import shutil
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from sandbox import environment_hash
+from state_diff import BlobDir, capture_state_diff, apply_state_diff
+
+
+_cli_versions: Dict[str, str] = {}
+
+
+def get_cli_version(claude_bin: str) -> str:
+    """获取 claude CLI 版本（同一进程内缓存）"""
+    if claude_bin not in _cli_versions:
+        try:
+            import shlex
+            result = subprocess.run(
+                shlex.split(claude_bin) + ['--version'],
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
+            _cli_versions[claude_bin] = result.stdout.strip() or 'unknown'
+        except Exception:
+            _cli_versions[claude_bin] = 'unknown'
+    return _cli_versions[claude_bin]
+
+
+class ReplayCache:
+    """按内容寻址的轨迹 + 最终状态缓存"""
+
+    STATE_FILE = 'state_diff.json'
+    META_FILE = 'meta.json'
+    LATEST_DIR = 'latest'
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.blobs = BlobDir(self.root / 'blobs')
+
+    @staticmethod
+    def key_fields(query: str, case_data: dict, model: str, cli_version: str = '') -> Dict[str, str]:
+        """组成缓存键的字段（init_commands 影响初始状态，一并计入）"""
+        init_payload = json.dumps(case_data.get('init_commands', []), sort_keys=True, ensure_ascii=False)
+        return {
+            'query': query,
+            'environment_hash': environment_hash(case_data),
+            'init_hash': hashlib.sha256(init_payload.encode('utf-8')).hexdigest(),
+            'model': model,
+            'cli_version': cli_version
+        }
+
+    @staticmethod
+    def make_key(fields: Dict[str, str]) -> str:
+        payload = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _latest_path(self, fields: Dict[str, str]) -> Path:
+        """不含 CLI 版本的键 -> 最近保存的缓存键"""
+        run_key = self.make_key({k: v for k, v in fields.items() if k != 'cli_version'})
+        return self.root / self.LATEST_DIR / run_key[:2] / run_key
+
+    def save(self, fields: Dict[str, str], haiku_result: Dict[str, Any], sandbox_dir: Path,
+             case_data: dict) -> str:
+        """
+        保存一次运行
+
+        Args:
+            fields: key_fields() 的返回值
+            haiku_result: run_haiku_cli() 的返回值
+            sandbox_dir: 运行结束后的沙箱目录
+            case_data: 测试用例数据（差异的基准）
+
+        Returns:
+            缓存键
+        """
+        key = self.make_key(fields)
+        entry_dir = self._entry_dir(key)
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f"{key}.", suffix='.tmp', dir=str(entry_dir.parent)))
+
+        diff = capture_state_diff(case_data, sandbox_dir, self.blobs)
+        (tmp_dir / self.STATE_FILE).write_text(json.dumps(diff, ensure_ascii=False, separators=(',', ':')),
+                                               encoding='utf-8')
+
+        meta = {
+            'key': key,
+            'fields': fields,
+            'saved_at': datetime.now().isoformat(),
+            'haiku_result': {k: v for k, v in haiku_result.items() if k != 'stdout'}
+        }
+        (tmp_dir / self.META_FILE).write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+
+        # 写完再改名，读取方不会看到写了一半的条目；替换旧条目时先把旧目录改名移开，
+        # 其间的短暂缺失 load() 视为未命中
+        old_dir = None
+        if entry_dir.exists():
+            old_dir = tmp_dir.with_name(tmp_dir.name + '.old')
+            entry_dir.rename(old_dir)
+        tmp_dir.rename(entry_dir)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+        latest_path = self._latest_path(fields)
+        latest_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=str(latest_path.parent))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(key)
+        os.replace(tmp, latest_path)
+        return key
+
+    def latest_key(self, fields: Dict[str, str]) -> Optional[str]:
+        """忽略 fields 中的 CLI 版本，返回最近一次保存的缓存键（regrade 用，不需要调用 CLI）"""
+        latest_path = self._latest_path(fields)
+        if not latest_path.exists():
+            return None
+        key = latest_path.read_text(encoding='utf-8').strip()
+        return key if (self._entry_dir(key) / self.META_FILE).exists() else None
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存元数据，不存在返回 None"""
+        meta_path = self._entry_dir(key) / self.META_FILE
+        if not meta_path.exists():
+            return None
+        return json.loads(meta_path.read_text(encoding='utf-8'))
+
+    def restore(self, key: str, target_dir: Path, case_data: dict) -> None:
+        """把缓存的最终状态恢复到 target_dir"""
+        diff_path = self._entry_dir(key) / self.STATE_FILE
+        diff = json.loads(diff_path.read_text(encoding='utf-8'))
+        apply_state_diff(case_data, diff, self.blobs, target_dir)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """列出所有缓存条目的元数据"""
+        results = []
+        for meta_path in sorted(self.root.glob(f"[0-9a-f][0-9a-f]/*/{self.META_FILE}")):
+            if '.' in meta_path.parent.name:
+                continue  # 正在写入 / 替换中的临时目录
+            results.append(json.loads(meta_path.read_text(encoding='utf-8')))
+        return results
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='轨迹回放缓存')
+    parser.add_argument('cache_dir', help='缓存目录')
+    parser.add_argument('command', choices=['list'], help='list: 列出缓存条目')
+
+    args = parser.parse_args()
+    cache = ReplayCache(Path(args.cache_dir))
+
+    if args.command == 'list':
+        entries = cache.entries()
+        for entry in entries:
+            fields = entry['fields']
+            result = entry['haiku_result']
+            query = fields['query'][:50]
+            print(f"  {entry['key'][:12]}  {fields['model']:<8} {result.get('total_steps', 0):>3} steps  "
+                  f"{entry['saved_at'][:19]}  {query}")
+        print(f"\nTotal: {len(entries)} entries")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+"""
+结果存储：基于 SQLite 的可查询结果库
+
+替代散落在每个 case 目录下的 phase*_result.json。所有 phase 的运行结果写入
+同一个库，按 runs / checks / tool_calls / timings 四张表建索引，phase6 的 token 用量、
+费用和每轮延迟写入 usage / turns 两张表。支持批量写入和常用聚合查询。per-case JSON 仍可按需导出。
+
+用法:
+    python3 results_store.py <db> ingest <result_json>... [--case <case_json>]
+    python3 results_store.py <db> pass-rate [--by task_type,difficulty,tool] [--phase 6]
+    python3 results_store.py <db> slowest-checks [--limit 20]
+    python3 results_store.py <db> flaky [--phase 6]
+    python3 results_store.py <db> stale-checks [--phase 6]
+    python3 results_store.py <db> usage [--by case] [--phase 6] [--limit 20]
+    python3 results_store.py <db> export <case_id> [--phase 6] [--output <file>]
+
+写入（phase 脚本中）:
+    with ResultsStore(db_path) as store:
+        store.record(output_data, case_data)
+"""
+import sys
+import json
+import argparse
+import sqlite3
+import uuid
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from case_reader import load_case
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id       TEXT PRIMARY KEY,
+    case_id      TEXT NOT NULL,
+    phase        INTEGER NOT NULL,
+    task_type    TEXT,
+    difficulty   TEXT,
+    tool_name    TEXT,
+    model        TEXT,
+    passed       INTEGER NOT NULL,
+    score        REAL,
+    total_checks INTEGER,
+    passed_checks INTEGER,
+    total_steps  INTEGER,
+    duration_sec REAL,
+    timestamp    TEXT,
+    success      INTEGER,
+    error        TEXT,
+    tool_calls_verified INTEGER,
+    tool_calls_details  TEXT,
+    run_vars     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_case ON runs(case_id, phase);
+CREATE INDEX IF NOT EXISTS idx_runs_slot ON runs(phase, task_type, difficulty, tool_name);
+
+CREATE TABLE IF NOT EXISTS checks (
+    run_id      TEXT NOT NULL,
+    idx         INTEGER NOT NULL,
+    check_type  TEXT NOT NULL,
+    passed      INTEGER NOT NULL,
+    message     TEXT,
+    description TEXT,
+    duration_ms REAL,
+    fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_checks_run ON checks(run_id);
+CREATE INDEX IF NOT EXISTS idx_checks_type ON checks(check_type, duration_ms);
+
+CREATE TABLE IF NOT EXISTS tool_calls (
+    run_id  TEXT NOT NULL,
+    step    INTEGER NOT NULL,
+    tool    TEXT NOT NULL,
+    input   TEXT,
+    output  TEXT,
+    success INTEGER,
+    duration_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tool_calls_run ON tool_calls(run_id);
+CREATE INDEX IF NOT EXISTS idx_tool_calls_tool ON tool_calls(tool);
+
+CREATE TABLE IF NOT EXISTS timings (
+    run_id       TEXT NOT NULL,
+    name         TEXT NOT NULL,
+    duration_sec REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_timings_run ON timings(run_id);
+
+CREATE TABLE IF NOT EXISTS usage (
+    run_id                TEXT PRIMARY KEY,
+    input_tokens          INTEGER,
+    output_tokens         INTEGER,
+    cache_creation_tokens INTEGER,
+    cache_read_tokens     INTEGER,
+    cost_usd              REAL,
+    turns                 INTEGER,
+    model_ms              REAL,
+    tool_ms               REAL
+);
+
+CREATE TABLE IF NOT EXISTS turns (
+    run_id                TEXT NOT NULL,
+    turn                  INTEGER NOT NULL,
+    input_tokens          INTEGER,
+    output_tokens         INTEGER,
+    cache_creation_tokens INTEGER,
+    cache_read_tokens     INTEGER,
+    latency_ms            REAL,
+    tool_calls            INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_turns_run ON turns(run_id);
+"""
+
+# 写入时的列顺序（与 record 中缓冲的元组一一对应）
+INSERT_COLUMNS = {
+    'runs': ('run_id', 'case_id', 'phase', 'task_type', 'difficulty', 'tool_name', 'model', 'passed', 'score',
+             'total_checks', 'passed_checks', 'total_steps', 'duration_sec', 'timestamp', 'success', 'error',
+             'tool_calls_verified', 'tool_calls_details', 'run_vars'),
+    'checks': ('run_id', 'idx', 'check_type', 'passed', 'message', 'description', 'duration_ms', 'fingerprint'),
+    'tool_calls': ('run_id', 'step', 'tool', 'input', 'output', 'success', 'duration_ms'),
+    'timings': ('run_id', 'name', 'duration_sec'),
+    'usage': ('run_id', 'input_tokens', 'output_tokens', 'cache_creation_tokens', 'cache_read_tokens',
+              'cost_usd', 'turns', 'model_ms', 'tool_ms'),
+    'turns': ('run_id', 'turn', 'input_tokens', 'output_tokens', 'cache_creation_tokens', 'cache_read_tokens',
+              'latency_ms', 'tool_calls'),
+}
+
+# pass-rate / usage 分组维度 -> runs 表列名
+GROUP_COLUMNS = {
+    'case': 'case_id',
+    'task_type': 'task_type',
+    'difficulty': 'difficulty',
+    'tool': 'tool_name',
+    'model': 'model',
+    'phase': 'phase',
+}
+
+
+class ResultsStore:
+    """SQLite 结果库，写入先缓冲，满 batch_size 条或 flush/close 时一次性提交"""
+
+    def __init__(self, db_path: Path, batch_size: int = 200):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30)
+        # WAL 允许多个 phase 进程并发写同一个库
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._pending: Dict[str, List[tuple]] = {table: [] for table in INSERT_COLUMNS}
+        self._pending_runs = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------
+
+    def record(self, output_data: Dict[str, Any], case_data: Optional[Dict] = None) -> str:
+        """
+        记录一次 phase 运行结果
+
+        Args:
+            output_data: phase4/6/7 生成的结果字典（即 phase*_result.json 的内容）
+            case_data: 测试用例数据，用于补充 task_type / difficulty / tool 等维度
+
+        Returns:
+            run_id
+        """
+        run_id = uuid.uuid4().hex
+        task = (case_data or {}).get('task', {})
+        phase = output_data.get('phase', 0)
+        grader = output_data.get('grader_result', {})
+
+        metrics = None
+        execution = {}
+        if phase == 6:
+            execution = output_data.get('haiku_execution', {})
+            trajectory = execution.get('trajectory', [])
+            duration = execution.get('duration_sec')
+            metrics = execution.get('metrics')
+        else:
+            trajectory = output_data.get('execution_trajectory', [])
+            duration = output_data.get('duration_sec')
+
+        score = None
+        passed = output_data.get('passed', grader.get('passed', False))
+        if phase == 7:
+            overall = output_data.get('quality_analysis', {}).get('overall', {})
+            score = overall.get('score')
+            passed = overall.get('level') in ('excellent', 'good', 'acceptable')
+
+        self._pending['runs'].append((
+            run_id,
+            output_data.get('case_id', task.get('id', '')),
+            phase,
+            task.get('task_type'),
+            str(task.get('difficulty', '')) or None,
+            task.get('tool_name'),
+            output_data.get('model'),
+            int(bool(passed)),
+            score,
+            grader.get('total_checks'),
+            grader.get('passed_checks'),
+            len(trajectory),
+            duration,
+            output_data.get('timestamp'),
+            None if 'success' not in execution else int(bool(execution['success'])),
+            execution.get('error'),
+            None if 'tool_calls_verified' not in grader else int(bool(grader['tool_calls_verified'])),
+            json.dumps(grader['tool_calls_details'], ensure_ascii=False) if 'tool_calls_details' in grader else None,
+            json.dumps(output_data['run_vars'], ensure_ascii=False) if output_data.get('run_vars') else None,
+        ))
+
+        for i, detail in enumerate(grader.get('details', [])):
+            self._pending['checks'].append((
+                run_id, i, detail.get('check_type', ''), int(bool(detail.get('passed'))),
+                detail.get('message'), detail.get('description'), detail.get('duration_ms'),
+                detail.get('fingerprint'),
+            ))
+
+        step_ms = {s.get('step'): s.get('tool_ms') for s in (metrics or {}).get('steps', [])}
+        for step in trajectory:
+            success = step.get('success')
+            self._pending['tool_calls'].append((
+                run_id, step.get('step', 0), step.get('tool', ''),
+                json.dumps(step.get('input', {}), ensure_ascii=False),
+                step.get('output', ''),
+                None if success is None else int(bool(success)),
+                step_ms.get(step.get('step')),
+            ))
+
+        if metrics:
+            totals = metrics.get('totals', {})
+            self._pending['usage'].append((
+                run_id, totals.get('input_tokens'), totals.get('output_tokens'),
+                totals.get('cache_creation_input_tokens'), totals.get('cache_read_input_tokens'),
+                metrics.get('total_cost_usd'), len(metrics.get('turns', [])),
+                totals.get('model_ms'), totals.get('tool_ms'),
+            ))
+            for turn in metrics.get('turns', []):
+                self._pending['turns'].append((
+                    run_id, turn.get('turn'), turn.get('input_tokens'), turn.get('output_tokens'),
+                    turn.get('cache_creation_input_tokens'), turn.get('cache_read_input_tokens'),
+                    turn.get('latency_ms'), turn.get('tool_calls'),
+                ))
+
+        for name, value in output_data.get('timings', {}).items():
+            self._pending['timings'].append((run_id, name, value))
+        if duration is not None:
+            self._pending['timings'].append((run_id, f"phase{phase}_total", duration))
+
+        self._pending_runs += 1
+        if self._pending_runs >= self.batch_size:
+            self.flush()
+        return run_id
+
+    def flush(self) -> None:
+        """提交所有缓冲的写入（单个事务）"""
+        if not self._pending_runs:
+            return
+        with self.conn:
+            for table, columns in INSERT_COLUMNS.items():
+                self.conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) "
+                                      f"VALUES ({', '.join('?' * len(columns))})", self._pending[table])
+        for rows in self._pending.values():
+            rows.clear()
+        self._pending_runs = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    # ------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------
+
+    def pass_rate(self, group_by: List[str], phase: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按维度聚合通过率"""
+        columns = [GROUP_COLUMNS[g] for g in group_by]
+        select = ', '.join(columns) if columns else "'all'"
+        where = 'WHERE phase = ?' if phase is not None else ''
+        sql = (f"SELECT {select}, COUNT(*), SUM(passed) FROM runs {where} "
+               f"GROUP BY {select} ORDER BY {select}")
+        rows = self.conn.execute(sql, (phase,) if phase is not None else ()).fetchall()
+
+        results = []
+        for row in rows:
+            keys = row[:len(columns)] if columns else ('all',)
+            total, passed = row[-2], row[-1] or 0
+            results.append({
+                'group': dict(zip(group_by or ['all'], keys)),
+                'runs': total,
+                'passed': passed,
+                'pass_rate': passed / total if total else 0.0
+            })
+        return results
+
+    def slowest_checks(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """按 check 类型统计耗时"""
+        rows = self.conn.execute(
+            "SELECT check_type, COUNT(*), AVG(duration_ms), MAX(duration_ms) FROM checks "
+            "WHERE duration_ms IS NOT NULL GROUP BY check_type ORDER BY AVG(duration_ms) DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [
+            {'check_type': r[0], 'count': r[1], 'avg_ms': r[2], 'max_ms': r[3]}
+            for r in rows
+        ]
+
+    def usage(self, group_by: List[str], phase: Optional[int] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按维度聚合 token 用量、费用和延迟（按总 token 降序）"""
+        columns = [f"r.{GROUP_COLUMNS[g]}" for g in group_by]
+        select = ', '.join(columns) if columns else "'all'"
+        where = 'WHERE r.phase = ?' if phase is not None else ''
+        sql = (f"SELECT {select}, COUNT(*), SUM(u.input_tokens), SUM(u.output_tokens), "
+               f"SUM(u.cache_creation_tokens), SUM(u.cache_read_tokens), SUM(u.cost_usd), "
+               f"SUM(u.turns), SUM(u.model_ms), SUM(u.tool_ms) "
+               f"FROM usage u JOIN runs r ON r.run_id = u.run_id {where} GROUP BY {select} "
+               f"ORDER BY SUM(u.input_tokens) + SUM(u.output_tokens) + SUM(u.cache_creation_tokens) "
+               f"+ SUM(u.cache_read_tokens) DESC")
+        params: tuple = (phase,) if phase is not None else ()
+        if limit:
+            sql += " LIMIT ?"
+            params += (limit,)
+
+        results = []
+        for row in self.conn.execute(sql, params).fetchall():
+            keys = row[:len(columns)] if columns else ('all',)
+            runs, input_tokens, output_tokens, cache_write, cache_read, cost, turns, model_ms, tool_ms = row[-9:]
+            total = (input_tokens or 0) + (output_tokens or 0) + (cache_write or 0) + (cache_read or 0)
+            results.append({
+                **dict(zip(group_by or ['all'], keys)),
+                'runs': runs,
+                'input_tokens': input_tokens or 0,
+                'output_tokens': output_tokens or 0,
+                'cache_write_tokens': cache_write or 0,
+                'cache_read_tokens': cache_read or 0,
+                'tokens_per_run': total / runs,
+                'cost_usd': cost,
+                'cost_per_run': cost / runs if cost is not None else None,
+                'turn_latency_ms': model_ms / turns if model_ms is not None and turns else None,
+                'tool_ms_per_run': tool_ms / runs if tool_ms is not None else None,
+            })
+        return results
+
+    def flaky_cases(self, phase: Optional[int] = None) -> List[Dict[str, Any]]:
+        """同一 case 同一 phase 既有通过又有失败的运行"""
+        where = 'WHERE phase = ?' if phase is not None else ''
+        rows = self.conn.execute(
+            f"SELECT case_id, phase, COUNT(*), SUM(passed) FROM runs {where} "
+            f"GROUP BY case_id, phase HAVING SUM(passed) > 0 AND SUM(passed) < COUNT(*) "
+            f"ORDER BY case_id",
+            (phase,) if phase is not None else ()
+        ).fetchall()
+        return [
+            {'case_id': r[0], 'phase': r[1], 'runs': r[2], 'passed': r[3], 'pass_rate': r[3] / r[2]}
+            for r in rows
+        ]
+
+    def stale_checks(self, current: Dict[str, str], phase: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        check 实现已变化的运行：记录的指纹与 current（check 名 → 当前指纹）不同
+
+        没有记录指纹的旧结果不算。
+        """
+        where = 'AND r.phase = ?' if phase is not None else ''
+        rows = self.conn.execute(
+            f"SELECT r.case_id, r.phase, r.run_id, c.check_type, c.fingerprint FROM checks c "
+            f"JOIN runs r ON r.run_id = c.run_id WHERE c.fingerprint IS NOT NULL AND c.fingerprint != '' {where} "
+            f"ORDER BY r.case_id, r.phase, c.idx",
+            (phase,) if phase is not None else ()
+        ).fetchall()
+        return [
+            {'case_id': r[0], 'phase': r[1], 'run_id': r[2], 'check_type': r[3],
+             'recorded': r[4], 'current': current.get(r[3], '-')}
+            for r in rows if current.get(r[3]) != r[4]
+        ]
+
+    def _export_metrics(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """还原 phase6 结果中的 haiku_execution.metrics"""
+        usage = self.conn.execute(
+            "SELECT input_tokens, output_tokens, cache_creation_tokens, cache_read_tokens, cost_usd, model_ms, tool_ms "
+            "FROM usage WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if usage is None:
+            return None
+        token_fields = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+        turns = [
+            {'turn': r[0], **dict(zip(token_fields, r[1:5])), 'latency_ms': r[5], 'tool_calls': r[6]}
+            for r in self.conn.execute(
+                "SELECT turn, input_tokens, output_tokens, cache_creation_tokens, cache_read_tokens, latency_ms, "
+                "tool_calls FROM turns WHERE run_id = ? ORDER BY turn", (run_id,)
+            )
+        ]
+        steps = [
+            {'step': r[0], 'tool': r[1], 'tool_ms': r[2]}
+            for r in self.conn.execute(
+                "SELECT step, tool, duration_ms FROM tool_calls WHERE run_id = ? ORDER BY step", (run_id,)
+            )
+        ]
+        return {
+            'turns': turns,
+            'steps': steps,
+            'totals': {**dict(zip(token_fields, usage[:4])), 'model_ms': usage[5], 'tool_ms': usage[6]},
+            'total_cost_usd': usage[4]
+        }
+
+    def export_run(self, case_id: str, phase: int) -> Optional[Dict[str, Any]]:
+        """
+        导出某 case 某 phase 最近一次运行，格式与 phase*_result.json 一致
+
+        不保存的内容：轨迹步中 step / tool / input / output / success 以外的字段（如 reasoning），
+        metrics 中 CLI result 事件的 duration_ms / duration_api_ms / num_turns，
+        phase7 的质量分析明细（只有总分）。
+        """
+        run = self.conn.execute(
+            "SELECT run_id, model, passed, total_checks, passed_checks, total_steps, duration_sec, timestamp, "
+            "score, success, error, tool_calls_verified, tool_calls_details, run_vars "
+            "FROM runs WHERE case_id = ? AND phase = ? ORDER BY timestamp DESC LIMIT 1",
+            (case_id, phase)
+        ).fetchone()
+        if run is None:
+            return None
+        (run_id, model, passed, total_checks, passed_checks, total_steps, duration, timestamp, score,
+         success, error, tool_calls_verified, tool_calls_details, run_vars) = run
+
+        details = [
+            {'check_type': r[0], 'passed': bool(r[1]), 'message': r[2], 'description': r[3],
+             'duration_ms': r[4], 'fingerprint': r[5]}
+            for r in self.conn.execute(
+                "SELECT check_type, passed, message, description, duration_ms, fingerprint "
+                "FROM checks WHERE run_id = ? ORDER BY idx",
+                (run_id,)
+            )
+        ]
+        trajectory = []
+        for step, tool, tool_input, output, step_success in self.conn.execute(
+                "SELECT step, tool, input, output, success FROM tool_calls WHERE run_id = ? ORDER BY step",
+                (run_id,)):
+            entry = {'step': step, 'tool': tool, 'input': json.loads(tool_input), 'output': output}
+            if step_success is not None:
+                entry['success'] = bool(step_success)
+            trajectory.append(entry)
+        grader_result = {
+            'passed': bool(passed),
+            'total_checks': total_checks,
+            'passed_checks': passed_checks,
+            'failed_checks': (total_checks or 0) - (passed_checks or 0),
+            'tool_calls_verified': bool(tool_calls_verified),
+            'tool_calls_details': json.loads(tool_calls_details) if tool_calls_details else [],
+            'details': details
+        }
+
+        output = {'phase': phase, 'case_id': case_id, 'timestamp': timestamp}
+        if phase == 6:
+            output['model'] = model
+            output['haiku_execution'] = {
+                'success': bool(success),
+                'total_steps': total_steps,
+                'duration_sec': duration,
+                'trajectory': trajectory,
+                'error': error
+            }
+            metrics = self._export_metrics(run_id)
+            if metrics is not None:
+                output['haiku_execution']['metrics'] = metrics
+            output['grader_result'] = grader_result
+            output['haiku_evaluation'] = {
+                'passed': bool(passed),
+                'haiku_steps': total_steps,
+                'duration_sec': duration,
+                'passed_checks': passed_checks,
+                'total_checks': total_checks
+            }
+        elif phase == 7:
+            output['quality_analysis'] = {'overall': {'score': score}}
+        else:
+            output['passed'] = bool(passed)
+            output['duration_sec'] = duration
+            output['execution_trajectory'] = trajectory
+            output['grader_result'] = grader_result
+        if run_vars:
+            output['run_vars'] = json.loads(run_vars)
+        return output
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def _print_rows(rows: List[Dict], as_json: bool) -> None:
+    if as_json:
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
+        return
+    for row in rows:
+        print('  ' + ', '.join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+    print(f"\nTotal: {len(rows)} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite 结果库')
+    parser.add_argument('db', help='结果库文件路径')
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_ingest = sub.add_parser('ingest', help='导入已有的 phase*_result.json')
+    p_ingest.add_argument('results', nargs='+', help='结果文件')
+    p_ingest.add_argument('--case', help='对应的 case.json（默认取结果文件同目录下的 case.json）')
+
+    p_rate = sub.add_parser('pass-rate', help='按维度聚合通过率')
+    p_rate.add_argument('--by', default='task_type,difficulty,tool', help='分组维度，逗号分隔')
+    p_rate.add_argument('--phase', type=int, default=6, help='phase（默认: 6）')
+
+    p_slow = sub.add_parser('slowest-checks', help='最慢的 check 类型')
+    p_slow.add_argument('--limit', type=int, default=20)
+
+    p_flaky = sub.add_parser('flaky', help='结果不稳定的 case')
+    p_flaky.add_argument('--phase', type=int, help='只看某个 phase')
+
+    p_stale = sub.add_parser('stale-checks', help='check 实现已变化、需要重新评估的运行')
+    p_stale.add_argument('--phase', type=int, help='只看某个 phase')
+
+    p_usage = sub.add_parser('usage', help='token 用量、费用和延迟')
+    p_usage.add_argument('--by', default='', help='分组维度，逗号分隔（默认: 整个库合计；case 为逐 case）')
+    p_usage.add_argument('--phase', type=int, default=6, help='phase（默认: 6）')
+    p_usage.add_argument('--limit', type=int, help='只显示用量最高的前 N 组')
+
+    p_export = sub.add_parser('export', help='导出为 phase*_result.json 格式')
+    p_export.add_argument('case_id')
+    p_export.add_argument('--phase', type=int, default=6)
+    p_export.add_argument('--output', help='输出文件（默认打印）')
+
+    args = parser.parse_args()
+
+    with ResultsStore(Path(args.db)) as store:
+        if args.command == 'ingest':
+            count = 0
+            for result_file in args.results:
+                result_path = Path(result_file)
+                case_path = Path(args.case) if args.case else result_path.parent / 'case.json'
+                case_data = load_case(case_path, sections=('task',)) if case_path.exists() else None
+                store.record(json.loads(result_path.read_text(encoding='utf-8')), case_data)
+                count += 1
+            print(f"Ingested {count} results into {args.db}")
+
+        elif args.command == 'pass-rate':
+            group_by = [g for g in args.by.split(',') if g]
+            unknown = [g for g in group_by if g not in GROUP_COLUMNS]
+            if unknown:
+                print(f"Error: unknown group dimension(s): {unknown}; choose from {list(GROUP_COLUMNS)}")
+                sys.exit(1)
+            rows = store.pass_rate(group_by, args.phase)
+            flat = [{**r['group'], 'runs': r['runs'], 'passed': r['passed'], 'pass_rate': r['pass_rate']}
+                    for r in rows]
+            _print_rows(flat, args.json)
+
+        elif args.command == 'usage':
+            group_by = [g for g in args.by.split(',') if g]
+            unknown = [g for g in group_by if g not in GROUP_COLUMNS]
+            if unknown:
+                print(f"Error: unknown group dimension(s): {unknown}; choose from {list(GROUP_COLUMNS)}")
+                sys.exit(1)
+            _print_rows(store.usage(group_by, args.phase, args.limit), args.json)
+
+        elif args.command == 'slowest-checks':
+            _print_rows(store.slowest_checks(args.limit), args.json)
+
+        elif args.command == 'flaky':
+            _print_rows(store.flaky_cases(args.phase), args.json)
+
+        elif args.command == 'stale-checks':
+            from custom_checks import CHECK_REGISTRY
+            current = {name: CHECK_REGISTRY.fingerprint(name) for name in CHECK_REGISTRY}
+            _print_rows(store.stale_checks(current, args.phase), args.json)
+
+        elif args.command == 'export':
+            output = store.export_run(args.case_id, args.phase)
+            if output is None:
+                print(f"Error: no phase {args.phase} run for case {args.case_id}")
+                sys.exit(1)
+            text = json.dumps(output, indent=2, ensure_ascii=False)
+            if args.output:
+                Path(args.output).write_text(text, encoding='utf-8')
+                print(f"Exported to: {args.output}")
+            else:
+                print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+按运行分配的占位符（端口、唯一标识）
+
+case 里写死的端口（如 19847）、PID 文件名、临时路径让同一个 case 不能并发运行。
+environment、init_commands、task.desc、reference_solution 和 graders 中可以改用占位符：
+
+    {{PORT:db}}       一个当前空闲的 TCP 端口（端口池分配，运行结束前不会分给别的运行）
+    {{UNIQUE:log}}    log_<8 位十六进制>，用于文件名、库名、/tmp 下的路径等
+
+同名占位符在整个 case 中取同一个值；每次运行重新分配。{{SANDBOX}} 不在此处理
+（check 参数中的 {{SANDBOX}} 仍由 custom_checks 替换）。
+
+端口池默认 20000-29999（避开 Linux 的临时端口范围 32768-60999），可用环境变量
+CASE_PORT_RANGE=lo-hi 指定。跨进程的占用记录是 ~/.cache/agent-testcase/ports
+（或 CASE_PORT_LOCKS）下的 flock 锁文件，进程退出时自动释放。
+
+使用方式:
+    from run_vars import RunVars
+    with RunVars.allocate(case_data) as run_vars:
+        run_case = run_vars.render(case_data)    # 所有字符串中的占位符替换为本次取值
+        ...
+    run_vars.values                              # {'PORT:db': '23817', 'UNIQUE:log': 'log_9f2c01ab'}
+
+命令行（查看 case 使用的占位符，并试分配一次）:
+    python3 run_vars.py <case_file>...
+"""
+import os
+import re
+import sys
+import json
+import fcntl
+import random
+import socket
+import secrets
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+PLACEHOLDER = re.compile(r'\{\{(PORT|UNIQUE):([A-Za-z0-9_.-]+)\}\}')
+DEFAULT_PORT_RANGE = (20000, 29999)
+DEFAULT_LOCK_DIR = Path.home() / '.cache' / 'agent-testcase' / 'ports'
+
+
+def placeholders(obj: Any) -> Set[Tuple[str, str]]:
+    """obj（case 或其一部分）中出现的 (kind, name)"""
+    return set(PLACEHOLDER.findall(json.dumps(obj, ensure_ascii=False)))
+
+
+def port_range() -> Tuple[int, int]:
+    text = os.environ.get('CASE_PORT_RANGE', '')
+    if not text:
+        return DEFAULT_PORT_RANGE
+    lo, _, hi = text.partition('-')
+    return int(lo), int(hi)
+
+
+# ============================================================
+# 端口池
+# ============================================================
+
+def _port_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(('', port))
+        except OSError:
+            return False
+    return True
+
+
+def _reserve_port(lock_dir: Path) -> Tuple[int, int]:
+    """从端口池随机起点开始找一个未被锁定且可绑定的端口，返回 (端口, 锁文件 fd)"""
+    lo, hi = port_range()
+    span = hi - lo + 1
+    start = random.randrange(span)
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    for offset in range(span):
+        port = lo + (start + offset) % span
+        fd = os.open(lock_dir / f"{port}.lock", os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            # flock 按打开的文件描述计，同一进程内的两次分配也互斥
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        if _port_free(port):
+            return port, fd
+        os.close(fd)
+    raise RuntimeError(f"no free port in {lo}-{hi}")
+
+
+# ============================================================
+# 一次运行的取值
+# ============================================================
+
+class RunVars:
+    """一次运行的占位符取值；端口在 release() 之前保持占用"""
+
+    def __init__(self, values: Optional[Dict[str, str]] = None):
+        self.values: Dict[str, str] = dict(values or {})
+        self._locks: List[int] = []
+
+    @classmethod
+    def allocate(cls, case_data: dict, lock_dir: Optional[Path] = None) -> 'RunVars':
+        """为 case_data 中的全部占位符分配本次运行的值"""
+        lock_dir = Path(lock_dir or os.environ.get('CASE_PORT_LOCKS') or DEFAULT_LOCK_DIR)
+        run_vars = cls()
+        try:
+            for kind, name in sorted(placeholders(case_data)):
+                if kind == 'PORT':
+                    port, fd = _reserve_port(lock_dir)
+                    run_vars._locks.append(fd)
+                    run_vars.values[f"PORT:{name}"] = str(port)
+                else:
+                    run_vars.values[f"UNIQUE:{name}"] = f"{name}_{secrets.token_hex(4)}"
+        except Exception:
+            run_vars.release()
+            raise
+        return run_vars
+
+    def render(self, obj: Any) -> Any:
+        """返回替换了占位符的副本（dict / list 递归，键不替换）"""
+        if isinstance(obj, str):
+            if '{{' not in obj:
+                return obj
+            return PLACEHOLDER.sub(lambda m: self.values.get(f"{m.group(1)}:{m.group(2)}", m.group(0)), obj)
+        if isinstance(obj, dict):
+            return {key: self.render(value) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [self.render(item) for item in obj]
+        return obj
+
+    def release(self) -> None:
+        for fd in self._locks:
+            os.close(fd)
+        self._locks = []
+
+    def __enter__(self) -> 'RunVars':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='查看 case 使用的按运行占位符并试分配')
+    parser.add_argument('case_files', nargs='+', help='测试用例 JSON 文件路径')
+
+    args = parser.parse_args()
+    for case_file in args.case_files:
+        try:
+            with open(case_file, 'r', encoding='utf-8') as f:
+                case_data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: {case_file}: {e}", file=sys.stderr)
+            continue
+        with RunVars.allocate(case_data) as run_vars:
+            print(f"{case_file}: {len(run_vars.values)} placeholders")
+            for key, value in run_vars.values.items():
+                print(f"  {{{{{key}}}}} = {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+有时间上限的正则匹配（file_content_matches / file_content_match 使用）
+
+出题人写的正则以 MULTILINE | DOTALL 在整个文件上执行，一个灾难性回溯的
+模式就能让 grader 进程挂住。本模块：
+
+1. 必需字面量预过滤：从解析树中取出任何匹配都必须包含的字面量片段，
+   文件中（mmap 字节查找）不存在时直接判定不匹配，不执行正则
+2. 按行匹配：模式不可能跨行时（不含 DOTALL 下的 .、\\n、\\s、[^x] 这类能匹配
+   换行的元素，也不含 \\A / \\Z），逐行流式匹配，只对含必需字面量的行执行正则
+3. 时间预算：主线程用 SIGALRM 中断（Python 3.11 起 re 会响应信号），
+   其它线程（如 verify_daemon 的工作线程）在子进程中执行，超时即结束子进程。
+   超出预算的模式返回 None，并在 stderr 打印警告
+
+使用方式:
+    from safe_regex import search_file
+    matched, detail = search_file(full_path, pattern, timeout=5.0)
+    # matched 为 True / False，超时为 None
+    line, detail = find_first(full_path, pattern, flags)   # 第一处匹配的行号，0 为没有匹配
+
+命令行（分析模式，或检查题库中的全部正则 check）:
+    python3 safe_regex.py --pattern '<regex>'
+    python3 safe_regex.py <case_file_or_dir>...
+"""
+import os
+import re
+import sys
+import mmap
+import json
+import signal
+import argparse
+import threading
+import subprocess
+from functools import lru_cache
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+
+DEFAULT_FLAGS = re.MULTILINE | re.DOTALL
+DEFAULT_TIMEOUT = 5.0
+MIN_LITERAL_LEN = 3
+REGEX_CHECKS = ('file_content_matches', 'file_content_match', 'file_content_regex')
+
+_OP = sre_constants
+# 能匹配换行的字符类别
+_NEWLINE_CATEGORIES = {_OP.CATEGORY_SPACE, _OP.CATEGORY_NOT_DIGIT, _OP.CATEGORY_NOT_WORD,
+                       _OP.CATEGORY_LINEBREAK, _OP.CATEGORY_UNI_SPACE, _OP.CATEGORY_UNI_NOT_DIGIT,
+                       _OP.CATEGORY_UNI_NOT_WORD, _OP.CATEGORY_UNI_LINEBREAK}
+
+
+class RegexTimeout(Exception):
+    pass
+
+
+class PatternInfo(NamedTuple):
+    literals: Tuple[str, ...]   # 必需字面量（按长度降序）
+    line_scoped: bool           # 不可能跨行，可以逐行匹配
+    ignore_case: bool
+
+
+# ============================================================
+# 模式分析
+# ============================================================
+
+def _class_matches_newline(items) -> bool:
+    negate = False
+    hit = False
+    for op, av in items:
+        if op is _OP.NEGATE:
+            negate = True
+        elif op is _OP.LITERAL:
+            hit = hit or av == 10
+        elif op is _OP.RANGE:
+            hit = hit or av[0] <= 10 <= av[1]
+        elif op is _OP.CATEGORY:
+            hit = hit or av in _NEWLINE_CATEGORIES
+        else:
+            return True
+    return hit != negate
+
+
+def _subpatterns(op, av) -> list:
+    """节点下的子序列"""
+    if op is _OP.SUBPATTERN:
+        return [av[-1]]
+    if op in (_OP.MAX_REPEAT, _OP.MIN_REPEAT) or op is getattr(_OP, 'POSSESSIVE_REPEAT', None):
+        return [av[2]]
+    if op is _OP.BRANCH:
+        return list(av[1])
+    if op in (_OP.ASSERT, _OP.ASSERT_NOT):
+        return [av[1]]
+    if op is getattr(_OP, 'ATOMIC_GROUP', None):
+        return [av]
+    if op is _OP.GROUPREF_EXISTS:
+        return [branch for branch in av[1:] if branch is not None]
+    return []
+
+
+def _can_span_lines(seq, flags: int) -> bool:
+    for op, av in seq:
+        if op is _OP.ANY:
+            if flags & re.DOTALL:
+                return True
+        elif op is _OP.LITERAL:
+            if av == 10:
+                return True
+        elif op is _OP.NOT_LITERAL:
+            if av != 10:
+                return True
+        elif op is _OP.IN:
+            if _class_matches_newline(av):
+                return True
+        elif op is _OP.AT:
+            if av in (_OP.AT_BEGINNING_STRING, _OP.AT_END_STRING):
+                return True
+            if av in (_OP.AT_BEGINNING, _OP.AT_END) and not flags & re.MULTILINE:
+                return True
+        elif op is _OP.SUBPATTERN:
+            # (?m:...) / (?-s:...) 等局部标志只作用于组内
+            _, add_flags, del_flags, sub = av
+            if _can_span_lines(sub, (flags | add_flags) & ~del_flags):
+                return True
+        elif any(_can_span_lines(sub, flags) for sub in _subpatterns(op, av)):
+            return True
+    return False
+
+
+def _required_literals(seq, out: List[str]) -> None:
+    """收集任何匹配都必须包含的字面量片段（分支、可选重复内的不算）"""
+    run: List[str] = []
+
+    def flush():
+        if run:
+            out.append(''.join(run))
+            run.clear()
+
+    for op, av in seq:
+        if op is _OP.LITERAL and av not in (10, 13):
+            run.append(chr(av))
+            continue
+        flush()
+        if op is _OP.SUBPATTERN and av[1] & re.IGNORECASE:
+            continue  # (?i:...) 局部忽略大小写
+        if op is _OP.SUBPATTERN or op is getattr(_OP, 'ATOMIC_GROUP', None):
+            _required_literals(_subpatterns(op, av)[0], out)
+        elif op in (_OP.MAX_REPEAT, _OP.MIN_REPEAT) or op is getattr(_OP, 'POSSESSIVE_REPEAT', None):
+            if av[0] >= 1:
+                _required_literals(av[2], out)
+    flush()
+
+
+@lru_cache(maxsize=512)
+def analyze(pattern: str, flags: int = DEFAULT_FLAGS) -> PatternInfo:
+    """分析模式（结果缓存）；模式非法时抛出 re.error"""
+    parsed = sre_parse.parse(pattern, flags)
+    flags = parsed.state.flags
+    ignore_case = bool(flags & re.IGNORECASE)
+    literals: List[str] = []
+    if not ignore_case:
+        _required_literals(list(parsed), literals)
+    literals = sorted({lit for lit in literals if len(lit) >= MIN_LITERAL_LEN and '\ufffd' not in lit},
+                      key=len, reverse=True)
+    return PatternInfo(tuple(literals), not _can_span_lines(list(parsed), flags), ignore_case)
+
+
+# ============================================================
+# 匹配
+# ============================================================
+
+def _missing_literal(full_path: Path, literals) -> Optional[str]:
+    if not literals:
+        return None
+    with open(full_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return literals[0]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for literal in literals:
+                if buf.find(literal.encode('utf-8')) < 0:
+                    return literal
+    return None
+
+
+def _search(path: str, pattern: str, flags: int, line_scoped: bool, literals) -> int:
+    """第一处匹配所在的行号（从 1 开始），没有匹配为 0"""
+    compiled = re.compile(pattern, flags)
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        if not line_scoped:
+            text = f.read()
+            m = compiled.search(text)
+            return text.count('\n', 0, m.start()) + 1 if m else 0
+        last = '\n'
+        lineno = 0
+        for lineno, line in enumerate(f, 1):
+            last = line
+            if literals and literals[0] not in line:
+                continue
+            if compiled.search(line[:-1] if line.endswith('\n') else line):
+                return lineno
+    # 空文件或以换行结尾时，末尾还有一个空行位置
+    if last.endswith('\n') and not literals and compiled.search('') is not None:
+        return lineno + 1
+    return 0
+
+
+def _on_alarm(signum, frame):
+    raise RegexTimeout()
+
+
+def _run_with_alarm(args, timeout: float) -> int:
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return _search(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _run_in_child(args, timeout: float) -> int:
+    """在子进程中执行（用于非主线程），超时即结束子进程"""
+    try:
+        result = subprocess.run([sys.executable, str(Path(__file__).resolve()), '--worker'],
+                                input=json.dumps(args), capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise RegexTimeout() from None
+    if result.returncode != 0:
+        raise RuntimeError(f"regex worker failed: {result.stderr.strip()[-200:]}")
+    return json.loads(result.stdout)
+
+
+def find_first(full_path: Path, pattern: str, flags: int = DEFAULT_FLAGS,
+               timeout: float = DEFAULT_TIMEOUT) -> Tuple[Optional[int], str]:
+    """
+    在文件中查找 pattern 的第一处匹配
+
+    Returns:
+        (line, detail)：line 为匹配所在行号（从 1 开始），0 表示没有匹配，None 表示超出时间预算
+    Raises:
+        re.error: 模式非法
+    """
+    info = analyze(pattern, flags)
+    missing = _missing_literal(full_path, info.literals)
+    if missing is not None:
+        return 0, f"required literal '{missing[:30]}' absent"
+
+    args = (str(full_path), pattern, flags, info.line_scoped, info.literals)
+    mode = 'line-scoped' if info.line_scoped else 'whole-file'
+    usable_alarm = (hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+                    and signal.getitimer(signal.ITIMER_REAL)[0] == 0)
+    try:
+        line = _run_with_alarm(args, timeout) if usable_alarm else _run_in_child(args, timeout)
+    except RegexTimeout:
+        print(f"Warning: regex exceeded {timeout:g}s budget ({mode}): {pattern[:80]!r} on {full_path}",
+              file=sys.stderr)
+        return None, f"regex exceeded {timeout:g}s time budget ({mode}); pattern may backtrack catastrophically"
+    return line, mode
+
+
+def search_file(full_path: Path, pattern: str, flags: int = DEFAULT_FLAGS,
+                timeout: float = DEFAULT_TIMEOUT) -> Tuple[Optional[bool], str]:
+    """
+    在文件中查找 pattern
+
+    Returns:
+        (matched, detail)：matched 为 None 表示超出时间预算
+    Raises:
+        re.error: 模式非法
+    """
+    line, detail = find_first(full_path, pattern, flags, timeout)
+    return (None if line is None else line > 0), detail
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def _describe(pattern: str) -> str:
+    try:
+        info = analyze(pattern)
+    except re.error as e:
+        return f"invalid regex: {e}"
+    literals = ', '.join(repr(lit) for lit in info.literals[:3]) or '-'
+    return f"{'line-scoped' if info.line_scoped else 'whole-file '}  prefilter: {literals}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='正则 check 分析：必需字面量、是否可逐行匹配')
+    parser.add_argument('inputs', nargs='*', help='case.json 文件或目录')
+    parser.add_argument('--pattern', help='直接分析一个正则')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    if args.worker:
+        # 子进程模式：stdin 为 _search 的参数
+        print(json.dumps(_search(*json.loads(sys.stdin.read()))))
+        return
+    if args.pattern:
+        print(_describe(args.pattern))
+        return
+
+    for item in args.inputs:
+        path = Path(item)
+        for case_file in (sorted(path.rglob('case.json')) if path.is_dir() else [path]):
+            try:
+                with open(case_file, 'r', encoding='utf-8') as f:
+                    graders = json.load(f).get('graders', [])
+            except (OSError, ValueError) as e:
+                print(f"Warning: {case_file}: {e}", file=sys.stderr)
+                continue
+            for grader in graders:
+                for check in grader.get('checks', []):
+                    if check.get('check') not in REGEX_CHECKS:
+                        continue
+                    params = check.get('params', {})
+                    pattern = params.get('pattern', params.get('regex', ''))
+                    print(f"{case_file}: {pattern[:60]!r}\n    {_describe(pattern)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Sandbox 构建公共模块
+
+phase4_verify.py、phase6_haiku.py 和 pipeline.py 共用的沙箱构建逻辑：
+1. 根据 case.json 的 environment 创建文件
+2. 执行 init_commands
+
+environment 文件只依赖 case 内容，可以先构建一份模板目录再复制给各个阶段；
+init_commands 可能启动后台进程，必须在每个沙箱里单独执行。
+
+使用方式:
+    from sandbox import build_template, clone_template, run_init_commands
+    build_template(case_data, template_dir)
+    clone_template(template_dir, work_dir)
+    run_init_commands(case_data, work_dir)
+
+case 含按运行占位符（{{PORT:name}} 等，见 run_vars.py）时，模板按原始 case 构建，
+复制后用 apply_run_vars 改写含占位符的 environment 文件，init_commands 传入渲染后的 case。
+"""
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+from blob_store import default_store
+from isolation import run_command
+from run_vars import placeholders
+
+# 单个 & 结尾的命令、nohup / setsid / disown 会留下进程（&& 和 >& 不算）
+SPAWNS_PROCESS = re.compile(r'(?<![&>|])&(?![&>])|\bnohup\b|\bsetsid\b|\bdisown\b')
+
+
+# ============================================================
+# 环境文件
+# ============================================================
+
+def environment_hash(case_data: dict) -> str:
+    """environment 内容的 sha256，用作模板 / 缓存的键"""
+    payload = json.dumps(case_data.get('environment', []), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def write_environment(case_data: dict, target_dir: Path, link: bool = False) -> int:
+    """
+    根据 environment 创建文件
+
+    Args:
+        case_data: 测试用例数据
+        target_dir: 目标目录（需已存在）
+        link: blob 引用条目硬链接到 blob 存储（只用于不会被原地改写的模板目录）
+
+    Returns:
+        创建的文件数
+    """
+    environment = case_data.get('environment', [])
+    for file_info in environment:
+        file_path = file_info.get('path', '')
+        executable = file_info.get('executable', False)
+
+        if not file_path:
+            continue
+
+        full_path = target_dir / file_path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        if 'blob' in file_info:
+            # 可执行文件要 chmod，不能与存储共享 inode
+            default_store().materialize(file_info['blob'], full_path, link=link and not executable)
+        else:
+            full_path.write_text(file_info.get('content', ''), encoding='utf-8')
+
+        if executable:
+            full_path.chmod(0o755)
+
+    return len(environment)
+
+
+def _templated_path(file_info: dict) -> bool:
+    return bool(placeholders(file_info.get('path', '')))
+
+
+def apply_run_vars(case_data: dict, run_vars, target_dir: Path) -> int:
+    """
+    用本次运行的取值写入含占位符的 environment 文件
+
+    内联 content 含占位符的条目原地改写；path 含占位符的条目（模板中没有）按渲染后的路径写入，
+    blob 条目也包括在内。
+
+    Args:
+        case_data: 原始测试用例数据（模板据此构建）
+        run_vars: run_vars.RunVars
+        target_dir: 从模板复制出的沙箱
+
+    Returns:
+        改写的文件数
+    """
+    templated = [file_info for file_info in case_data.get('environment', [])
+                 if _templated_path(file_info) or ('blob' not in file_info and placeholders(file_info))]
+    if templated:
+        write_environment({'environment': run_vars.render(templated)}, target_dir)
+    return len(templated)
+
+
+def run_init_commands(case_data: dict, target_dir: Path) -> None:
+    """
+    在沙箱中执行 init_commands
+
+    Args:
+        case_data: 测试用例数据
+        target_dir: 沙箱目录
+    """
+    init_commands = case_data.get('init_commands', [])
+    if not init_commands:
+        return
+
+    print(f"  Executing {len(init_commands)} init commands...")
+    for cmd_info in init_commands:
+        command = cmd_info.get('command', '')
+        description = cmd_info.get('description', '')
+        wait_sec = cmd_info.get('wait_sec', 0)
+
+        if not command:
+            continue
+
+        print(f"    - {description}")
+        try:
+            result = run_command(
+                command,
+                shell=True,
+                cwd=target_dir,
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
+            if result.returncode != 0:
+                print(f"      Warning: command returned {result.returncode}")
+                if result.stderr:
+                    print(f"      stderr: {result.stderr[:100]}")
+        except subprocess.TimeoutExpired:
+            print(f"      Warning: command timed out")
+        except Exception as e:
+            print(f"      Error: {e}")
+
+        if wait_sec > 0:
+            time.sleep(wait_sec)
+
+
+def init_spawns_processes(case_data: dict) -> bool:
+    """init_commands 是否会留下后台进程（这样的初始化状态不能复制给其它沙箱）"""
+    return any(SPAWNS_PROCESS.search(cmd.get('command', '')) for cmd in case_data.get('init_commands', []))
+
+
+# ============================================================
+# 沙箱构建
+# ============================================================
+
+def setup_sandbox(case_data: dict, target_dir: Path) -> None:
+    """
+    从零构建沙箱：清空目录、创建 environment 文件、执行 init_commands
+
+    Args:
+        case_data: 测试用例数据
+        target_dir: 沙箱目录
+    """
+    if target_dir.exists():
+        shutil.rmtree(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    count = write_environment(case_data, target_dir)
+    print(f"  Created {count} environment files")
+
+    run_init_commands(case_data, target_dir)
+
+
+def build_template(case_data: dict, template_dir: Path) -> None:
+    """
+    构建只含 environment 文件的模板目录（不执行 init_commands）
+
+    blob 引用条目硬链接到 blob 存储，模板只会被复制、不会被改写。
+    path 含按运行占位符的条目不写入模板，由 apply_run_vars() 在复制后按渲染后的路径写入。
+
+    Args:
+        case_data: 测试用例数据
+        template_dir: 模板目录
+    """
+    if template_dir.exists():
+        shutil.rmtree(template_dir)
+    template_dir.mkdir(parents=True, exist_ok=True)
+    environment = [file_info for file_info in case_data.get('environment', []) if not _templated_path(file_info)]
+    write_environment({'environment': environment}, template_dir, link=True)
+
+
+def clone_template(template_dir: Path, target_dir: Path) -> None:
+    """
+    从模板复制出一个沙箱
+
+    使用普通复制而非硬链接：reference_solution 和 Agent 会原地改写文件，
+    硬链接会把修改写回模板。
+
+    Args:
+        template_dir: 模板目录
+        target_dir: 目标沙箱目录
+    """
+    if target_dir.exists():
+        shutil.rmtree(target_dir)
+    shutil.copytree(template_dir, target_dir, symlinks=True)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+沙箱最终状态的紧凑差异
+
+phase6 运行结束后，沙箱目录是最终状态的唯一记录，而它通常会被删掉以节省磁盘。
+本模块把最终状态记录为相对 case.json 初始 environment 的内容哈希差异：
+- added / modified：记录 sha256 和权限位，内容按哈希去重存入 blob 目录（zlib 压缩）
+- deleted：只记录路径
+- mode_changed：内容未变、仅权限位变化（与 write_environment 的默认权限比较）
+目录本身（空目录、目录权限）不记录。
+需要时可以从 environment + 差异重建最终状态，再对其运行 graders。
+
+用法:
+    python3 state_diff.py capture <case_file> <sandbox_dir> --blobs <dir> [--output diff.json]
+    python3 state_diff.py apply <case_file> <diff.json> <target_dir> --blobs <dir>
+    python3 state_diff.py grade <case_file> <diff.json> --blobs <dir> [--trajectory <phase6_result.json>]
+    python3 state_diff.py show <diff.json>
+
+    <diff.json> 也可以是 phase6_haiku.py --capture-state 生成的 phase6_result.json。
+"""
+import sys
+import os
+import json
+import argparse
+import hashlib
+import shutil
+import stat
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from blob_store import env_digest
+from sandbox import environment_hash, write_environment
+from run_vars import RunVars
+
+
+DIFF_VERSION = 1
+
+
+
+# ============================================================
+# Blob 存储
+# ============================================================
+
+class BlobDir:
+    """按 sha256 寻址的内容目录，相同内容只存一份"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def put(self, data: bytes, digest: Optional[str] = None) -> str:
+        digest = digest or hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=str(path.parent))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(data, 6))
+            os.replace(tmp, path)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        return zlib.decompress(self._path(digest).read_bytes())
+
+    def __contains__(self, digest: str) -> bool:
+        return self._path(digest).exists()
+
+
+# ============================================================
+# 差异计算
+# ============================================================
+
+def default_file_mode() -> int:
+    """
+    write_environment 创建普通文件时的默认权限（0o666 & ~umask）
+
+    umask 从 /proc/self/status 读取；os.umask 只能"设置并返回旧值"，在多线程
+    （calibrate / pass_rate 的并发运行）中临时改动会影响其它线程创建的文件。
+    没有 /proc 时从新建的临时文件的权限推算。
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return 0o666 & ~int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    with tempfile.TemporaryDirectory() as tmp:
+        probe = Path(tmp) / 'probe'
+        probe.touch()
+        return stat.S_IMODE(probe.stat().st_mode)
+
+
+def _baseline(case_data: dict) -> Dict[str, Dict[str, Any]]:
+    """初始 environment：path -> {sha, mode}"""
+    file_mode = default_file_mode()
+    baseline = {}
+    for file_info in case_data.get('environment', []):
+        path = file_info.get('path', '')
+        if not path:
+            continue
+        baseline[os.path.normpath(path)] = {
+            'sha': env_digest(file_info),
+            'mode': 0o755 if file_info.get('executable', False) else file_mode
+        }
+    return baseline
+
+
+def _scan(sandbox_dir: Path):
+    """遍历沙箱，产出 (相对路径, 绝对路径, lstat)"""
+    for root, dirs, files in os.walk(sandbox_dir):
+        dirs.sort()
+        for name in sorted(files) + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            full_path = os.path.join(root, name)
+            yield os.path.relpath(full_path, sandbox_dir), full_path, os.lstat(full_path)
+
+
+def capture_state_diff(case_data: dict, sandbox_dir: Path, blobs: BlobDir) -> Dict[str, Any]:
+    """
+    计算沙箱相对初始 environment 的差异
+
+    Args:
+        case_data: 测试用例数据
+        sandbox_dir: 运行结束后的沙箱目录
+        blobs: 存放新增 / 修改文件内容的 blob 目录
+
+    Returns:
+        差异字典（可直接 json.dump）
+    """
+    baseline = _baseline(case_data)
+    diff = {
+        'version': DIFF_VERSION,
+        'base': environment_hash(case_data),
+        'added': {},
+        'modified': {},
+        'deleted': [],
+        'mode_changed': {}
+    }
+    seen = set()
+
+    for rel_path, full_path, st in _scan(Path(sandbox_dir)):
+        seen.add(rel_path)
+        mode = stat.S_IMODE(st.st_mode)
+
+        if stat.S_ISLNK(st.st_mode):
+            entry = {'symlink': os.readlink(full_path)}
+            if rel_path in baseline:
+                diff['modified'][rel_path] = entry
+            else:
+                diff['added'][rel_path] = entry
+            continue
+
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        base = baseline.get(rel_path)
+
+        if base is None:
+            diff['added'][rel_path] = {'sha': blobs.put(data, digest), 'mode': mode}
+        elif base['sha'] != digest:
+            diff['modified'][rel_path] = {'sha': blobs.put(data, digest), 'mode': mode}
+        elif mode != base['mode']:
+            diff['mode_changed'][rel_path] = mode
+
+    diff['deleted'] = sorted(p for p in baseline if p not in seen)
+    return diff
+
+
+def apply_state_diff(case_data: dict, diff: Dict[str, Any], blobs: BlobDir, target_dir: Path) -> None:
+    """
+    从初始 environment + 差异重建最终状态
+
+    Args:
+        case_data: 测试用例数据
+        diff: capture_state_diff() 的结果
+        blobs: blob 目录
+        target_dir: 重建目录（会被清空）
+    """
+    if diff.get('base') != environment_hash(case_data):
+        raise ValueError("state diff was captured against a different environment")
+
+    if target_dir.exists():
+        shutil.rmtree(target_dir)
+    target_dir.mkdir(parents=True)
+    write_environment(case_data, target_dir)
+
+    for rel_path in diff.get('deleted', []):
+        full_path = target_dir / rel_path
+        if full_path.is_symlink() or full_path.exists():
+            full_path.unlink()
+
+    for section in ('added', 'modified'):
+        for rel_path, entry in diff.get(section, {}).items():
+            full_path = target_dir / rel_path
+            full_path.parent.mkdir(parents=True, exist_ok=True)
+            if full_path.is_symlink() or full_path.exists():
+                full_path.unlink()
+            if 'symlink' in entry:
+                os.symlink(entry['symlink'], full_path)
+                continue
+            full_path.write_bytes(blobs.get(entry['sha']))
+            os.chmod(full_path, entry['mode'])
+
+    for rel_path, mode in diff.get('mode_changed', {}).items():
+        os.chmod(target_dir / rel_path, mode)
+
+
+def summarize(diff: Dict[str, Any]) -> Dict[str, int]:
+    return {
+        'added': len(diff.get('added', {})),
+        'modified': len(diff.get('modified', {})),
+        'deleted': len(diff.get('deleted', [])),
+        'mode_changed': len(diff.get('mode_changed', {}))
+    }
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def _load_json(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _load_diff(path: str) -> Dict[str, Any]:
+    """读取差异文件，也接受带 final_state 字段的 phase6_result.json"""
+    data = _load_json(path)
+    return data.get('final_state', data)
+
+
+def _load_case(case_file: str, diff_file: str) -> dict:
+    """读取 case；差异来自 phase6_result.json 时代入该次运行的占位符取值（见 run_vars.py）"""
+    case_data = _load_json(case_file)
+    run_vars = _load_json(diff_file).get('run_vars')
+    return RunVars(run_vars).render(case_data) if run_vars else case_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='沙箱最终状态差异')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_capture = sub.add_parser('capture', help='记录沙箱相对 environment 的差异')
+    p_capture.add_argument('case_file')
+    p_capture.add_argument('sandbox_dir')
+    p_capture.add_argument('--blobs', required=True, help='blob 目录')
+    p_capture.add_argument('--output', help='差异文件（默认打印）')
+
+    p_apply = sub.add_parser('apply', help='从差异重建最终状态')
+    p_apply.add_argument('case_file')
+    p_apply.add_argument('diff_file')
+    p_apply.add_argument('target_dir')
+    p_apply.add_argument('--blobs', required=True, help='blob 目录')
+
+    p_grade = sub.add_parser('grade', help='重建最终状态并运行 graders')
+    p_grade.add_argument('case_file')
+    p_grade.add_argument('diff_file')
+    p_grade.add_argument('--blobs', required=True, help='blob 目录')
+    p_grade.add_argument('--trajectory', help='phase6_result.json（提供轨迹给 tool_used 等 check）')
+
+    p_show = sub.add_parser('show', help='显示差异摘要')
+    p_show.add_argument('diff_file')
+
+    args = parser.parse_args()
+
+    if args.command == 'capture':
+        diff = capture_state_diff(_load_json(args.case_file), Path(args.sandbox_dir), BlobDir(Path(args.blobs)))
+        text = json.dumps(diff, ensure_ascii=False, separators=(',', ':'))
+        if args.output:
+            Path(args.output).write_text(text, encoding='utf-8')
+            print(f"Captured {summarize(diff)} -> {args.output} ({len(text)} bytes)")
+        else:
+            print(text)
+
+    elif args.command == 'apply':
+        apply_state_diff(_load_case(args.case_file, args.diff_file), _load_diff(args.diff_file),
+                         BlobDir(Path(args.blobs)), Path(args.target_dir))
+        print(f"Reconstructed state in {args.target_dir}")
+
+    elif args.command == 'grade':
+        from grading import verify_graders
+
+        case_data = _load_case(args.case_file, args.diff_file)
+        trajectory: List[Dict] = []
+        if args.trajectory:
+            trajectory = _load_json(args.trajectory).get('haiku_execution', {}).get('trajectory', [])
+
+        with tempfile.TemporaryDirectory(prefix='state_grade_') as tmp:
+            target_dir = Path(tmp) / 'sandbox'
+            apply_state_diff(case_data, _load_diff(args.diff_file), BlobDir(Path(args.blobs)), target_dir)
+            result = verify_graders(case_data, target_dir, trajectory)
+
+        for check_result in result.results:
+            status = "✓" if check_result.passed else "✗"
+            print(f"  {status} [{check_result.check_type}] {check_result.message}")
+        print(f"\n{'✓ PASSED' if result.passed else '✗ FAILED'}  Checks: {result.passed_checks}/{result.total_checks}")
+        sys.exit(0 if result.passed else 1)
+
+    elif args.command == 'show':
+        diff = _load_diff(args.diff_file)
+        print(f"Base environment: {diff.get('base', '')[:12]}")
+        for section, label in (('added', 'A'), ('modified', 'M'), ('mode_changed', 'X')):
+            for rel_path in diff.get(section, {}):
+                print(f"  {label} {rel_path}")
+        for rel_path in diff.get('deleted', []):
+            print(f"  D {rel_path}")
+        print(f"\n{summarize(diff)}")
+
+
+if __name__ == '__main__':
+    main()
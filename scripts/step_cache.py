@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+reference_solution 的逐步检查点
+
+出题时常常只改 11 步里的第 9 步，phase4 却要重建沙箱、重跑 init_commands 和全部步骤。
+本模块在每一步执行后保存沙箱快照，键为"环境 + init_commands + 前 i 步"的链式哈希：
+
+    key[0] = sha256(environment_hash, init_commands)
+    key[i] = sha256(key[i-1], reference_solution[i-1])
+
+修改过的 case 从最长的未变前缀恢复，只重跑改动之后的步骤。
+
+不能快照的状态（进程）决定了可缓存的范围：
+- init_commands 启动后台进程（&、nohup、setsid）时整个 case 不使用检查点
+- 遇到后台 Bash、启动进程的 Bash 或 KillShell 时，只缓存到该步之前
+- 本次执行中出现失败步骤后不再保存（避免把偶发失败固化进缓存）
+
+只读步骤（Read / Grep / Glob / WebFetch / web_search）不复制目录，
+检查点引用上一个快照的文件树。
+
+存储位置默认 ~/.cache/agent-testcase/steps，可用环境变量 CASE_STEP_CACHE 或 --cache-dir 指定。
+
+使用方式:
+    from step_cache import CheckpointStore
+    session = CheckpointStore().session(case_data)
+    done = session.restore(work_dir)          # 已完成步骤的轨迹；None 表示需要从头构建
+    ...
+    session.save(trajectory, work_dir)
+
+命令行:
+    python3 step_cache.py stats [--cache-dir <dir>]
+    python3 step_cache.py prune [--max-age-days 7] [--cache-dir <dir>]
+    python3 step_cache.py clear [--cache-dir <dir>]
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sandbox import SPAWNS_PROCESS, environment_hash, init_spawns_processes
+
+
+DEFAULT_CACHE = Path.home() / '.cache' / 'agent-testcase' / 'steps'
+READ_ONLY_TOOLS = {'Read', 'Grep', 'Glob', 'WebFetch', 'web_search'}
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _step_touches_processes(action: dict) -> bool:
+    tool = action.get('tool', '')
+    input_data = action.get('input', {})
+    if tool == 'KillShell':
+        return True
+    if tool == 'Bash':
+        if input_data.get('background') or input_data.get('run_in_background'):
+            return True
+        return bool(SPAWNS_PROCESS.search(input_data.get('command', '')))
+    return False
+
+
+class ReplaySession:
+    """一个 case 的检查点会话"""
+
+    def __init__(self, store: 'CheckpointStore', case_data: dict):
+        self.store = store
+        init_commands = case_data.get('init_commands', [])
+        reference_solution = case_data.get('reference_solution', [])
+
+        key = _digest(environment_hash(case_data), json.dumps(init_commands, sort_keys=True, ensure_ascii=False))
+        self.keys = [key]
+        for action in reference_solution:
+            key = _digest(key, json.dumps(action, sort_keys=True, ensure_ascii=False))
+            self.keys.append(key)
+
+        # 可保存 / 恢复的最大已完成步数
+        if init_spawns_processes(case_data):
+            self.limit = -1
+        else:
+            self.limit = next((i for i, action in enumerate(reference_solution)
+                               if _step_touches_processes(action)), len(reference_solution))
+        self.resumed_steps = 0
+        self.saved = 0
+
+    def restore(self, work_dir: Path) -> Optional[List[Dict]]:
+        """
+        从最长的已缓存前缀恢复沙箱
+
+        Returns:
+            已完成步骤的轨迹（可能为空列表：只恢复了 init_commands 之后的状态）；
+            None 表示没有可用检查点，work_dir 未被改动，调用方需自行构建沙箱
+        """
+        for done in range(self.limit, -1, -1):
+            meta = self.store.load(self.keys[done])
+            if meta is None:
+                continue
+            tree = self.store.tree_path(meta['tree'])
+            if not tree.is_dir():
+                continue
+            if work_dir.exists():
+                shutil.rmtree(work_dir)
+            shutil.copytree(tree, work_dir, symlinks=True)
+            self.resumed_steps = done
+            self.store.touch(self.keys[done])
+            return meta['trajectory']
+        return None
+
+    def save(self, trajectory: List[Dict], work_dir: Path) -> None:
+        """在完成 len(trajectory) 步后保存检查点（已存在、超出范围或有失败步骤时跳过）"""
+        done = len(trajectory)
+        if done > self.limit or any(not step.get('success') for step in trajectory):
+            return
+        key = self.keys[done]
+        if self.store.load(key) is not None:
+            return
+        tree_key = key
+        if done > 0 and trajectory[-1].get('tool') in READ_ONLY_TOOLS:
+            previous = self.store.load(self.keys[done - 1])
+            if previous is not None:
+                tree_key = previous['tree']
+        self.store.write(key, {'steps': done, 'tree': tree_key, 'trajectory': trajectory},
+                         work_dir if tree_key == key else None)
+        self.saved += 1
+
+
+class CheckpointStore:
+    """检查点目录：<root>/<key>/meta.json 和可选的 <root>/<key>/tree/"""
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or os.environ.get('CASE_STEP_CACHE') or DEFAULT_CACHE)
+
+    def session(self, case_data: dict) -> ReplaySession:
+        return ReplaySession(self, case_data)
+
+    def tree_path(self, key: str) -> Path:
+        return self.root / key / 'tree'
+
+    def load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self.root / key / 'meta.json', 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def touch(self, key: str) -> None:
+        try:
+            os.utime(self.root / key / 'meta.json')
+        except OSError:
+            pass
+
+    def write(self, key: str, meta: dict, work_dir: Optional[Path]) -> None:
+        """先写临时目录再 rename，并发或中断时不会留下半个检查点"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix='.tmp_', dir=str(self.root)))
+        try:
+            if work_dir is not None:
+                shutil.copytree(work_dir, tmp / 'tree', symlinks=True)
+            with open(tmp / 'meta.json', 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.rename(tmp, self.root / key)
+        except OSError:
+            # 目标已存在（并发写入）或磁盘问题：放弃本次保存
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def entries(self) -> List[Path]:
+        if not self.root.is_dir():
+            return []
+        return [p for p in self.root.iterdir() if p.is_dir() and not p.name.startswith('.tmp_')]
+
+    def prune(self, max_age_days: float) -> int:
+        """删除超过 max_age_days 未使用的检查点（仍被引用的文件树保留）"""
+        cutoff = time.time() - max_age_days * 86400
+        entries = self.entries()
+        stale = set()
+        for entry in entries:
+            try:
+                if (entry / 'meta.json').stat().st_mtime < cutoff:
+                    stale.add(entry.name)
+            except OSError:
+                stale.add(entry.name)
+        referenced = {(self.load(e.name) or {}).get('tree') for e in entries if e.name not in stale}
+        removed = 0
+        for name in stale:
+            if name in referenced:
+                continue
+            shutil.rmtree(self.root / name, ignore_errors=True)
+            removed += 1
+        return removed
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='reference_solution 逐步检查点')
+    parser.add_argument('command', choices=['stats', 'prune', 'clear'])
+    parser.add_argument('--cache-dir', help='检查点目录（默认: $CASE_STEP_CACHE 或 ~/.cache/agent-testcase/steps）')
+    parser.add_argument('--max-age-days', type=float, default=7, help='prune：删除超过该天数未使用的检查点（默认: 7）')
+
+    args = parser.parse_args()
+    store = CheckpointStore(args.cache_dir)
+
+    if args.command == 'stats':
+        entries = store.entries()
+        trees = [e for e in entries if (e / 'tree').is_dir()]
+        size = sum(_dir_size(e) for e in entries)
+        print(f"Cache: {store.root}")
+        print(f"  {len(entries)} checkpoints, {len(trees)} with file trees, {size / 1024 / 1024:.1f} MB")
+    elif args.command == 'prune':
+        print(f"Removed {store.prune(args.max_age_days)} checkpoints")
+    else:
+        if store.root.exists():
+            shutil.rmtree(store.root)
+        print(f"Cleared {store.root}")
+
+
+if __name__ == '__main__':
+    main()
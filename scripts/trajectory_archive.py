@@ -0,0 +1,688 @@
+#!/usr/bin/env python3
+"""
+列式二进制轨迹归档（.ctraj）
+
+phase*_result.json 里的轨迹是 dict 列表，每一步重复 step / tool / input / output 键，
+几千万步的 rollout 归档重新加载要很久。本模块把大量轨迹按列存进一个文件：
+
+- tool 名字典编码（工具种类不超过 256 时每步 1 字节）
+- 每条轨迹的起止步号、每步的 step 编号是定长数组
+- input（紧凑 JSON）、output、其余字段（reasoning / success 等，JSON）和每条轨迹的元数据
+  是变长 blob 列：偏移数组（长度前缀和）+ 数据区；可选按固定大小的块 zlib 压缩
+- 所有数组 8 字节对齐，读取时 mmap 整个文件，数组直接 memoryview 转型，不复制
+
+按 tool 过滤、统计只扫描 1 字节的 tool 列，不解码任何 JSON。读回的轨迹与写入的
+dict 相等（键顺序为 step / tool / input / output 在前）。
+
+文件布局:
+    MAGIC | 各列数据（8 字节对齐）| footer JSON | footer 长度 (uint64) | MAGIC
+
+使用方式:
+    from trajectory_archive import ArchiveWriter, TrajectoryArchive
+    with ArchiveWriter('rollouts.ctraj') as writer:
+        writer.add(trajectory, {'case_id': 'Edit_D4_001', 'model': 'haiku', 'passed': True})
+
+    with TrajectoryArchive('rollouts.ctraj') as archive:
+        len(archive), archive.tool_counts()
+        for i in archive.find(tool='Bash', model='haiku'):
+            trajectory = archive[i]
+
+命令行:
+    python3 trajectory_archive.py pack <result.json | dir | .jsonl | results.db>... -o rollouts.ctraj
+    python3 trajectory_archive.py stats rollouts.ctraj
+    python3 trajectory_archive.py filter rollouts.ctraj [--tool Bash] [--case ID] [--model M] [--passed] [-o out]
+    python3 trajectory_archive.py unpack rollouts.ctraj [-o out.jsonl]
+"""
+import os
+import sys
+import json
+import mmap
+import zlib
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b'CTRAJ\x00\x01\x00'
+VERSION = 1
+DEFAULT_BLOCK_SIZE = 1 << 20
+ABSENT = '__absent__'           # extra 中记录原轨迹缺少的标准字段
+STANDARD_FIELDS = ('step', 'tool', 'input', 'output')
+BLOB_COLUMNS = ('input', 'output', 'extra', 'meta')
+_SPILL = 1 << 16                # 数组列在内存中攒多少项后写入临时文件
+_CHUNK = 1 << 20
+
+for _code, _size in (('B', 1), ('H', 2), ('I', 4), ('Q', 8)):
+    assert array(_code).itemsize == _size
+
+
+# json.dumps 带非默认参数时每次都新建编码器
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def _dumps(value: Any) -> bytes:
+    return _ENCODER.encode(value).encode('utf-8', 'surrogatepass')
+
+
+# ============================================================
+# 写入
+# ============================================================
+
+class _ArrayColumn:
+    """定长数组列：攒满一批写入临时文件"""
+
+    def __init__(self, path: Path, typecode: str):
+        self.path = path
+        self.typecode = typecode
+        self.file = open(path, 'wb')
+        self.buf = array(typecode)
+        self.count = 0
+
+    def extend(self, values: List[int]) -> None:
+        self.buf.extend(values)
+        self.count += len(values)
+        if len(self.buf) >= _SPILL:
+            self.buf.tofile(self.file)
+            self.buf = array(self.typecode)
+
+    def finish(self) -> None:
+        self.buf.tofile(self.file)
+        self.buf = array(self.typecode)
+        self.file.close()
+
+
+class _BlobColumn:
+    """变长 blob 列：偏移数组（未压缩坐标）+ 数据；压缩时按 block_size 切块，另记块偏移"""
+
+    def __init__(self, tmp_dir: Path, name: str, compression: str, block_size: int, level: int):
+        self.name = name
+        self.compressed = compression == 'zlib'
+        self.block_size = block_size
+        self.level = level
+        self.offsets = _ArrayColumn(tmp_dir / f'{name}.offsets', 'Q')
+        self.offsets.extend([0])
+        self.blocks = _ArrayColumn(tmp_dir / f'{name}.blocks', 'Q') if self.compressed else None
+        if self.blocks is not None:
+            self.blocks.extend([0])
+        self.data_path = tmp_dir / f'{name}.data'
+        self.data = open(self.data_path, 'wb')
+        self.pending = bytearray()
+        self.raw_size = 0
+        self.stored_size = 0
+
+    def extend(self, payloads: List[bytes]) -> None:
+        offsets = list(accumulate(map(len, payloads), initial=self.raw_size))[1:]
+        if offsets:
+            self.raw_size = offsets[-1]
+        self.offsets.extend(offsets)
+        joined = b''.join(payloads)
+        if not self.compressed:
+            self.data.write(joined)
+            self.stored_size += len(joined)
+            return
+        self.pending += joined
+        if len(self.pending) >= self.block_size:
+            full = len(self.pending) // self.block_size * self.block_size
+            view = memoryview(self.pending)
+            for start in range(0, full, self.block_size):
+                self._flush_block(view[start:start + self.block_size])
+            view.release()
+            del self.pending[:full]
+
+    def _flush_block(self, raw) -> None:
+        packed = zlib.compress(raw, self.level)
+        self.data.write(packed)
+        self.stored_size += len(packed)
+        self.blocks.extend([self.stored_size])
+
+    def finish(self) -> None:
+        if self.pending:
+            self._flush_block(bytes(self.pending))
+            self.pending = bytearray()
+        self.data.close()
+        self.offsets.finish()
+        if self.blocks is not None:
+            self.blocks.finish()
+
+
+class ArchiveWriter:
+    """
+    流式写入：逐条 add，close 时拼接各列、写 footer
+
+    Args:
+        path: 输出文件
+        compression: 'zlib' 或 'none'
+        block_size: 压缩块大小（未压缩字节数）
+        level: zlib 压缩级别
+    """
+
+    def __init__(self, path, compression: str = 'zlib', block_size: int = DEFAULT_BLOCK_SIZE, level: int = 6):
+        if compression not in ('zlib', 'none'):
+            raise ValueError(f"unknown compression: {compression}")
+        self.path = Path(path)
+        self.compression = compression
+        self.block_size = block_size
+        self._tmp = tempfile.TemporaryDirectory(prefix='ctraj_', dir=str(self.path.parent.resolve()))
+        tmp_dir = Path(self._tmp.name)
+        self._traj_offsets = _ArrayColumn(tmp_dir / 'traj_offsets', 'Q')
+        self._traj_offsets.extend([0])
+        self._step = _ArrayColumn(tmp_dir / 'step', 'I')
+        self._tool = _ArrayColumn(tmp_dir / 'tool', 'I')
+        self._blobs = {name: _BlobColumn(tmp_dir, name, compression, block_size, level) for name in BLOB_COLUMNS}
+        self._tools: Dict[str, int] = {}
+        self._steps = 0
+        self._closed = False
+
+    def add(self, trajectory: List[Dict[str, Any]], meta: Optional[Dict[str, Any]] = None) -> None:
+        """追加一条轨迹（meta 为任意可 JSON 序列化的元数据，如 case_id / model / passed）"""
+        numbers, codes, inputs, outputs, extras = [], [], [], [], []
+        for step in trajectory:
+            extra = {key: value for key, value in step.items() if key not in STANDARD_FIELDS}
+            if len(extra) + 4 != len(step):
+                extra[ABSENT] = [key for key in STANDARD_FIELDS if key not in step]
+
+            # 类型不符合列定义的标准字段放进 extra（读回时覆盖列中的占位值）
+            number = step.get('step', 0)
+            if type(number) is not int or not 0 <= number < 1 << 32:
+                extra['step'] = number
+                number = 0
+            tool = step.get('tool', '')
+            if type(tool) is not str:
+                extra['tool'] = tool
+                tool = ''
+            output = step.get('output', '')
+            if type(output) is not str:
+                extra['output'] = output
+                output = ''
+
+            code = self._tools.get(tool)
+            if code is None:
+                code = self._tools[tool] = len(self._tools)
+            numbers.append(number)
+            codes.append(code)
+            inputs.append(_dumps(step['input']) if 'input' in step else b'')
+            outputs.append(output.encode('utf-8', 'surrogatepass'))
+            extras.append(_dumps(extra) if extra else b'')
+
+        self._step.extend(numbers)
+        self._tool.extend(codes)
+        self._blobs['input'].extend(inputs)
+        self._blobs['output'].extend(outputs)
+        self._blobs['extra'].extend(extras)
+        self._steps += len(numbers)
+        self._traj_offsets.extend([self._steps])
+        self._blobs['meta'].extend([_dumps(meta) if meta else b''])
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._write()
+        finally:
+            self._tmp.cleanup()
+
+    def _write(self) -> None:
+        for column in (self._traj_offsets, self._step, self._tool):
+            column.finish()
+        for blob in self._blobs.values():
+            blob.finish()
+
+        tool_width = 1 if len(self._tools) <= 1 << 8 else 2 if len(self._tools) <= 1 << 16 else 4
+        sections: Dict[str, List[int]] = {}
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'wb') as out:
+            out.write(MAGIC)
+
+            def section(name: str, writer: Callable[[], None]) -> None:
+                out.write(b'\0' * (-out.tell() % 8))
+                start = out.tell()
+                writer()
+                sections[name] = [start, out.tell() - start]
+
+            def copy(path: Path) -> Callable[[], None]:
+                def write():
+                    with open(path, 'rb') as f:
+                        shutil.copyfileobj(f, out, _CHUNK)
+                return write
+
+            def narrow_tools():
+                # 工具码先按 uint32 写入，最后按字典大小收窄
+                with open(self._tool.path, 'rb') as f:
+                    while True:
+                        chunk = f.read(_CHUNK)
+                        if not chunk:
+                            break
+                        codes = array('I')
+                        codes.frombytes(chunk)
+                        array({1: 'B', 2: 'H', 4: 'I'}[tool_width], codes).tofile(out)
+
+            section('traj_offsets', copy(self._traj_offsets.path))
+            section('step', copy(self._step.path))
+            section('tool', narrow_tools)
+            for name, blob in self._blobs.items():
+                section(f'{name}.offsets', copy(blob.offsets.path))
+                if blob.blocks is not None:
+                    section(f'{name}.blocks', copy(blob.blocks.path))
+                section(f'{name}.data', copy(blob.data_path))
+
+            footer = _dumps({
+                'version': VERSION,
+                'byteorder': sys.byteorder,
+                'compression': self.compression,
+                'block_size': self.block_size,
+                'trajectories': self._traj_offsets.count - 1,
+                'steps': self._steps,
+                'tools': list(self._tools),
+                'tool_width': tool_width,
+                'sections': sections,
+                'raw_sizes': {name: blob.raw_size for name, blob in self._blobs.items()},
+            })
+            out.write(footer)
+            out.write(array('Q', [len(footer)]).tobytes())
+            out.write(MAGIC)
+        os.replace(tmp_path, self.path)
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._closed = True
+            self._tmp.cleanup()
+
+
+# ============================================================
+# 读取
+# ============================================================
+
+class _BlobReader:
+    def __init__(self, archive: 'TrajectoryArchive', name: str):
+        self.offsets = archive._array(f'{name}.offsets', 'Q')
+        self.data = archive._view(f'{name}.data')
+        self.blocks = archive._array(f'{name}.blocks', 'Q') if archive.compression == 'zlib' else None
+        self.block_size = archive.footer['block_size']
+        self._cached = (-1, b'')
+
+    def _block(self, index: int) -> bytes:
+        if self._cached[0] != index:
+            self._cached = (index, zlib.decompress(self.data[self.blocks[index]:self.blocks[index + 1]]))
+        return self._cached[1]
+
+    def get(self, index: int):
+        """第 index 项的字节（未压缩时是 mmap 上的 memoryview）"""
+        start, end = self.offsets[index], self.offsets[index + 1]
+        if self.blocks is None:
+            return self.data[start:end]
+        if start == end:
+            return b''
+        size = self.block_size
+        first, last = start // size, (end - 1) // size
+        if first == last:
+            base = first * size
+            return self._block(first)[start - base:end - base]
+        parts = [self._block(b) for b in range(first, last + 1)]
+        return b''.join(parts)[start - first * size:end - first * size]
+
+
+class TrajectoryArchive:
+    """只读打开 .ctraj；定长列是 mmap 上的 memoryview，不复制"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views: List[memoryview] = []
+        size = len(self._mm)
+        if size < 2 * len(MAGIC) + 8 or self._mm[:len(MAGIC)] != MAGIC or self._mm[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not a trajectory archive")
+        footer_len = array('Q', self._mm[-len(MAGIC) - 8:-len(MAGIC)])[0]
+        footer_end = size - len(MAGIC) - 8
+        self.footer = json.loads(self._mm[footer_end - footer_len:footer_end])
+        if self.footer.get('version') != VERSION or self.footer.get('byteorder') != sys.byteorder:
+            self.close()
+            raise ValueError(f"{path}: unsupported archive (version {self.footer.get('version')}, "
+                             f"{self.footer.get('byteorder')}-endian)")
+        self.compression = self.footer['compression']
+        self.tools: List[str] = self.footer['tools']
+        self.traj_offsets = self._array('traj_offsets', 'Q')
+        self.step_numbers = self._array('step', 'I')
+        self.tool_codes = self._array('tool', {1: 'B', 2: 'H', 4: 'I'}[self.footer['tool_width']])
+        self._blobs = {name: _BlobReader(self, name) for name in BLOB_COLUMNS}
+
+    def _view(self, name: str) -> memoryview:
+        start, length = self.footer['sections'][name]
+        view = memoryview(self._mm)[start:start + length]
+        self._views.append(view)
+        return view
+
+    def _array(self, name: str, typecode: str) -> memoryview:
+        view = self._view(name).cast(typecode)
+        self._views.append(view)
+        return view
+
+    def close(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> 'TrajectoryArchive':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ------------------------------------------------------------
+    # 按条读取
+    # ------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self.footer['trajectories']
+
+    def step_range(self, index: int) -> Tuple[int, int]:
+        return self.traj_offsets[index], self.traj_offsets[index + 1]
+
+    def step(self, row: int) -> Dict[str, Any]:
+        """全局第 row 步，还原为轨迹中的 dict"""
+        raw_input = self._blobs['input'].get(row)
+        step = {
+            'step': self.step_numbers[row],
+            'tool': self.tools[self.tool_codes[row]],
+            'input': json.loads(bytes(raw_input)) if len(raw_input) else None,
+            'output': bytes(self._blobs['output'].get(row)).decode('utf-8', 'surrogatepass'),
+        }
+        raw_extra = self._blobs['extra'].get(row)
+        if len(raw_extra):
+            extra = json.loads(bytes(raw_extra))
+            for key in extra.pop(ABSENT, []):
+                del step[key]
+            step.update(extra)
+        return step
+
+    def __getitem__(self, index: int) -> List[Dict[str, Any]]:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = self.step_range(index)
+        return [self.step(row) for row in range(start, end)]
+
+    def meta(self, index: int) -> Dict[str, Any]:
+        raw = self._blobs['meta'].get(index)
+        return json.loads(bytes(raw)) if len(raw) else {}
+
+    def __iter__(self) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        for index in range(len(self)):
+            yield self.meta(index), self[index]
+
+    # ------------------------------------------------------------
+    # 列式查询（不解码 JSON）
+    # ------------------------------------------------------------
+
+    def _tool_column_bytes(self) -> bytes:
+        return self._mm[slice(*_span(self.footer['sections']['tool']))]
+
+    def tool_counts(self) -> Dict[str, int]:
+        if self.footer['tool_width'] == 1:
+            data = self._tool_column_bytes()
+            counts = {name: data.count(bytes([code])) for code, name in enumerate(self.tools)}
+        else:
+            histogram = Counter(self.tool_codes)
+            counts = {name: histogram.get(code, 0) for code, name in enumerate(self.tools)}
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+    def rows_with_tool(self, tool: str) -> List[int]:
+        """使用了 tool 的全部步（全局行号）"""
+        if tool not in self.tools:
+            return []
+        code = self.tools.index(tool)
+        if self.footer['tool_width'] == 1:
+            data, needle, rows, pos = self._tool_column_bytes(), bytes([code]), [], -1
+            while True:
+                pos = data.find(needle, pos + 1)
+                if pos < 0:
+                    return rows
+                rows.append(pos)
+        return [row for row, value in enumerate(self.tool_codes) if value == code]
+
+    def trajectories_with_tool(self, tool: str) -> List[int]:
+        """至少使用过一次 tool 的轨迹下标；命中后直接跳到该轨迹末尾继续查找"""
+        if tool not in self.tools:
+            return []
+        code = self.tools.index(tool)
+        found: List[int] = []
+        if self.footer['tool_width'] == 1:
+            data, needle = self._tool_column_bytes(), bytes([code])
+            pos = data.find(needle)
+            while pos >= 0:
+                index = bisect_right(self.traj_offsets, pos) - 1
+                found.append(index)
+                pos = data.find(needle, self.traj_offsets[index + 1])
+            return found
+        for index in range(len(self)):
+            start, end = self.step_range(index)
+            if code in self.tool_codes[start:end].tolist():
+                found.append(index)
+        return found
+
+    def find(self, tool: Optional[str] = None, where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+             **meta_equals) -> List[int]:
+        """
+        满足条件的轨迹下标
+
+        Args:
+            tool: 至少使用过一次该工具（只扫描 tool 列）
+            where: 对元数据的任意谓词
+            meta_equals: 元数据字段等值条件（如 model='haiku', passed=True）
+        """
+        candidates = self.trajectories_with_tool(tool) if tool is not None else range(len(self))
+        if not where and not meta_equals:
+            return list(candidates)
+        matched = []
+        for index in candidates:
+            meta = self.meta(index)
+            if all(meta.get(key) == value for key, value in meta_equals.items()) and (where is None or where(meta)):
+                matched.append(index)
+        return matched
+
+    def stats(self) -> Dict[str, Any]:
+        sections = self.footer['sections']
+        columns = {}
+        for name in BLOB_COLUMNS:
+            stored = sum(sections[key][1] for key in (f'{name}.offsets', f'{name}.blocks', f'{name}.data')
+                         if key in sections)
+            columns[name] = {'raw_bytes': self.footer['raw_sizes'][name], 'stored_bytes': stored}
+        for name in ('traj_offsets', 'step', 'tool'):
+            columns[name] = {'stored_bytes': sections[name][1]}
+        return {
+            'trajectories': len(self),
+            'steps': self.footer['steps'],
+            'compression': self.compression,
+            'file_bytes': len(self._mm),
+            'tools': self.tool_counts(),
+            'columns': columns,
+        }
+
+
+def _span(section: List[int]) -> Tuple[int, int]:
+    return section[0], section[0] + section[1]
+
+
+# ============================================================
+# 输入源
+# ============================================================
+
+def _result_record(data: Dict[str, Any], source: str) -> Optional[Tuple[List[Dict], Dict[str, Any]]]:
+    """phase4 / phase6 结果 → (轨迹, 元数据)"""
+    if data.get('phase') == 4:
+        trajectory = data.get('execution_trajectory', [])
+        passed = data.get('passed')
+    elif data.get('phase') == 6:
+        trajectory = data.get('haiku_execution', {}).get('trajectory', [])
+        passed = data.get('haiku_evaluation', {}).get('passed')
+    else:
+        return None
+    meta = {'case_id': data.get('case_id'), 'phase': data['phase'], 'model': data.get('model'),
+            'passed': passed, 'timestamp': data.get('timestamp'), 'source': source}
+    for key in ('run_index', 'run_vars'):
+        if key in data:
+            meta[key] = data[key]
+    return trajectory, {key: value for key, value in meta.items() if value is not None}
+
+
+def iter_source(path: Path) -> Iterator[Tuple[List[Dict], Dict[str, Any]]]:
+    """
+    读取轨迹来源
+
+    - phase*_result.json，或包含它们的目录（递归）
+    - .jsonl：每行 {"trajectory": [...], "meta": {...}}、phase 结果或裸轨迹列表
+    - .db：results_store 结果库（每次运行一条）
+    """
+    if path.is_dir():
+        for result_file in sorted(path.rglob('phase[46]_result.json')):
+            yield from iter_source(result_file)
+        return
+    if path.suffix == '.db':
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            runs = conn.execute("SELECT run_id, case_id, phase, model, passed, timestamp FROM runs ORDER BY rowid")
+            for run_id, case_id, phase, model, passed, timestamp in runs.fetchall():
+                trajectory = [
+                    {'step': r[0], 'tool': r[1], 'input': json.loads(r[2]), 'output': r[3]}
+                    for r in conn.execute("SELECT step, tool, input, output FROM tool_calls "
+                                          "WHERE run_id = ? ORDER BY step", (run_id,))
+                ]
+                meta = {'case_id': case_id, 'phase': phase, 'model': model,
+                        'passed': None if passed is None else bool(passed), 'timestamp': timestamp,
+                        'run_id': run_id}
+                yield trajectory, {key: value for key, value in meta.items() if value is not None}
+        finally:
+            conn.close()
+        return
+    if path.suffix == '.jsonl':
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if isinstance(record, list):
+                    yield record, {'source': f"{path}:{line_no}"}
+                elif 'trajectory' in record:
+                    yield record['trajectory'], record.get('meta') or {}
+                else:
+                    parsed = _result_record(record, f"{path}:{line_no}")
+                    if parsed is not None:
+                        yield parsed
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        parsed = _result_record(json.load(f), str(path))
+    if parsed is None:
+        print(f"Warning: {path}: not a phase 4 / 6 result", file=sys.stderr)
+    else:
+        yield parsed
+
+
+# ============================================================
+# 主函数
+# ============================================================
+
+def _print_stats(stats: Dict[str, Any]) -> None:
+    print(f"Trajectories: {stats['trajectories']}, steps: {stats['steps']}, "
+          f"compression: {stats['compression']}, file: {stats['file_bytes'] / 1e6:.1f} MB")
+    print(f"\n  {'column':<14}{'raw MB':>10}{'stored MB':>12}")
+    for name, column in stats['columns'].items():
+        raw = f"{column['raw_bytes'] / 1e6:.2f}" if 'raw_bytes' in column else '-'
+        print(f"  {name:<14}{raw:>10}{column['stored_bytes'] / 1e6:>12.2f}")
+    print(f"\n  {'tool':<28}{'steps':>10}")
+    for tool, count in stats['tools'].items():
+        print(f"  {tool:<28}{count:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列式二进制轨迹归档')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_pack = sub.add_parser('pack', help='把结果文件 / 目录 / JSONL / 结果库打包为 .ctraj')
+    p_pack.add_argument('inputs', nargs='+', help='phase*_result.json、目录、.jsonl 或 results_store 的 .db')
+    p_pack.add_argument('-o', '--output', required=True, help='输出 .ctraj 文件')
+    p_pack.add_argument('--compression', choices=['zlib', 'none'], default='zlib', help='blob 列压缩（默认: zlib）')
+    p_pack.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE, help='压缩块大小（字节）')
+
+    p_stats = sub.add_parser('stats', help='条数、各列大小、工具分布')
+    p_stats.add_argument('archive')
+
+    p_filter = sub.add_parser('filter', help='按工具 / 元数据过滤')
+    p_filter.add_argument('archive')
+    p_filter.add_argument('--tool', help='至少使用过一次该工具')
+    p_filter.add_argument('--case', help='case_id')
+    p_filter.add_argument('--model', help='模型')
+    p_filter.add_argument('--phase', type=int, help='phase')
+    p_filter.add_argument('--passed', action='store_true', help='只保留通过的')
+    p_filter.add_argument('--failed', action='store_true', help='只保留未通过的')
+    p_filter.add_argument('-o', '--output', help='写出匹配的轨迹（.ctraj 或 .jsonl；默认只打印下标和元数据）')
+
+    p_unpack = sub.add_parser('unpack', help='还原为 JSONL（每行 {"meta", "trajectory"}）')
+    p_unpack.add_argument('archive')
+    p_unpack.add_argument('-o', '--output', help='输出文件（默认打印）')
+
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        count = 0
+        with ArchiveWriter(args.output, args.compression, args.block_size) as writer:
+            for item in args.inputs:
+                for trajectory, meta in iter_source(Path(item)):
+                    writer.add(trajectory, meta)
+                    count += 1
+        with TrajectoryArchive(args.output) as archive:
+            stats = archive.stats()
+        print(f"Packed {count} trajectories ({stats['steps']} steps) -> {args.output} "
+              f"({stats['file_bytes'] / 1e6:.1f} MB)")
+
+    elif args.command == 'stats':
+        with TrajectoryArchive(args.archive) as archive:
+            _print_stats(archive.stats())
+
+    elif args.command == 'filter':
+        meta_equals = {key: value for key, value in
+                       (('case_id', args.case), ('model', args.model), ('phase', args.phase)) if value is not None}
+        if args.passed or args.failed:
+            meta_equals['passed'] = bool(args.passed)
+        with TrajectoryArchive(args.archive) as archive:
+            matched = archive.find(tool=args.tool, **meta_equals)
+            if args.output and args.output.endswith('.jsonl'):
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    for index in matched:
+                        f.write(json.dumps({'meta': archive.meta(index), 'trajectory': archive[index]},
+                                           ensure_ascii=False) + '\n')
+            elif args.output:
+                with ArchiveWriter(args.output, archive.compression, archive.footer['block_size']) as writer:
+                    for index in matched:
+                        writer.add(archive[index], archive.meta(index))
+            else:
+                for index in matched:
+                    print(f"  {index:>8}  {json.dumps(archive.meta(index), ensure_ascii=False)}")
+            print(f"{len(matched)}/{len(archive)} trajectories matched", file=sys.stderr)
+
+    elif args.command == 'unpack':
+        out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            with TrajectoryArchive(args.archive) as archive:
+                for meta, trajectory in archive:
+                    out.write(json.dumps({'meta': meta, 'trajectory': trajectory}, ensure_ascii=False) + '\n')
+        finally:
+            if args.output:
+                out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+常驻验证服务（Unix socket）
+
+出题 Agent 每改一版 case 就要跑一次 phase4_verify.py，每次都要付出解释器启动、
+import 和沙箱构建的开销。本服务常驻内存，保持以下状态常热：
+- CHECK_REGISTRY 及所有 phase 模块（只 import 一次）
+- 解析过的 case（按路径 + mtime 缓存，附带未知 check 类型等预检信息）
+- environment 模板目录（按 environment 内容哈希缓存，新任务直接复制）
+- 工作线程池
+
+用法:
+    python3 verify_daemon.py serve [--socket <path>] [--workers 4]
+    python3 verify_daemon.py verify <case_file> [--keep-env] [--no-json] [--json]
+    python3 verify_daemon.py quality <case_file> [--json]
+    python3 verify_daemon.py ping|stats|shutdown
+
+协议（每行一个 JSON，便于 socat / nc 等非 Python 客户端直接调用）:
+    请求: {"cmd": "verify", "case_file": "/abs/case.json", "keep_env": false, "write_json": true}
+    响应: 若干 {"event": "step"|"check"|"tool_call", ...}，最后一条为 {"event": "result", ...}
+          或 {"event": "error", "message": ...}
+
+socket 路径默认取环境变量 VERIFY_DAEMON_SOCKET，否则为 /tmp/agent-testcase-verify-<uid>.sock。
+"""
+import sys
+import os
+import json
+import argparse
+import socket
+from typing import Dict
+
+
+def default_socket_path() -> str:
+    return os.environ.get('VERIFY_DAEMON_SOCKET', f"/tmp/agent-testcase-verify-{os.getuid()}.sock")
+
+
+# ============================================================
+# 服务端
+# ============================================================
+
+def serve(socket_path: str, workers: int, max_templates: int) -> None:
+    """启动常驻服务（阻塞）"""
+    # 重量级模块只在服务端 import，客户端保持轻量
+    import queue
+    import shutil
+    import socketserver
+    import tempfile
+    import threading
+    import time
+    from collections import OrderedDict
+    from contextlib import contextmanager
+    from concurrent.futures import ThreadPoolExecutor
+    from pathlib import Path
+
+    script_dir = Path(__file__).parent
+    sys.path.insert(0, str(script_dir))
+
+    from custom_checks import CHECK_REGISTRY
+    from grading import verify_graders
+    from sandbox import environment_hash, apply_run_vars, build_template, clone_template, run_init_commands
+    from run_vars import RunVars
+    import phase4_verify
+    from phase7_quality import QualityAnalyzer
+
+    root_dir = Path(tempfile.mkdtemp(prefix='verify_daemon_'))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='verify')
+    lock = threading.Lock()
+    case_cache: Dict = {}
+    template_cache: 'OrderedDict[str, Path]' = OrderedDict()
+    template_locks: Dict = {}
+    template_users: Dict[str, int] = {}
+    result_issued: Dict[str, int] = {}
+    result_written: Dict[str, int] = {}
+    stats = {'started_at': time.time(), 'jobs': 0, 'case_cache_hits': 0, 'template_cache_hits': 0}
+
+    def load_case(case_file: str) -> dict:
+        """按 (路径, mtime, size) 缓存解析结果和预检信息"""
+        path = Path(case_file).resolve()
+        st = path.stat()
+        key = (st.st_mtime_ns, st.st_size)
+        with lock:
+            cached = case_cache.get(str(path))
+            if cached and cached['key'] == key:
+                stats['case_cache_hits'] += 1
+                return cached
+        case_data = json.loads(path.read_text(encoding='utf-8'))
+        unknown = sorted({
+            check.get('check', '')
+            for grader in case_data.get('graders', []) if grader.get('type') == 'state_check'
+            for check in grader.get('checks', []) if check.get('check', '') not in CHECK_REGISTRY
+        })
+        entry = {
+            'key': key,
+            'path': path,
+            'case_data': case_data,
+            'env_hash': environment_hash(case_data),
+            'unknown_checks': unknown
+        }
+        with lock:
+            case_cache[str(path)] = entry
+        return entry
+
+    def evict_idle_templates() -> None:
+        """按 LRU 淘汰超出上限的模板，跳过正在被复制的（调用方持有 lock）"""
+        for env_hash in list(template_cache):
+            if len(template_cache) <= max_templates:
+                break
+            if not template_users.get(env_hash):
+                shutil.rmtree(template_cache.pop(env_hash), ignore_errors=True)
+
+    @contextmanager
+    def use_template(entry: dict):
+        """取（或构建）environment 模板；with 块内该模板不会被淘汰"""
+        env_hash = entry['env_hash']
+        template_dir = root_dir / 'templates' / env_hash
+        with lock:
+            hit = env_hash in template_cache
+            if hit:
+                template_cache.move_to_end(env_hash)
+                stats['template_cache_hits'] += 1
+            template_users[env_hash] = template_users.get(env_hash, 0) + 1
+            build_lock = template_locks.setdefault(env_hash, threading.Lock())
+        try:
+            if not hit:
+                with build_lock:
+                    with lock:
+                        built = env_hash in template_cache
+                    if not built:
+                        build_template(entry['case_data'], template_dir)
+                        with lock:
+                            template_cache[env_hash] = template_dir
+            yield template_dir
+        finally:
+            with lock:
+                template_users[env_hash] -= 1
+                if not template_users[env_hash]:
+                    del template_users[env_hash]
+                evict_idle_templates()
+
+    def write_result(path: Path, seq: int, output_data: dict) -> None:
+        """同一 case 的并发请求只保留最后发起的那次结果（先写临时文件再替换）"""
+        tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        with lock:
+            if seq > result_written.get(str(path), 0):
+                os.replace(tmp_path, path)
+                result_written[str(path)] = seq
+                return
+        os.unlink(tmp_path)
+
+    def job_verify(request: dict, emit) -> None:
+        start_time = time.perf_counter()
+        entry = load_case(request['case_file'])
+        case_data = entry['case_data']
+        case_id = case_data.get('task', {}).get('id', entry['path'].stem)
+
+        if entry['unknown_checks']:
+            emit({'event': 'warning', 'message': f"unknown check types: {entry['unknown_checks']}"})
+
+        output_path = entry['path'].parent / 'phase4_result.json'
+        with lock:
+            seq = result_issued[str(output_path)] = result_issued.get(str(output_path), 0) + 1
+
+        work_dir = Path(tempfile.mkdtemp(prefix='phase4_', dir=str(root_dir)))
+        run_vars = RunVars.allocate(case_data)
+        try:
+            # 模板按原始 case 构建，按运行占位符在复制后代入
+            with use_template(entry) as template_dir:
+                clone_template(template_dir, work_dir)
+            apply_run_vars(case_data, run_vars, work_dir)
+            case_data = run_vars.render(case_data)
+            run_init_commands(case_data, work_dir)
+
+            trajectory = phase4_verify.execute_reference_solution(work_dir, case_data.get('reference_solution', []))
+            for step in trajectory:
+                emit({'event': 'step', 'step': step['step'], 'tool': step['tool'],
+                      'success': step['success'], 'output': step['output']})
+
+            result = verify_graders(case_data, work_dir, trajectory, on_check=lambda r: emit({
+                'event': 'check', 'check_type': r.check_type, 'passed': r.passed,
+                'message': r.message, 'duration_ms': round(r.duration_ms, 3)
+            }))
+            for tc in result.tool_calls_details:
+                emit({'event': 'tool_call', **tc})
+
+            output_data = phase4_verify.build_output(case_id, trajectory, result, time.perf_counter() - start_time,
+                                                     run_vars.values)
+            if request.get('write_json', True):
+                write_result(output_path, seq, output_data)
+
+            emit({
+                'event': 'result',
+                'passed': result.passed,
+                'passed_checks': result.passed_checks,
+                'total_checks': result.total_checks,
+                'tool_calls_verified': result.tool_calls_verified,
+                'duration_sec': output_data['duration_sec'],
+                'work_dir': str(work_dir) if request.get('keep_env') else None
+            })
+        finally:
+            run_vars.release()
+            if not request.get('keep_env'):
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    def job_quality(request: dict, emit) -> None:
+        entry = load_case(request['case_file'])
+        results = QualityAnalyzer(entry['case_data']).analyze()
+        emit({'event': 'result', 'passed': results['overall']['level'] != 'needs_improvement',
+              'quality_analysis': results})
+
+    jobs = {'verify': job_verify, 'quality': job_quality}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def send(event: dict) -> None:
+                self.wfile.write((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+            line = self.rfile.readline()
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                send({'event': 'error', 'message': f"invalid request: {e}"})
+                return
+
+            cmd = request.get('cmd', '')
+            if cmd == 'ping':
+                send({'event': 'result', 'pong': True})
+                return
+            if cmd == 'stats':
+                with lock:
+                    send({'event': 'result', **stats, 'cached_cases': len(case_cache),
+                          'cached_templates': len(template_cache), 'workers': workers})
+                return
+            if cmd == 'shutdown':
+                send({'event': 'result', 'shutdown': True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            if cmd not in jobs:
+                send({'event': 'error', 'message': f"unknown cmd: {cmd}"})
+                return
+
+            events: 'queue.Queue' = queue.Queue()
+            done = object()
+
+            def run():
+                try:
+                    jobs[cmd](request, events.put)
+                except Exception as e:
+                    events.put({'event': 'error', 'message': f"{type(e).__name__}: {e}"})
+                finally:
+                    events.put(done)
+
+            with lock:
+                stats['jobs'] += 1
+            pool.submit(run)
+            while True:
+                event = events.get()
+                if event is done:
+                    break
+                send(event)
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = Server(socket_path, Handler)
+    os.chmod(socket_path, 0o600)
+    print(f"Verify daemon listening on {socket_path} ({workers} workers, {len(CHECK_REGISTRY)} check types)")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown(wait=False)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        shutil.rmtree(root_dir, ignore_errors=True)
+        print("Verify daemon stopped")
+
+
+# ============================================================
+# 客户端
+# ============================================================
+
+def request(socket_path: str, payload: dict):
+    """发送请求并逐条产出响应事件"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    try:
+        sock.sendall((json.dumps(payload) + '\n').encode('utf-8'))
+        with sock.makefile('r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        sock.close()
+
+
+def _print_event(event: dict) -> None:
+    kind = event.get('event')
+    if kind == 'step':
+        status = "✓" if event['success'] else "✗"
+        print(f"  {status} Step {event['step']}: {event['tool']} - {(event.get('output') or '')[:60]}")
+    elif kind == 'check':
+        status = "✓" if event['passed'] else "✗"
+        print(f"  {status} [{event['check_type']}] {event['message']}")
+    elif kind == 'tool_call':
+        status = "✓" if event.get('verified') else "✗"
+        print(f"  {status} {event.get('tool')}: {event.get('description')}")
+    elif kind in ('warning', 'error'):
+        print(f"  {kind.capitalize()}: {event.get('message')}")
+    elif kind == 'result':
+        if 'quality_analysis' in event:
+            overall = event['quality_analysis']['overall']
+            print(f"总体评分: {overall['score']}/100 ({overall['level'].upper()})")
+            print(f"改进建议: {overall['recommendation']}")
+        elif 'total_checks' in event:
+            print(f"{'✓ Phase 4 PASSED' if event['passed'] else '✗ Phase 4 FAILED'}"
+                  f"  Checks: {event['passed_checks']}/{event['total_checks']}"
+                  f"  ({event['duration_sec']:.3f}s)")
+            if event.get('work_dir'):
+                print(f"  Work directory kept: {event['work_dir']}")
+        else:
+            print(json.dumps(event, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='常驻验证服务')
+    parser.add_argument('command', choices=['serve', 'verify', 'quality', 'ping', 'stats', 'shutdown'])
+    parser.add_argument('case_file', nargs='?', help='测试用例 JSON 文件（verify / quality）')
+    parser.add_argument('--socket', default=default_socket_path(), help='Unix socket 路径')
+    parser.add_argument('--workers', type=int, default=4, help='工作线程数（serve，默认: 4）')
+    parser.add_argument('--max-templates', type=int, default=64, help='缓存的 environment 模板数（serve）')
+    parser.add_argument('--keep-env', action='store_true', help='保留工作环境（verify）')
+    parser.add_argument('--no-json', action='store_true', help='不写 phase4_result.json（verify）')
+    parser.add_argument('--json', action='store_true', help='直接输出原始事件 JSON')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.socket, args.workers, args.max_templates)
+        return
+
+    payload = {'cmd': args.command}
+    if args.command in ('verify', 'quality'):
+        if not args.case_file:
+            print(f"Error: {args.command} requires a case_file")
+            sys.exit(1)
+        payload['case_file'] = os.path.abspath(args.case_file)
+        payload['keep_env'] = args.keep_env
+        payload['write_json'] = not args.no_json
+
+    passed = True
+    try:
+        for event in request(args.socket, payload):
+            if args.json:
+                print(json.dumps(event, ensure_ascii=False))
+            else:
+                _print_event(event)
+            if event.get('event') == 'error' or event.get('passed') is False:
+                passed = False
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"Error: daemon not running on {args.socket} (start with: verify_daemon.py serve)")
+        sys.exit(2)
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()